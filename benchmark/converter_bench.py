@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+'''
+#
+# Benchmark of the converters on synthetic inputs (see goa_synth.py)
+#
+# The converter modules are copied to <workdir>/code so that the
+# synthetic reference files (<workdir>/code/data) and the logs never
+# touch the real data/ and log/ directories. Every stage runs in its own
+# python process so that the peak RSS of each stage is measured alone:
+#   gaf2gpad         -> goa_parser.generateGpiGpad
+#   gaf2gpad-columnar -> goa_parser.generateGpiGpad (columnar engine)
+#   gpad2gaf         -> goa_parser.generateGaf
+#   gpad2gaf-stream  -> goa_parser.generateGaf (streaming merge join)
+#   gpi-mgi          -> goa_parser.generateGPI_mgi
+#
+# For every stage and row count the benchmark reports the rows/sec of
+# the conversion, the peak RSS and the time spent in each step (input
+# generation, converter_init, conversion), and saves them as JSON.
+# Use --compare to compare the results with a JSON file saved from
+# another commit.
+#
+# Usage: python benchmark/converter_bench.py [--rows=10000,100000] [--stages=all]
+#        [--version=2.0] [--workers=N] [--seed=N] [--dup-ratio=R] [--isoform-ratio=R]
+#        [--bad-ratio=R] [--workdir=dir] [--output=results.json] [--compare=old.json]
+#
+'''
+
+import getopt,sys,os
+import glob,shutil,tempfile
+import subprocess,platform,resource
+import json,timeit,traceback
+from datetime import datetime
+BENCH_DIR=os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,BENCH_DIR)
+import goa_synth
+
+REPO_DIR=os.path.dirname(BENCH_DIR)
+STAGES=["gaf2gpad","gaf2gpad-columnar","gpad2gaf","gpad2gaf-stream","gpi-mgi"]
+
+def inputFiles(workdir,rows):
+    base=os.path.join(workdir,"synth_%d"%(rows))
+    return {"gaf":base+".gaf","gpad":base+".gpad","gpi":base+".gpi"}
+
+#
+# Runs one stage in the current process (child side)
+# Writes a JSON result to result_file
+#
+def runStage(stage,workdir,rows,version,workers,result_file):
+    result={"stage":stage,"rows":rows,"steps":{}}
+    steps=result["steps"]
+    code_dir=os.path.join(workdir,"code")
+    sys.path.insert(0,code_dir)
+    files=inputFiles(workdir,rows)
+    log=open(os.path.join(workdir,"%s_%d.log"%(stage,rows)),"w")
+    try:
+        start=timeit.default_timer()
+        import goa_parser
+        goa_parser.converter_init(log,"summary",True)
+        steps["init"]=timeit.default_timer()-start
+        convert_start=timeit.default_timer()
+        if stage in ("gaf2gpad","gaf2gpad-columnar"):
+            engine="row"
+            if stage == "gaf2gpad-columnar": engine="columnar"
+            goa_parser.generateGpiGpad(files["gaf"],files["gaf"]+".gpad",files["gaf"]+".gpi",log,False,workers,
+                                       engine=engine)
+        elif stage in ("gpad2gaf","gpad2gaf-stream"):
+            goa_parser.generateGaf(files["gpad"]+".gaf",files["gpad"],files["gpi"],log,version,
+                                   stage == "gpad2gaf-stream",workdir)
+        elif stage == "gpi-mgi":
+            #proteins of every 10th marker
+            objects=max(1,rows/4)
+            protein_map={}
+            for i in range(0,objects,10):
+                protein_map["UniProtKB:"+goa_synth.isoformId(i)]=goa_synth.objectId(i)
+            gpi=open(files["gpi"]+".mgi","w")
+            goa_parser.generateGPI_mgi(gpi,protein_map,log)
+            gpi.close()
+        else:
+            raise ValueError("Unknown stage: "+stage)
+        steps["convert"]=timeit.default_timer()-convert_start
+        result["seconds"]=steps["convert"]
+        result["rows_per_sec"]=rows/max(steps["convert"],1e-9)
+    except Exception, e:
+        result["error"]=traceback.format_exc().strip().split("\n")[-1]
+    log.close()
+    #ru_maxrss is in KB on Linux
+    result["peak_rss_kb"]=max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    rfh=open(result_file,"w")
+    json.dump(result,rfh)
+    rfh.close()
+    if "error" in result: sys.exit(1)
+
+#
+# Sets up the work directory: converter code and reference stand-ins
+#
+def setupWorkdir(workdir,seed):
+    code_dir=os.path.join(workdir,"code")
+    if os.path.isdir(code_dir): shutil.rmtree(code_dir)
+    os.makedirs(code_dir)
+    for module in glob.glob(os.path.join(REPO_DIR,"*.py")):
+        shutil.copy(module,code_dir)
+    goa_synth.writeReferences(os.path.join(code_dir,"data"),seed)
+
+#
+# Writes the synthetic inputs of a row count - returns the time spent
+#
+def generateInputs(workdir,rows,params):
+    start=timeit.default_timer()
+    files=inputFiles(workdir,rows)
+    ratios={"seed":params["seed"],"dup_ratio":params["dup_ratio"],
+            "isoform_ratio":params["isoform_ratio"],"bad_ratio":params["bad_ratio"]}
+    goa_synth.writeGaf(files["gaf"],rows,params["version"],**ratios)
+    goa_synth.writeGpadGpi(files["gpad"],files["gpi"],rows,**ratios)
+    goa_synth.writeMrkList(os.path.join(workdir,"code","data","MRK_List2.rpt"),max(1,rows/4),
+                           params["seed"],params["bad_ratio"])
+    return timeit.default_timer()-start
+
+#
+# Runs one stage in a child process - returns its result
+#
+def benchStage(stage,workdir,rows,params):
+    result_file=os.path.join(workdir,"%s_%d.json"%(stage,rows))
+    if os.path.isfile(result_file): os.remove(result_file)
+    out=open(os.path.join(workdir,"%s_%d.out"%(stage,rows)),"w")
+    start=timeit.default_timer()
+    subprocess.call([sys.executable,os.path.abspath(__file__),"--run-stage="+stage,"--workdir="+workdir,
+                     "--rows=%d"%(rows),"--version="+params["version"],"--workers=%d"%(params["workers"]),
+                     "--result="+result_file],stdout=out,stderr=subprocess.STDOUT)
+    elapsed=timeit.default_timer()-start
+    out.close()
+    if not os.path.isfile(result_file):
+        return {"stage":stage,"rows":rows,"steps":{},"error":"no result - see %s_%d.out"%(stage,rows)}
+    result=json.load(open(result_file))
+    result["steps"]["process"]=elapsed
+    return result
+
+def gitCommit():
+    try:
+        proc=subprocess.Popen(["git","rev-parse","--short","HEAD"],cwd=REPO_DIR,
+                              stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        return proc.communicate()[0].strip()
+    except OSError:
+        return ""
+
+def printResults(results):
+    print "stage\trows\tseconds\trows_per_sec\tpeak_rss_mb\tgenerate\tinit\tconvert"
+    for result in results:
+        steps=result["steps"]
+        if "error" in result:
+            print "%s\t%d\tERROR: %s"%(result["stage"],result["rows"],result["error"])
+            continue
+        print "%s\t%d\t%.3f\t%.0f\t%.1f\t%.3f\t%.3f\t%.3f"%(result["stage"],result["rows"],result["seconds"],
+              result["rows_per_sec"],result["peak_rss_kb"]/1024.0,steps.get("generate",0),
+              steps.get("init",0),steps.get("convert",0))
+
+#
+# Compares the results with the results of another run (JSON file)
+#
+def compareResults(results,compare_file):
+    old=json.load(open(compare_file))
+    old_results={}
+    for result in old["results"]: old_results[(result["stage"],result["rows"])]=result
+    print "\nCompared with %s (commit %s)"%(compare_file,old.get("commit",""))
+    print "stage\trows\told_rows_per_sec\trows_per_sec\tspeedup\told_peak_rss_mb\tpeak_rss_mb"
+    for result in results:
+        key=(result["stage"],result["rows"])
+        if key not in old_results or "error" in result or "error" in old_results[key]: continue
+        previous=old_results[key]
+        print "%s\t%d\t%.0f\t%.0f\t%.2fx\t%.1f\t%.1f"%(key[0],key[1],previous["rows_per_sec"],
+              result["rows_per_sec"],result["rows_per_sec"]/previous["rows_per_sec"],
+              previous["peak_rss_kb"]/1024.0,result["peak_rss_kb"]/1024.0)
+
+def main():
+    params={"rows":[10000,100000],"stages":STAGES,"version":"2.0","workers":1,"seed":goa_synth.SEED,
+            "dup_ratio":0.1,"isoform_ratio":0.1,"bad_ratio":0.01}
+    workdir=""
+    output=""
+    compare=""
+    run_stage=""
+    result_file=""
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hr:",
+                                   ["help","rows=","stages=","version=","workers=","seed=","dup-ratio=",
+                                    "isoform-ratio=","bad-ratio=","workdir=","output=","compare=",
+                                    "run-stage=","result="])
+    except getopt.GetoptError, err:
+        print "ERROR:\n"+str(err)
+        print __doc__
+        sys.exit(2)
+    for o, a in opts:
+        if o in ("-h","--help"):
+            print __doc__
+            sys.exit()
+        elif o in ("-r","--rows"): params["rows"]=[int(float(rows)) for rows in a.split(",")]
+        elif o == "--stages":
+            if a != "all": params["stages"]=a.split(",")
+        elif o == "--version": params["version"]=a
+        elif o == "--workers": params["workers"]=int(a)
+        elif o == "--seed": params["seed"]=int(a)
+        elif o == "--dup-ratio": params["dup_ratio"]=float(a)
+        elif o == "--isoform-ratio": params["isoform_ratio"]=float(a)
+        elif o == "--bad-ratio": params["bad_ratio"]=float(a)
+        elif o == "--workdir": workdir=a
+        elif o == "--output": output=a
+        elif o == "--compare": compare=a
+        elif o == "--run-stage": run_stage=a
+        elif o == "--result": result_file=a
+    if run_stage:
+        runStage(run_stage,workdir,params["rows"][0],params["version"],params["workers"],result_file)
+        return
+    for stage in params["stages"]:
+        if stage not in STAGES:
+            print "ERROR: unknown stage %s (expected one of %s)"%(stage,",".join(STAGES))
+            sys.exit(2)
+    keep_workdir=bool(workdir)
+    if not workdir: workdir=tempfile.mkdtemp(prefix="goa_bench.")
+    workdir=os.path.abspath(workdir)
+    if not os.path.isdir(workdir): os.makedirs(workdir)
+    setupWorkdir(workdir,params["seed"])
+    results=[]
+    for rows in params["rows"]:
+        generate=generateInputs(workdir,rows,params)
+        for stage in params["stages"]:
+            result=benchStage(stage,workdir,rows,params)
+            result["steps"]["generate"]=generate
+            results.append(result)
+        for name in inputFiles(workdir,rows).values():
+            for data_file in glob.glob(name+"*"): os.remove(data_file)
+    report={"date":datetime.now().strftime("%Y/%m/%d %H:%M:%S"),"commit":gitCommit(),
+            "python":platform.python_version(),"platform":platform.platform(),
+            "params":params,"results":results}
+    printResults(results)
+    if compare: compareResults(results,compare)
+    if output:
+        ofh=open(output,"w")
+        json.dump(report,ofh,indent=1,sort_keys=True)
+        ofh.close()
+        print "\nResults saved in "+output
+    if not keep_workdir: shutil.rmtree(workdir,True)
+
+if __name__ == "__main__":
+    main()
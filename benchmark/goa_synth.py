@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+'''
+#
+# Seeded generators of synthetic converter inputs for the benchmarks:
+#  - reference stand-ins (GO.references, go_terms.mgi, GO.xrf_abbs,
+#    gaf-eco-mapping.txt, GO_eco_association.rpt) - writeReferences
+#  - MGI marker report (MRK_List2.rpt) - writeMrkList
+#  - GAF 1.0/2.0 files - writeGaf
+#  - GPAD/GPI file pairs - writeGpadGpi
+#
+# Rows are written as they are generated, so large files (10^7 rows)
+# only use a few MB. The same seed and parameters always give the same
+# files. Every generator takes:
+#  dup_ratio     -> share of rows repeating one of the last rows written
+#  isoform_ratio -> share of annotations to an isoform (PR/UniProtKB-n)
+#  bad_ratio     -> share of rows broken in one of the ways the converters
+#                   check (missing field, field count, evidence code, db...)
+#
+# Usage: python benchmark/goa_synth.py --out=dir [--rows=N] [--seed=N]
+#        writes dir/data/* reference stand-ins, dir/synth.gaf, dir/synth.gpad
+#        and dir/synth.gpi
+#
+'''
+
+import getopt,sys,os
+import random
+from collections import deque
+
+SEED=2015
+GO_TERMS=5000
+GO_REFS=100
+MGI_ECO_REFS=2000
+TAXON="taxon:10090"
+ASPECTS=[("Biological Process","P"),("Molecular Function","F"),("Cellular Component","C")]
+EVIDENCE_CODES=["EXP","IDA","IPI","IMP","IGI","IEP","ISS","ISO","ISA","ISM","IGC","IBA",
+                "IBD","IKR","IRD","RCA","NAS","TAS","IC","ND","IEA"]
+DATABASES=["MGI","UniProtKB","PR","RefSeq","EMBL","ENSEMBL","PMID","GO_REF"]
+FEATURE_TYPES=["protein coding gene","protein coding gene","protein coding gene",
+               "non-coding RNA gene","miRNA gene","lincRNA gene","pseudogene"]
+GAF_QUALIFIERS=["","","","","NOT","contributes_to","colocalizes_with","NOT|colocalizes_with"]
+GPAD_QUALIFIERS=["part_of","enables","involved_in","involved_in","colocalizes_with","NOT|enables"]
+GAF_BAD_ROWS=["missing","fieldcount","evidence","db","aspect"]
+GPAD_BAD_ROWS=["missing","fieldcount","db","object"]
+RECENT_ROWS=1000
+
+def goId(i): return "GO:%07d"%(i+1)
+def goRef(i): return "GO_REF:%07d"%(i+1)
+def ecoCode(i): return "ECO:%07d"%(i)
+def objectId(i): return "MGI:%d"%(i+1)
+def isoformId(i): return "Q%05d-%d"%(i+1,i%3+1)
+
+#
+# Writes the reference stand-ins under data_dir
+# Returns a dict used by the other generators (go ids, references)
+#
+def writeReferences(data_dir,seed=SEED,go_terms=GO_TERMS):
+    rand=random.Random(seed)
+    if not os.path.isdir(data_dir): os.makedirs(data_dir)
+    #GO ontology: go_terms.mgi
+    gfh=open(os.path.join(data_dir,"go_terms.mgi"),"w")
+    for i in range(go_terms):
+        gfh.write("%s\t%s\tsynthetic term %d\n"%(ASPECTS[i%3][0],goId(i),i))
+    gfh.close()
+    #GO reference collection
+    rfh=open(os.path.join(data_dir,"GO.references"),"w")
+    rfh.write("!GO.references\n!synthetic stand-in\n\n")
+    for i in range(GO_REFS):
+        rfh.write("go_ref_id: %s\nalt_id: GO_REF:%07d\ntitle: synthetic reference %d\n"%(goRef(i),i+5000,i))
+        rfh.write("authors: GO\nyear: 2015\nexternal_accession: J:%d\ncitation: MGI:MGI:%d\n\n"%(72000+i,2152000+i))
+    rfh.close()
+    #GO database cross-references
+    xfh=open(os.path.join(data_dir,"GO.xrf_abbs"),"w")
+    xfh.write("!GO.xrf_abbs\n!synthetic stand-in\n\n")
+    for db in DATABASES:
+        xfh.write("abbreviation: %s\ndatabase: %s database\ngeneric_url: http://%s.org\n\n"%(db,db,db.lower()))
+    xfh.close()
+    #GAF - ECO evidence map
+    efh=open(os.path.join(data_dir,"gaf-eco-mapping.txt"),"w")
+    efh.write("# synthetic gaf-eco-mapping stand-in\n")
+    for i in range(len(EVIDENCE_CODES)):
+        efh.write("%s\tDefault\t%s\n"%(EVIDENCE_CODES[i],ecoCode(300+i)))
+        for j in range(i%4):
+            efh.write("%s\t%s\t%s\n"%(EVIDENCE_CODES[i],goRef(j+i*3),ecoCode(500+i*4+j)))
+    efh.close()
+    #MGI GO_eco_association (already cut to evidenceCode, mgiRef, ecoCode)
+    mfh=open(os.path.join(data_dir,"GO_eco_association.rpt"),"w")
+    for i in range(MGI_ECO_REFS):
+        code=rand.randint(0,len(EVIDENCE_CODES)-1)
+        mfh.write("%s\tJ:%d\t%s %s\n"%(EVIDENCE_CODES[code],72000+i,ecoCode(300+code),ecoCode(700+i%7)))
+    mfh.close()
+    return {"go_terms":go_terms}
+
+#
+# Writes the MGI marker report with marker_count markers
+#
+def writeMrkList(mrk_file,marker_count,seed=SEED,bad_ratio=0.0):
+    rand=random.Random(seed)
+    mfh=open(mrk_file,"w")
+    mfh.write("MGI Accession ID\tChr\tcM Position\tgenome coordinate start\tgenome coordinate end\tstrand\t"
+              "Marker Symbol\tStatus\tMarker Name\tMarker Type\tFeature Type\tMarker Synonyms (pipe-separated)\n")
+    for i in range(marker_count):
+        row=[objectId(i),str(i%19+1),"%.2f"%(rand.random()*100),str(1000*i),str(1000*i+500),
+             rand.choice("+-"),"Sym%d"%(i+1),"O","synthetic marker %d"%(i+1),"Gene",
+             rand.choice(FEATURE_TYPES),"syn%d|alias%d"%(i+1,i+1)]
+        if rand.random() < bad_ratio: row=row[:6]
+        mfh.write("\t".join(row)+"\n")
+    mfh.close()
+
+#
+# Writes a GAF file (version 2.0: 17 columns, 1.0: 15 columns)
+# objects: number of annotated objects (default rows/4)
+#
+def writeGaf(gaf_file,rows,version="2.0",seed=SEED,dup_ratio=0.1,isoform_ratio=0.1,bad_ratio=0.01,
+             objects=None,go_terms=GO_TERMS):
+    rand=random.Random(seed)
+    if not objects: objects=max(1,rows/4)
+    recent=deque(maxlen=RECENT_ROWS)
+    gfh=open(gaf_file,"w")
+    gfh.write("!gaf-version: %s\n!synthetic GAF - seed %d rows %d\n!\n"%(version,seed,rows))
+    for n in range(rows):
+        if recent and rand.random() < dup_ratio:
+            gfh.write(rand.choice(recent))
+            continue
+        obj=rand.randint(0,objects-1)
+        go=rand.randint(0,go_terms-1)
+        ref=rand.choice(["PMID:%d"%(n+1),"MGI:MGI:%d|PMID:%d"%(2152000+rand.randint(0,GO_REFS-1),n+1),
+                         goRef(rand.randint(0,GO_REFS-1)),"J:%d"%(72000+rand.randint(0,MGI_ECO_REFS-1))])
+        row=["MGI",objectId(obj),"Sym%d"%(obj+1),rand.choice(GAF_QUALIFIERS),goId(go),ref,
+             rand.choice(EVIDENCE_CODES),rand.choice(["","","UniProtKB:P%05d"%(n%99999)]),ASPECTS[go%3][1],
+             "synthetic marker %d"%(obj+1),"syn%d|alias%d"%(obj+1,obj+1),rand.choice(["gene","gene","protein"]),
+             rand.choice([TAXON,TAXON,TAXON,TAXON+"|taxon:9606"]),"2015%02d%02d"%(n%12+1,n%28+1),"MGI"]
+        if version == "2.0":
+            product=""
+            if rand.random() < isoform_ratio:
+                product=rand.choice(["UniProtKB:","PR:"])+isoformId(obj)
+            row+=[rand.choice(["","","part_of(CL:%07d)"%(n%1000)]),product]
+        if rand.random() < bad_ratio:
+            bad=rand.choice(GAF_BAD_ROWS)
+            if bad == "missing": row[2]=""
+            elif bad == "fieldcount": row=row[:-1]
+            elif bad == "evidence": row[6]="XXX"
+            elif bad == "db": row[0]="BADDB"
+            else: row[8]="X"
+        line="\t".join(row)+"\n"
+        recent.append(line)
+        gfh.write(line)
+    gfh.close()
+
+#
+# Writes a GPAD file with rows annotations and the GPI file of the
+# annotated objects (genes and isoforms with their parent gene)
+#
+def writeGpadGpi(gpad_file,gpi_file,rows,seed=SEED,dup_ratio=0.1,isoform_ratio=0.1,bad_ratio=0.01,
+                 objects=None,go_terms=GO_TERMS):
+    rand=random.Random(seed)
+    if not objects: objects=max(1,rows/4)
+    #GPI: every gene, plus an isoform for isoform_ratio of the genes
+    ifh=open(gpi_file,"w")
+    ifh.write("!gpi-version: 1.0\n!synthetic GPI - seed %d objects %d\n!\n"%(seed,objects))
+    isoforms=[]
+    for obj in range(objects):
+        ifh.write("MGI\t%s\tSym%d\tsynthetic marker %d\tsyn%d\tgene\t%s\t\t\n"
+                  %(objectId(obj),obj+1,obj+1,obj+1,TAXON))
+        if rand.random() < isoform_ratio:
+            isoforms.append(obj)
+            ifh.write("PR\t%s\tSym%d\tsynthetic marker %d\t\tprotein\t%s\tMGI:%s\t\n"
+                      %(isoformId(obj),obj+1,obj+1,TAXON,objectId(obj)))
+    ifh.close()
+    recent=deque(maxlen=RECENT_ROWS)
+    gfh=open(gpad_file,"w")
+    gfh.write("!gpa-version: 1.1\n!synthetic GPAD - seed %d rows %d\n!\n"%(seed,rows))
+    for n in range(rows):
+        if recent and rand.random() < dup_ratio:
+            gfh.write(rand.choice(recent))
+            continue
+        if isoforms and rand.random() < isoform_ratio:
+            db="PR"
+            obj=isoformId(rand.choice(isoforms))
+        else:
+            db="MGI"
+            obj=objectId(rand.randint(0,objects-1))
+        code=rand.randint(0,len(EVIDENCE_CODES)-1)
+        row=[db,obj,rand.choice(GPAD_QUALIFIERS),goId(rand.randint(0,go_terms-1)),
+             rand.choice(["PMID:%d"%(n+1),goRef(rand.randint(0,GO_REFS-1)),"J:%d"%(72000+rand.randint(0,MGI_ECO_REFS-1))]),
+             ecoCode(300+code),rand.choice(["","","UniProtKB:P%05d"%(n%99999)]),rand.choice(["","","","taxon:9606"]),
+             "2015%02d%02d"%(n%12+1,n%28+1),"MGI",rand.choice(["","","part_of(CL:%07d)"%(n%1000)]),""]
+        if rand.random() < bad_ratio:
+            bad=rand.choice(GPAD_BAD_ROWS)
+            if bad == "missing": row[3]=""
+            elif bad == "fieldcount": row=row[:-2]
+            elif bad == "db": row[0]="BADDB"
+            else: row[1]="MGI:0"
+        line="\t".join(row)+"\n"
+        recent.append(line)
+        gfh.write(line)
+    gfh.close()
+
+def main():
+    out=""
+    rows=10000
+    seed=SEED
+    opts, args = getopt.getopt(sys.argv[1:], "o:r:s:", ["out=","rows=","seed="])
+    for o, a in opts:
+        if o in ("-o","--out"): out=a
+        elif o in ("-r","--rows"): rows=int(a)
+        elif o in ("-s","--seed"): seed=int(a)
+    if not out:
+        print "Usage: python benchmark/goa_synth.py --out=dir [--rows=N] [--seed=N]"
+        sys.exit(2)
+    writeReferences(os.path.join(out,"data"),seed)
+    writeMrkList(os.path.join(out,"data","MRK_List2.rpt"),max(1,rows/4),seed)
+    writeGaf(os.path.join(out,"synth.gaf"),rows,"2.0",seed)
+    writeGpadGpi(os.path.join(out,"synth.gpad"),os.path.join(out,"synth.gpi"),rows,seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+'''
+#
+# Microbenchmark of the gpad/gpi/gaf row projection:
+# compares the per-field list.index lookups used before the projection
+# plans (legacy_* functions below) with the goa_specs projection plans
+# used by goa_parser, for both converters and both GAF versions.
+#
+# Usage: python benchmark/projection_bench.py [--rows=N]
+#
+'''
+
+import getopt,sys,os
+import timeit
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import goa_specs,goa_parser
+
+GPAD_FIELDS=goa_specs.GPAD_FIELDS
+GPI_FIELDS=goa_specs.GPI_FIELDS
+gaf=goa_parser.gaf
+
+#
+#Legacy gaf -> gpad/gpi projection (list.index for every field of every row)
+#
+def legacy_gp_row(gaf_row,g_fields,is_gpad,is_gene_variant,parent_gp_id,evidence_code):
+    taxa=gaf_row[gaf.taxon_index].split("|")
+    inter_taxon=""
+    taxon=taxa[0]
+    if len(taxa)> 1: inter_taxon="".join(taxa[1:len(taxa)])
+    if is_gpad==1: taxon=inter_taxon
+    gf_row=[]
+    for i in range(len(g_fields)):
+        if g_fields[i] in gaf.fields:
+           gaf_index=gaf.fields.index(g_fields[i])
+           if gaf_index==gaf.taxon_index: gf_row.append(taxon)
+           else: gf_row.append(gaf_row[gaf_index])
+        else:
+           if is_gpad:
+              if i == goa_specs.gpad_annot_properties_index: gf_row.append(evidence_code)
+              else: gf_row.append(" ")
+           else:
+              if i==goa_specs.gpi_parent_index and is_gene_variant: gf_row.append(parent_gp_id)
+              else:gf_row.append(" ")
+    return "\t".join(gf_row)
+
+#
+#Plan based gaf -> gpad/gpi projection (same code as goa_parser.writeGP_row)
+#
+class RowCapture:
+    def __init__(self): self.row=""
+    def add(self,row):
+        self.row=row
+        return False
+
+def plan_gp_row(gaf_row,capture,g_plan,is_gpad,is_gene_variant,parent_gp_id,evidence_code):
+    goa_parser.writeGP_row(gaf_row,capture,None,g_plan,is_gpad,is_gene_variant,parent_gp_id,evidence_code)
+    return capture.row
+
+#
+#Legacy gpad/gpi -> gaf fill loop
+#
+def legacy_gaf_fill(gaf_row,gpad_row,gpi_row):
+    for i in range(len(gaf.fields)):
+        if i == gaf.db_index : continue
+        elif i == gaf.object_index : continue
+        elif i == gaf.taxon_index: continue
+        elif i == gaf.evidence_index: continue
+        elif i== gaf.aspect_index: continue
+        elif i== gaf.qual_index:continue
+        elif i== gaf.product_form_id_index: continue
+        elif i== gaf.annotation_extension_index: continue
+        if not gaf_row[i]:
+            if gaf.fields[i] in GPAD_FIELDS: gaf_row[i]=gpad_row[GPAD_FIELDS.index(gaf.fields[i])]
+            elif gaf.fields[i] in GPI_FIELDS: gaf_row[i]=gpi_row[GPI_FIELDS.index(gaf.fields[i])]
+    return "\t".join(gaf_row)
+
+#
+#Plan based gpad/gpi -> gaf fill loop (same code as goa_parser.writeGaf_row)
+#
+def plan_gaf_fill(gaf_row,gpad_row,gpi_row):
+    for i,source,source_index in gaf.gaf_plan:
+        if not gaf_row[i]:
+            if source==goa_specs.PLAN_GPAD: gaf_row[i]=gpad_row[source_index]
+            else: gaf_row[i]=gpi_row[source_index]
+    return "\t".join(gaf_row)
+
+#
+# Synthetic rows
+#
+def makeRows(count):
+    gaf_rows=[]
+    gp_rows=[]
+    for i in range(count):
+        row=["MGI","MGI:%d"%(i),"Sym%d"%(i),"","GO:%07d"%(i%5000),"PMID:%d"%(i),"ECO:0000314",
+             "","P","name %d"%(i),"syn","protein","taxon:10090|taxon:9606","20150101","MGI",
+             "part_of(CL:0000%03d)"%(i%100),"UniProtKB:Q%05d"%(i)]
+        gaf_rows.append(row[0:len(gaf.fields)])
+        gpad_row=["MGI","MGI:%d"%(i),"part_of","GO:%07d"%(i%5000),"PMID:%d"%(i),"ECO:0000314",
+                  "","","20150101","MGI","","IDA"]
+        gpi_row=["MGI","MGI:%d"%(i),"Sym%d"%(i),"name","syn","protein","taxon:10090","",""]
+        gp_rows.append((gpad_row,gpi_row))
+    return gaf_rows,gp_rows
+
+def timeRows(func,args_list,repeat):
+    best=None
+    for r in range(repeat):
+        start=timeit.default_timer()
+        for args in args_list: func(*args)
+        elapsed=timeit.default_timer()-start
+        if best is None or elapsed < best: best=elapsed
+    return best/len(args_list)*1e6
+
+def main():
+    rows=20000
+    repeat=5
+    opts, args = getopt.getopt(sys.argv[1:], "r:", ["rows=","repeat="])
+    for o, a in opts:
+        if o in ("-r","--rows"): rows=int(a)
+        elif o == "--repeat": repeat=int(a)
+    print "version\tconverter\tlegacy_us_per_row\tplan_us_per_row\tspeedup"
+    for version in ("2.0","1.0"):
+        gaf._init(version)
+        gaf_rows,gp_rows=makeRows(rows)
+        capture=RowCapture()
+        cases=[("gaf2gpad",legacy_gp_row,plan_gp_row,
+                [(row,GPAD_FIELDS,1,1,"MGI:MGI:1","IDA") for row in gaf_rows],
+                [(row,capture,gaf.gpad_plan,1,1,"MGI:MGI:1","IDA") for row in gaf_rows]),
+               ("gaf2gpi",legacy_gp_row,plan_gp_row,
+                [(row,GPI_FIELDS,0,1,"MGI:MGI:1","IDA") for row in gaf_rows],
+                [(row,capture,gaf.gpi_plan,0,1,"MGI:MGI:1","IDA") for row in gaf_rows]),
+               ("gpad2gaf",legacy_gaf_fill,plan_gaf_fill,
+                [([""]*len(gaf.fields),gpad,gpi) for gpad,gpi in gp_rows],
+                [([""]*len(gaf.fields),gpad,gpi) for gpad,gpi in gp_rows])]
+        for name,legacy,plan,legacy_args,plan_args in cases:
+            #both projections must give the same rows
+            for i in range(len(legacy_args)):
+                if legacy(*legacy_args[i]) != plan(*plan_args[i]):
+                    print "ERROR: %s %s projection mismatch at row %d"%(version,name,i)
+                    sys.exit(1)
+            legacy_us=timeRows(legacy,legacy_args,repeat)
+            plan_us=timeRows(plan,plan_args,repeat)
+            print "%s\t%s\t%.3f\t%.3f\t%.2fx"%(version,name,legacy_us,plan_us,legacy_us/plan_us)
+
+if __name__ == "__main__":
+    main()
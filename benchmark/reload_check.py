@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+'''
+#
+# Checks the goa_server map reload on synthetic reference files
+# (goa_synth.py): the maps are loaded, the GO terms, GO.references and
+# gaf-eco-mapping files are rewritten with fewer entries, then the maps
+# are reloaded the way goa_server.py does it (snapshot rebuilt in a
+# process forked from the loaded server).
+#
+# The GO_IDs, GO_REF accessions and ECO codes removed from the files
+# must be gone from the reloaded maps and from the maps snapshot.
+# Exit code 1 if a removed entry is still there.
+#
+# The converter modules are copied to a temp directory (as with
+# converter_bench.py), so data/ and log/ are never touched.
+#
+# Usage: python benchmark/reload_check.py [--go-terms=N]
+#
+'''
+
+import getopt,sys,os
+import glob,shutil,tempfile
+BENCH_DIR=os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,BENCH_DIR)
+import goa_synth
+
+REPO_DIR=os.path.dirname(BENCH_DIR)
+#maps checked -> goa_specs class
+CHECKED_MAPS={"GO_ONTOLOGY_MAP":"Goref","COLLECTION":"Goref","GAF_ECO_MAP":"Eco"}
+
+#
+# Rewrites a file with its first keep lines (after skip header lines)
+#
+def shrinkLines(path,keep,skip=0):
+    lines=open(path).readlines()
+    open(path,"w").writelines(lines[:skip+keep])
+
+#
+# Rewrites GO.references with its first keep records
+#
+def shrinkReferences(path,keep):
+    records=open(path).read().split("\n\n")
+    open(path,"w").write("\n\n".join(records[:keep+1])+"\n\n")
+
+#
+# Returns the keys of the checked maps loaded in goa_specs
+#
+def loadedKeys(goa_specs):
+    keys={}
+    for name in CHECKED_MAPS:
+        keys[name]=set(getattr(getattr(goa_specs,CHECKED_MAPS[name]),name))
+    return keys
+
+#
+# Returns the names of the removed keys still in the maps
+#
+def staleKeys(label,maps,removed):
+    stale=[]
+    for name in removed:
+        kept=[key for key in removed[name] if key in maps[name]]
+        if kept: stale.append("%s %s: %d removed keys kept (%s ...)"%(label,name,len(kept),kept[0]))
+    return stale
+
+def main():
+    go_terms=goa_synth.GO_TERMS
+    opts, args = getopt.getopt(sys.argv[1:], "", ["go-terms="])
+    for o, a in opts:
+        if o == "--go-terms": go_terms=int(a)
+    work_dir=tempfile.mkdtemp(prefix="reload_check.")
+    try:
+        code_dir=os.path.join(work_dir,"code")
+        os.makedirs(code_dir)
+        for module in glob.glob(os.path.join(REPO_DIR,"*.py")):
+            shutil.copy(module,code_dir)
+        goa_synth.writeReferences(os.path.join(code_dir,"data"),go_terms=go_terms)
+        sys.path.insert(0,code_dir)
+        import goa_parser,goa_server,goa_snapshot,goa_specs
+        log=open(os.path.join(work_dir,"reload_check.log"),"w")
+        goa_parser.converter_init(log,"off",True)
+        before=loadedKeys(goa_specs)
+        messages=[]
+        maps=goa_server.ConverterMaps(messages.append)
+        #
+        #Shrink the source files then reload
+        shrinkLines(goa_parser.LOCAL_GO_REPORT_FILE,go_terms/2)
+        shrinkReferences(goa_parser.LOCAL_GO_REF_FILE,goa_synth.GO_REFS/2)
+        shrinkLines(goa_parser.LOCAL_ECO_MAP_FILE,len(goa_synth.EVIDENCE_CODES),1)
+        maps.reload()
+        after=loadedKeys(goa_specs)
+        #
+        #The removed keys: not in a load of the shrunk files into empty maps
+        for name in CHECKED_MAPS: getattr(getattr(goa_specs,CHECKED_MAPS[name]),name).clear()
+        goa_specs.Goref()._init(goa_parser.LOCAL_GO_REF_FILE,goa_parser.LOCAL_GO_REPORT_FILE,
+                                goa_parser.LOCAL_GO_XREF_FILE,None)
+        goa_specs.Eco()._init(goa_parser.LOCAL_ECO_MAP_FILE,goa_parser.LOCAL_MGI_GO_ECO_REPORT_FILE,None)
+        fresh=loadedKeys(goa_specs)
+        removed={}
+        for name in CHECKED_MAPS: removed[name]=sorted(before[name]-fresh[name])
+        for name in removed:
+            print "%s: %d keys loaded, %d removed from the files, %d after the reload"%(
+                  name,len(before[name]),len(removed[name]),len(after[name]))
+        for message in messages: print message
+        stale=staleKeys("reloaded maps",after,removed)
+        snapshot=goa_snapshot.loadSnapshot(goa_parser.LOCAL_MAPS_SNAPSHOT_FILE,goa_parser.MAPS_SOURCE_FILES)
+        if snapshot is None: stale.append("maps snapshot not rebuilt")
+        else:
+            stale+=staleKeys("snapshot",dict(snapshot["goref"].items()+snapshot["eco"].items()),removed)
+        if not [name for name in removed if removed[name]]: stale.append("no key removed from the files")
+        for line in stale: print "ERROR: "+line
+        log.close()
+        if stale: sys.exit(1)
+        print "reload ok"
+    finally:
+        shutil.rmtree(work_dir,True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+'''
+#
+# Microbenchmark of the GO file tokenizer: rows/sec of the csv excel-tab
+# reader used before and of goa_io.TabReader on synthetic GAF, GPAD and
+# GPI files (goa_synth.py), read from a plain and a gzip file.
+#
+# Both readers must give the same rows on the synthetic files (no quote
+# characters). The quote check then reads a file with " in its fields:
+# TabReader must keep every field as written, where csv excel-tab merges
+# the fields of a quoted value.
+#
+# Usage: python benchmark/tokenizer_bench.py [--rows=N] [--repeat=N]
+#
+'''
+
+import getopt,sys,os
+import csv,gzip,shutil,tempfile
+import timeit
+BENCH_DIR=os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,BENCH_DIR)
+sys.path.insert(0,os.path.join(BENCH_DIR,".."))
+import goa_io,goa_synth
+
+#GPI rows with quote characters, written as is in GO files
+QUOTE_ROWS=[["MGI","MGI:1","\"Sym1","gene \"one\"","","protein"],
+            ["MGI","MGI:2","Sym2","\"quoted name\"","syn\"2","gene"],
+            ["MGI","MGI:3","Sym3","5' UTR \"","","gene"]]
+
+def csvRows(path):
+    return csv.reader(goa_io.openInput(path),dialect='excel-tab')
+
+def tabRows(path):
+    return goa_io.TabReader(goa_io.openInput(path))
+
+def countRows(reader,path):
+    rows=0
+    for fields in reader(path): rows+=1
+    return rows
+
+def timeReader(reader,path,repeat):
+    best=None
+    for r in range(repeat):
+        start=timeit.default_timer()
+        rows=countRows(reader,path)
+        elapsed=timeit.default_timer()-start
+        if best is None or elapsed < best: best=elapsed
+    return rows,best
+
+#
+# Both readers give the same rows (comment lines excepted: TabReader does not split them)
+#
+def sameRows(path):
+    for csv_fields,tab_fields in zip(csvRows(path),tabRows(path)):
+        if csv_fields and csv_fields[0].startswith("!"): csv_fields=["\t".join(csv_fields)]
+        if csv_fields != tab_fields: return False
+    return True
+
+#
+# TabReader keeps the fields of rows with quotes
+#
+def checkQuotes(work_dir):
+    quote_file=os.path.join(work_dir,"quotes.gpi")
+    qfh=open(quote_file,"w")
+    qfh.write("!gpi-version: 1.0\n")
+    for row in QUOTE_ROWS: qfh.write("\t".join(row)+"\n")
+    qfh.close()
+    tab_rows=[fields for fields in tabRows(quote_file) if not fields[0].startswith("!")]
+    csv_rows=[fields for fields in csvRows(quote_file) if not fields[0].startswith("!")]
+    csv_bad=len([row for row in QUOTE_ROWS if row not in csv_rows])
+    return tab_rows == QUOTE_ROWS,csv_bad
+
+def main():
+    rows=200000
+    repeat=3
+    opts, args = getopt.getopt(sys.argv[1:], "r:", ["rows=","repeat="])
+    for o, a in opts:
+        if o in ("-r","--rows"): rows=int(a)
+        elif o == "--repeat": repeat=int(a)
+    work_dir=tempfile.mkdtemp(prefix="tokenizer_bench.")
+    try:
+        files={"gaf":os.path.join(work_dir,"synth.gaf"),"gpad":os.path.join(work_dir,"synth.gpad"),
+               "gpi":os.path.join(work_dir,"synth.gpi")}
+        goa_synth.writeGaf(files["gaf"],rows)
+        goa_synth.writeGpadGpi(files["gpad"],files["gpi"],rows)
+        print "file\tcodec\trows\tcsv_rows_per_sec\ttab_rows_per_sec\tspeedup"
+        for name in ("gaf","gpad","gpi"):
+            path=files[name]
+            gz_path=path+".gz"
+            pfh=open(path,"rb")
+            gfh=gzip.open(gz_path,"wb")
+            shutil.copyfileobj(pfh,gfh)
+            gfh.close()
+            pfh.close()
+            for codec,input_path in (("none",path),("gzip",gz_path)):
+                if not sameRows(input_path):
+                    print "ERROR: %s (%s) csv and TabReader rows differ"%(name,codec)
+                    sys.exit(1)
+                csv_count,csv_seconds=timeReader(csvRows,input_path,repeat)
+                tab_count,tab_seconds=timeReader(tabRows,input_path,repeat)
+                print "%s\t%s\t%d\t%.0f\t%.0f\t%.2fx"%(name,codec,tab_count,csv_count/csv_seconds,
+                                                     tab_count/tab_seconds,csv_seconds/tab_seconds)
+        quotes_ok,csv_bad=checkQuotes(work_dir)
+        print "quote rows: TabReader %s, csv excel-tab misreads %d of %d"%("ok" if quotes_ok else "WRONG",
+                                                                           csv_bad,len(QUOTE_ROWS))
+        if not quotes_ok: sys.exit(1)
+    finally:
+        shutil.rmtree(work_dir,True)
+
+if __name__ == "__main__":
+    main()
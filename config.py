@@ -22,6 +22,89 @@ WEEKLY_UPDATE=7
 BIWEEKLY_UPDATE=14
 UPDATE_INDEX={}
 #
+#remote source of the local index files refreshed by goa_depends.py
+#
+REMOTE_INDEX={}
+#
+#Dependency fetcher setup (see goa_depends.py)
+# mirror: directory or base url used instead of the remote hosts (testing, local copies)
+# timeout: network timeout in seconds
+# offline: never refresh a local file that exists (--offline)
+#
+DEPENDS_MIRROR=""
+DEPENDS_TIMEOUT=60
+DEPENDS_OFFLINE=False
+#
+#Duplicate rows filter setup (see goa_dedup.py)
+# mode: lines, digest or external
+# memory budget in MB before the external filter spills to disk
+#
+DEDUP_MODE="digest"
+DEDUP_MEMORY_BUDGET=512
+#
+#maps.log content (--maps-log)
+# off: no maps.log; summary: map sizes only; full: content of every map
+#
+MAPS_LOG_LEVELS=["off","summary","full"]
+MAPS_LOG_LEVEL="full"
+#
+#Compressed input/output (see goa_io.py)
+# output codec: none, gzip, bgzip or zstd ("" - from the output file extension)
+# output level: compression level
+# decompress mode: inline, thread or process
+#
+OUTPUT_CODEC=""
+OUTPUT_LEVEL=6
+DECOMPRESS_MODE="inline"
+#
+#QC logging of the rejected rows (see goa_qc.py)
+# level: counts (no reject lines in the log), samples (the first QC_SAMPLE_CAP
+#        rejects of each category) or full (every reject)
+# reject buffer: write buffer size in bytes of the reject file (--qc-rejects)
+#
+QC_LEVELS=["counts","samples","full"]
+QC_LEVEL="samples"
+QC_SAMPLE_CAP=20
+QC_REJECT_BUFFER=1024*1024
+#
+#GAF to GPAD/GPI conversion engine (--engine)
+# row: converts the gaf rows one at a time
+# columnar: converts batches of COLUMNAR_BATCH_ROWS rows column by column
+#
+ENGINES=["row","columnar"]
+ENGINE="row"
+COLUMNAR_BATCH_ROWS=20000
+#
+#Columnar binary export of the converted files (--export, see goa_export.py)
+# row group rows: rows per Parquet row group/Arrow record batch
+#
+EXPORT_ROW_GROUP_ROWS=65536
+#
+#Run instrumentation (see goa_profile.py)
+# profile mode: cprofile (deterministic, pstats file) or sample (stack
+#               samples every PROFILE_SAMPLE_INTERVAL seconds of CPU time)
+# profile top: functions listed in the log with --profile
+#
+PROFILE_MODES=["cprofile","sample"]
+PROFILE_MODE="cprofile"
+PROFILE_SAMPLE_INTERVAL=0.005
+PROFILE_TOP=25
+#
+#Batch conversion (see goa_batch.py)
+# workers: number of gaf files converted at the same time
+#
+BATCH_WORKERS=4
+#
+#Conversion server (see goa_server.py)
+# host/port: localhost HTTP address (or --socket=path for a Unix socket)
+# jobs: number of conversions run at the same time (the others wait)
+# watch interval: seconds between two checks of the map source files
+#
+SERVER_HOST="127.0.0.1"
+SERVER_PORT=8765
+SERVER_JOBS=2
+SERVER_WATCH_INTERVAL=30
+#
 # Converter base
 #
 GAF_CONVERTER_BASE=os.path.abspath(os.path.dirname(__file__))
@@ -48,6 +131,7 @@ GAF_ECO_MAP_URL="http://purl.obolibrary.org/obo/eco/"
 REMOTE_MAP_FILE=GAF_ECO_MAP_URL+GAF_ECO_MAP
 LOCAL_MAP_FILE=GAF_CONVERTER_DATA_BASE+"/"+GAF_ECO_MAP
 UPDATE_INDEX[LOCAL_MAP_FILE]=BIWEEKLY_UPDATE
+REMOTE_INDEX[LOCAL_MAP_FILE]=REMOTE_MAP_FILE
 #
 #
 #
@@ -65,6 +149,7 @@ GO_REF_COLLECTION_BASE="http://www.geneontology.org/doc/"
 REMOTE_GO_REF_FILE=GO_REF_COLLECTION_BASE+GO_REF_COLLECTION
 LOCAL_GO_REF_FILE=GAF_CONVERTER_DATA_BASE+"/"+GO_REF_COLLECTION
 UPDATE_INDEX[LOCAL_GO_REF_FILE]=BIWEEKLY_UPDATE
+REMOTE_INDEX[LOCAL_GO_REF_FILE]=REMOTE_GO_REF_FILE
 #
 # GO database cross-reference
 #
@@ -72,6 +157,7 @@ GO_XREF_DB="GO.xrf_abbs"
 REMOTE_GO_XREF_FILE=GO_REF_COLLECTION_BASE+GO_XREF_DB
 LOCAL_GO_XREF_FILE=GAF_CONVERTER_DATA_BASE+"/"+GO_XREF_DB
 UPDATE_INDEX[LOCAL_GO_XREF_FILE]=DAILY_UPDATE
+REMOTE_INDEX[LOCAL_GO_XREF_FILE]=REMOTE_GO_XREF_FILE
 
 #Converter MGI report dependency
 # MGI marker reports path
@@ -83,6 +169,7 @@ MGI_MRK_REPORT="MRK_List2.rpt"
 REMOTE_MRK_REPORT_FILE=MGI_FTP_HOST+MGI_REPORT_PATH+MGI_MRK_REPORT
 LOCAL_MRK_REPORT_FILE=GAF_CONVERTER_DATA_BASE+"/"+MGI_MRK_REPORT
 UPDATE_INDEX[LOCAL_MRK_REPORT_FILE]=WEEKLY_UPDATE
+REMOTE_INDEX[LOCAL_MRK_REPORT_FILE]=REMOTE_MRK_REPORT_FILE
 #
 # GO Ontology 
 #
@@ -90,6 +177,7 @@ GO_TERM_REPORT="go_terms.mgi"
 REMOTE_GO_REPORT_FILE=MGI_FTP_HOST+MGI_REPORT_PATH+GO_TERM_REPORT
 LOCAL_GO_REPORT_FILE=GAF_CONVERTER_DATA_BASE+"/"+GO_TERM_REPORT
 UPDATE_INDEX[LOCAL_GO_REPORT_FILE]=WEEKLY_UPDATE
+REMOTE_INDEX[LOCAL_GO_REPORT_FILE]=REMOTE_GO_REPORT_FILE
 #
 #MGI GO_eco_association report
 #
@@ -97,4 +185,16 @@ MGI_GO_ECO_REPORT="GO_eco_association.rpt"
 REMOTE_MGI_GO_REPORT_FILE=MGI_FTP_HOST+MGI_REPORT_PATH+MGI_GO_ECO_REPORT
 LOCAL_MGI_GO_ECO_REPORT_FILE=GAF_CONVERTER_DATA_BASE+"/"+MGI_GO_ECO_REPORT
 UPDATE_INDEX[LOCAL_MGI_GO_ECO_REPORT_FILE]=DAILY_UPDATE
+REMOTE_INDEX[LOCAL_MGI_GO_ECO_REPORT_FILE]=REMOTE_MGI_GO_REPORT_FILE
+#
+#Dependency fetch manifest: url, validators and md5 of every local index file
+#
+DEPENDS_MANIFEST="depends.manifest"
+LOCAL_DEPENDS_MANIFEST_FILE=GAF_CONVERTER_DATA_BASE+"/"+DEPENDS_MANIFEST
+#
+#Compiled snapshot of the GO_REF/ECO maps (see goa_snapshot.py)
+#rebuilt when one of the source files above changes
+#
+MAPS_SNAPSHOT="maps.snapshot"
+LOCAL_MAPS_SNAPSHOT_FILE=GAF_CONVERTER_DATA_BASE+"/"+MAPS_SNAPSHOT
 
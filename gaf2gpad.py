@@ -29,12 +29,18 @@
 #
 # Usage: 
 # a) gaf2gpad.py --help => to display the program help page
-# b) gaf2gpad.py --gaf=gaf_file [--gpad=gpad_file] [--gpi=gpi_file] [--mgi]
+# b) gaf2gpad.py --gaf=gaf_file [--gpad=gpad_file] [--gpi=gpi_file] [--mgi] [--workers=N]
+#                [--dedup=mode] [--dedup-budget=MB] [--compress=codec] [--level=N] [--decompress=mode]
+#                [--qc-level=level] [--qc-samples=N] [--qc-rejects=file] [--qc-summary=file]
+#                [--incremental] [--delta] [--verify] [--engine=row|columnar]
+#                [--export=parquet|arrow] [--export-only]
+#                [--profile=file] [--profile-mode=cprofile|sample] [--run-report=file.json]
 
 '''
  
 import getopt, sys 
 import goa_parser 
+import goa_io,goa_qc,goa_incremental,goa_export,goa_profile
 import os
 from datetime import datetime
 
@@ -42,7 +48,7 @@ from datetime import datetime
 #gaf2gpad  displays program usage
 #
 def gaf2gpad_usage():
-    print """\
+    print >>sys.stderr, """\
     \n********************************\ngaf2gpad converts a given GAF file to GPAD and GPI files
     \nAssumptions: ftp://ftp.ebi.ac.uk/pub/databases/GO/goa for specs
         1. The order of the first 17/15 fields of a GAF2.0/GAF1.0 file follows goa specs
@@ -50,18 +56,68 @@ def gaf2gpad_usage():
         3. The order of the first 9 fields of  a GPI file follows goa specs
     \nUsage: 
     Example1: gaf2gpad.py --help  => to display this help page
-    Example2: gaf2gpad.py --gaf=gaf_file [--gpad=gpad_file] [--gpi=gpi_file] [--mgi]
+    Example2: gaf2gpad.py --gaf=gaf_file [--gpad=gpad_file] [--gpi=gpi_file] [--mgi] [--workers=N]
+                          [--dedup=mode] [--dedup-budget=MB] [--maps-log=level] [--offline]
+                          [--compress=codec] [--level=N] [--decompress=mode]
+                          [--qc-level=level] [--qc-samples=N] [--qc-rejects=file] [--qc-summary=file]
+                          [--incremental] [--delta] [--verify] [--engine=row|columnar]
+                          [--export=parquet|arrow] [--export-only]
+                          [--profile=file] [--profile-mode=cprofile|sample] [--run-report=file.json]
     Where:
         --gaf  => <required> specifies the name of the gaf file , gaf_file is the full path to the gaf file
+            gzip, bgzip and zstd compressed gaf files are detected automatically
+            the gaf file is read once: use --gaf=- to read it from stdin (or a pipe/fifo)
         --gpad => <optional> specifies the name of the output gpad_file(default gaf_file.gpad)
         --gpi  => <optional> specifies the name of the output gpi_file(default gaf_file.gpi)
+            gpad_file/gpi_file can be - (stdout), a fifo or a file descriptor (/dev/fd/N)
         --mgi  => <optional> if set, the MGI MRK_List2.rpt report in addition
             to the gaf file will be used to generate the gpi file that includes only MGI set
+        --workers => <optional> number of worker processes used to convert the gaf file (default 1)
+        --dedup   => <optional> duplicate rows filter: lines, digest or external (default %s)
+            lines keeps every row, digest keeps a 128-bit digest of every row,
+            external keeps digests in memory up to --dedup-budget then spills them to disk
+        --dedup-budget => <optional> memory budget in MB of the external filter (default %d)
+        --maps-log => <optional> content of log/maps.log: off, summary or full (default %s)
+            summary lists the size of each map, full writes every map entry
+        --offline  => <optional> use the local copies of the dependencies (only missing files are downloaded)
+        --compress => <optional> codec of the gpad and gpi files: none, gzip, bgzip or zstd
+            (default: from the gpad/gpi file extension .gz/.bgz/.zst)
+        --level    => <optional> compression level of the gpad and gpi files (default %d)
+        --decompress => <optional> how a compressed gaf file is decompressed: inline, thread or process
+            thread and process overlap the decompression with the conversion (default %s)
+        --qc-level => <optional> rejected rows written to the log: counts, samples or full (default %s)
+            counts writes none, samples the first --qc-samples rows of each reject category
+        --qc-samples => <optional> number of rejected rows logged per category with --qc-level=samples (default %d)
+        --qc-rejects => <optional> file to write every rejected row to (category<TAB>row)
+        --qc-summary => <optional> file to save the QC summary to: JSON (*.json) or TSV
+        --incremental => <optional> only convert the gaf rows added or changed since the previous
+            --incremental run, the other rows are taken from the sidecar file gpad_file.rows
+        --delta  => <optional> with --incremental, also write the gpad/gpi rows removed (-) and
+            added (+) since the previous run to gpad_file.delta and gpi_file.delta
+        --verify => <optional> check the gpad/gpi files and the QC counts against a full rebuild
+        --engine => <optional> conversion engine: row or columnar (default %s)
+            columnar converts batches of gaf rows column by column, the output is the same
+            (not used with --incremental)
+        --export => <optional> also write the gpad/gpi rows to gpad_file.parquet and gpi_file.parquet
+            (parquet) or gpad_file.arrow and gpi_file.arrow (arrow IPC) - needs the pyarrow module
+            the rows are sorted on GO_ID, DB_Object_ID and Evidence_Code, the header is kept as metadata
+        --export-only => <optional> with --export, do not write the gpad and gpi (TSV) files
+        --profile => <optional> profile the conversion loop and save the profile to the given file
+            (the top functions are also listed in log/gaf2gpad.py.log - worker processes are not profiled)
+        --profile-mode => <optional> cprofile (pstats file) or sample (stack samples) (default %s)
+        --run-report => <optional> file to save the run report to (JSON): seconds, rows and rows/sec
+            of each stage, counters and peak memory - the stage table is always in log/gaf2gpad.py.log
     \nNote: If you do not provide the name of gpad and gpi result files, the program will create
         these two files in the same directory the input gaf file resides
-        with the extension *.gpad and *.gpi respectively
+        with the extension *.gpad and *.gpi respectively (+ the --compress codec extension)
+        --gpad and --gpi are required when the gaf file is read from stdin
+        Progress messages are written to stderr, e.g.:
+            zcat x.gaf.gz | gaf2gpad.py --gaf=- --gpad=- --gpi=/dev/fd/3 3>x.gpi | sort > x.gpad
     \n********************************
-    """
+    """%(goa_parser.config.DEDUP_MODE,goa_parser.config.DEDUP_MEMORY_BUDGET,goa_parser.config.MAPS_LOG_LEVEL,
+         goa_parser.config.OUTPUT_LEVEL,goa_parser.config.DECOMPRESS_MODE,
+         goa_parser.config.QC_LEVEL,goa_parser.config.QC_SAMPLE_CAP,goa_parser.config.ENGINE,
+         goa_parser.config.PROFILE_MODE)
 
 #
 # Main program
@@ -78,14 +134,18 @@ def main():
     log=open(log_file,"w")
     today = datetime.now()
     log.write("Program Starts: "+today.strftime('%Y/%m/%d %I:%M:%S %P'))
-    print "Program Starts: "+today.strftime('%Y/%m/%d %I:%M:%S %P')
+    print >>sys.stderr, "Program Starts: "+today.strftime('%Y/%m/%d %I:%M:%S %P')
     log.write("\n")
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hg:p:i:m", ["help", "gaf=","gpad=","gpi=","mgi"])
+        opts, args = getopt.getopt(sys.argv[1:], "hg:p:i:mw:d:b:l:oz:", ["help", "gaf=","gpad=","gpi=","mgi","workers=",
+                                   "dedup=","dedup-budget=","maps-log=","offline","compress=","level=","decompress=",
+                                   "qc-level=","qc-samples=","qc-rejects=","qc-summary=",
+                                   "incremental","delta","verify","engine=","export=","export-only",
+                                   "profile=","profile-mode=","run-report="])
     except getopt.GetoptError, err:
         # print help information and exit:
         log.write(str(err)) # will print something like "option -a not recognized"
-        print "ERROR:\n"+str(err)  # will print something like "option -a not recognized"
+        print >>sys.stderr, "ERROR:\n"+str(err)  # will print something like "option -a not recognized"
         gaf2gpad_usage()
         sys.exit(2)
     #set program arguments
@@ -93,6 +153,27 @@ def main():
     gpad_file=""
     gpi_file=""
     filter_mgi = False
+    workers=1
+    dedup_mode=goa_parser.config.DEDUP_MODE
+    dedup_budget=goa_parser.config.DEDUP_MEMORY_BUDGET
+    maps_log_level=goa_parser.config.MAPS_LOG_LEVEL
+    offline=goa_parser.config.DEPENDS_OFFLINE
+    output_codec=goa_parser.config.OUTPUT_CODEC
+    output_level=goa_parser.config.OUTPUT_LEVEL
+    decompress=goa_parser.config.DECOMPRESS_MODE
+    qc_level=goa_parser.config.QC_LEVEL
+    qc_sample_cap=goa_parser.config.QC_SAMPLE_CAP
+    qc_rejects=""
+    qc_summary=""
+    incremental=False
+    delta=False
+    verify=False
+    engine=goa_parser.config.ENGINE
+    export_format=""
+    export_only=False
+    profile_file=""
+    profile_mode=goa_parser.config.PROFILE_MODE
+    run_report=""
     for o, a in opts:
         if o in ("-m","--mgi"):filter_mgi = True
         elif o in ("-h", "--help"):
@@ -101,29 +182,143 @@ def main():
         elif o in ("-g", "--gaf"):gaf_file = a
         elif o in ("-p", "--gpad"):gpad_file = a
         elif o in ("-i", "--gpi"):gpi_file = a
+        elif o in ("-w", "--workers"):
+            if not a.isdigit() or int(a) < 1:
+                print >>sys.stderr, "**********\n\nError: --workers must be a positive number - See program usage"
+                gaf2gpad_usage()
+                sys.exit(2)
+            workers = int(a)
+        elif o in ("-d", "--dedup"):
+            if a not in goa_parser.goa_dedup.DEDUP_MODES:
+                print >>sys.stderr, "**********\n\nError: --dedup must be one of: "+", ".join(goa_parser.goa_dedup.DEDUP_MODES)
+                gaf2gpad_usage()
+                sys.exit(2)
+            dedup_mode = a
+        elif o in ("-b", "--dedup-budget"):
+            if not a.isdigit() or int(a) < 1:
+                print >>sys.stderr, "**********\n\nError: --dedup-budget must be a positive number of MB - See program usage"
+                gaf2gpad_usage()
+                sys.exit(2)
+            dedup_budget = int(a)
+        elif o in ("-l", "--maps-log"):
+            if a not in goa_parser.MAPS_LOG_LEVELS:
+                print >>sys.stderr, "**********\n\nError: --maps-log must be one of: "+", ".join(goa_parser.MAPS_LOG_LEVELS)
+                gaf2gpad_usage()
+                sys.exit(2)
+            maps_log_level = a
+        elif o in ("-o", "--offline"):offline = True
+        elif o in ("-z", "--compress"):
+            if a not in goa_io.CODECS:
+                print >>sys.stderr, "**********\n\nError: --compress must be one of: "+", ".join(goa_io.CODECS)
+                gaf2gpad_usage()
+                sys.exit(2)
+            output_codec = a
+        elif o == "--level":
+            if not a.isdigit():
+                print >>sys.stderr, "**********\n\nError: --level must be a number - See program usage"
+                gaf2gpad_usage()
+                sys.exit(2)
+            output_level = int(a)
+        elif o == "--decompress":
+            if a not in goa_io.DECOMPRESS_MODES:
+                print >>sys.stderr, "**********\n\nError: --decompress must be one of: "+", ".join(goa_io.DECOMPRESS_MODES)
+                gaf2gpad_usage()
+                sys.exit(2)
+            decompress = a
+        elif o == "--qc-level":
+            if a not in goa_qc.QC_LEVELS:
+                print >>sys.stderr, "**********\n\nError: --qc-level must be one of: "+", ".join(goa_qc.QC_LEVELS)
+                gaf2gpad_usage()
+                sys.exit(2)
+            qc_level = a
+        elif o == "--qc-samples":
+            if not a.isdigit():
+                print >>sys.stderr, "**********\n\nError: --qc-samples must be a number - See program usage"
+                gaf2gpad_usage()
+                sys.exit(2)
+            qc_sample_cap = int(a)
+        elif o == "--qc-rejects":qc_rejects = a
+        elif o == "--qc-summary":qc_summary = a
+        elif o == "--incremental":incremental = True
+        elif o == "--delta":incremental = delta = True
+        elif o == "--verify":verify = True
+        elif o == "--engine":
+            if a not in goa_parser.config.ENGINES:
+                print >>sys.stderr, "**********\n\nError: --engine must be one of: "+", ".join(goa_parser.config.ENGINES)
+                gaf2gpad_usage()
+                sys.exit(2)
+            engine = a
+        elif o == "--export":
+            if a not in goa_export.EXPORT_FORMATS:
+                print >>sys.stderr, "**********\n\nError: --export must be one of: "+", ".join(goa_export.EXPORT_FORMATS)
+                gaf2gpad_usage()
+                sys.exit(2)
+            export_format = a
+        elif o == "--export-only":export_only = True
+        elif o == "--profile":profile_file = a
+        elif o == "--profile-mode":
+            if a not in goa_parser.config.PROFILE_MODES:
+                print >>sys.stderr, "**********\n\nError: --profile-mode must be one of: "+", ".join(goa_parser.config.PROFILE_MODES)
+                gaf2gpad_usage()
+                sys.exit(2)
+            profile_mode = a
+        elif o == "--run-report":run_report = a
         else:
             assert False, "unhandled option"
    
-    #Check if gaf file exists
-    if not os.path.isfile(gaf_file):
+    #Check if gaf file exists (- is stdin)
+    if gaf_file != "-" and not os.path.exists(gaf_file):
         log.write("**********\n\nError: The gaf file: "+gaf_file+" does not exist - See program usage")
-        print "**********\n\nError: The gaf file: "+gaf_file+" does not exist - See program usage"
+        print >>sys.stderr, "**********\n\nError: The gaf file: "+gaf_file+" does not exist - See program usage"
         gaf2gpad_usage()
         sys.exit() 
-    if gpad_file == "":gpad_file=gaf_file+".gpad"
-    if gpi_file=="":gpi_file=gaf_file+".gpi"
+    if gpad_file == "-" and gpi_file == "-":
+        print >>sys.stderr, "**********\n\nError: --gpad and --gpi cannot both be written to stdout - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
+    if gaf_file == "-" and (gpad_file == "" or gpi_file == ""):
+        print >>sys.stderr, "**********\n\nError: --gpad and --gpi are required with --gaf=- - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
+    if gpad_file == "":gpad_file=goa_io.outputName(gaf_file,".gpad",output_codec)
+    if gpi_file=="":gpi_file=goa_io.outputName(gaf_file,".gpi",output_codec)
+    if incremental and (gpad_file == "-" or gpi_file == "-"):
+        print >>sys.stderr, "**********\n\nError: --incremental needs gpad and gpi files (not stdout) - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
+    if incremental and engine != "row":
+        print >>sys.stderr, "**********\n\nError: --incremental converts the gaf rows with the row engine - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
+    if verify and (gaf_file == "-" or gpad_file == "-" or gpi_file == "-"):
+        print >>sys.stderr, "**********\n\nError: --verify needs gaf, gpad and gpi files (not stdin/stdout) - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
+    if export_format and (gpad_file == "-" or gpi_file == "-"):
+        print >>sys.stderr, "**********\n\nError: --export needs gpad and gpi files (not stdout) - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
+    if export_format and goa_export.pyarrow is None:
+        print >>sys.stderr, "**********\n\nError: --export needs the pyarrow module"
+        sys.exit(2)
+    if export_only and (not export_format or verify):
+        print >>sys.stderr, "**********\n\nError: --export-only needs --export (and no --verify) - See program usage"
+        gaf2gpad_usage()
+        sys.exit(2)
     #
     #Setup the converter log and gaf file process log
     # 
-    gaf_log_file=log_dir+"/"+os.path.basename(gaf_file)+".log"
+    if gaf_file == "-": gaf_log_file=log_dir+"/stdin.log"
+    else: gaf_log_file=log_dir+"/"+os.path.basename(gaf_file)+".log"
     gaf_log=open(gaf_log_file,"w")
+    goa_profile.newRun("gaf2gpad",profile_file,profile_mode)
     log.write("\nInitiating the converter\n") 
-    print "\nInitiating the converter\n" 
+    print >>sys.stderr, "\nInitiating the converter\n" 
     #
     # Create the expected directory structure and
     # downloads dependencies (gaf-eco-map, mrk_list2.rpt) if needed
     #
-    goa_parser.converter_init(log)
+    goa_parser.converter_init(log,maps_log_level,offline)
     #
     #Check if the containers were initiated properly
     #
@@ -135,22 +330,40 @@ def main():
         message="**********\n\nSome ECO Evidence dependencies were not downloaded properly. Check the logs:"
         log.write(message+LOCAL_MGI_GO_ECO_REPORT_FILE+" and "+LOCAL_MAP_FILE+" local files\n")
         sys.exit() 
-    if filter_mgi:gpi_file+=".mgi"
+    if filter_mgi and not goa_io.isStream(gpi_file):
+        #keep the compression extension last (x.gpi.mgi.gz) - stdout, fifo and fd outputs are kept as is
+        gpi_name=goa_io.stripCodecExtension(gpi_file)
+        gpi_file=gpi_name+".mgi"+gpi_file[len(gpi_name):]
     #
     #Process the gaf file and generate coresponding gpad and gpi files
     #
     today = datetime.now()
     gaf_log.write("\nProgram Starts: "+today.strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
     log.write("\nProcessing GAF file :"+gaf_file)
-    print "\nProcessing GAF file :"+gaf_file
+    print >>sys.stderr, "\nProcessing GAF file :"+gaf_file
     gaf_log.write("\nProcessing GAF file :"+gaf_file)
-    goa_parser.generateGpiGpad(gaf_file,gpad_file,gpi_file,gaf_log,filter_mgi)
+    qc=goa_qc.QcLog(gaf_log,qc_level,qc_sample_cap,qc_rejects,qc_summary)
+    row_cache=None
+    if incremental: row_cache=goa_incremental.RowCache(goa_incremental.sidecarName(gpad_file),delta)
+    goa_parser.generateGpiGpad(gaf_file,gpad_file,gpi_file,gaf_log,filter_mgi,workers,dedup_mode,dedup_budget,
+                               output_codec,output_level,decompress,qc,row_cache,engine,
+                               export_format,export_only)
+    qc.close()
+    verified=True
+    if verify:
+        print >>sys.stderr, "\nVerifying against a full rebuild"
+        verified=goa_parser.verifyGpiGpad(gaf_file,gpad_file,gpi_file,gaf_log,filter_mgi,qc,
+                                          dedup_mode,dedup_budget,decompress)
+        if not verified: print >>sys.stderr, "Verification failed - see "+gaf_log_file
+    goa_profile.run.report(log)
+    goa_profile.run.save(run_report)
     today = datetime.now()
     log.write("\nProgram Ends: "+today.strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
     gaf_log.write("\nProgram Ends: "+today.strftime('%Y/%m/%d %I:%M:%S %P')+"\n") 
-    print "Program Complete\n"
+    print >>sys.stderr, "Program Complete\n"
     log.close()
     gaf_log.close()
+    if not verified: sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_batch converts many GAF files to GPAD/GPI files in one run.
+#
+# The converter is initiated once (dependencies, GO_REF/ECO maps) then
+# the GAF files listed in the manifest are converted by a pool of
+# worker processes (--workers, default config.BATCH_WORKERS) forked
+# after the maps are loaded, so every file uses the same maps without
+# parsing them again.
+#
+# Manifest: one GAF file per line, tab delimited, # lines are comments
+#   gaf_file[<TAB>gpad_file[<TAB>gpi_file[<TAB>mgi]]]
+# Empty gpad/gpi fields default to gaf_file.gpad and gaf_file.gpi
+# (+ the --compress codec extension), mgi is the gaf2gpad.py --mgi option.
+# Relative paths are relative to the manifest directory.
+#
+# Logs (under log/):
+#   goa_batch.py.log -> status of every file and the aggregated QC summary
+#   gaf_file.log     -> the log of each GAF file (same as gaf2gpad.py)
+# --qc-summary=file.json|file.tsv saves the aggregated QC summary.
+#
+# Usage: goa_batch.py --manifest=file [--workers=N] [--dedup=mode] [--dedup-budget=MB]
+#        [--maps-log=level] [--offline] [--compress=codec] [--level=N] [--decompress=mode]
+#        [--qc-level=level] [--qc-samples=N] [--qc-summary=file]
+#
+'''
+
+import getopt,sys,os
+import multiprocessing
+import timeit,traceback
+from datetime import datetime
+import goa_parser
+import goa_io,goa_qc,goa_specs
+import config
+
+#
+# Reads the manifest
+# Returns a list of (gaf_file,gpad_file,gpi_file,filtermgi)
+# Raises ValueError on a bad line
+#
+def loadManifest(manifest_file,output_codec=None):
+    base_dir=os.path.dirname(os.path.abspath(manifest_file))
+    entries=[]
+    outputs={}
+    line_number=0
+    for line in open(manifest_file):
+        line_number+=1
+        line=line.rstrip("\r\n")
+        if not line.strip() or line.startswith("#"): continue
+        fields=[field.strip() for field in line.split("\t")]
+        if len(fields) > 4:
+            raise ValueError("%s line %d: expected at most 4 fields, found %d"%(manifest_file,line_number,len(fields)))
+        fields+=[""]*(4-len(fields))
+        gaf_file,gpad_file,gpi_file,option=fields
+        if option not in ("","mgi"):
+            raise ValueError("%s line %d: unknown option %s (expected mgi)"%(manifest_file,line_number,option))
+        if "-" in (gaf_file,gpad_file,gpi_file):
+            raise ValueError("%s line %d: stdin/stdout (-) is not supported in a batch"%(manifest_file,line_number))
+        gaf_file=os.path.join(base_dir,gaf_file)
+        if gpad_file: gpad_file=os.path.join(base_dir,gpad_file)
+        else: gpad_file=goa_io.outputName(gaf_file,".gpad",output_codec)
+        if gpi_file: gpi_file=os.path.join(base_dir,gpi_file)
+        else: gpi_file=goa_io.outputName(gaf_file,".gpi",output_codec)
+        filtermgi=option == "mgi"
+        if filtermgi:
+            #keep the compression extension last (x.gpi.mgi.gz)
+            gpi_name=goa_io.stripCodecExtension(gpi_file)
+            gpi_file=gpi_name+".mgi"+gpi_file[len(gpi_name):]
+        for output in (gpad_file,gpi_file):
+            if output in outputs:
+                raise ValueError("%s line %d: %s is also written by line %d"%(manifest_file,line_number,
+                                 output,outputs[output]))
+            outputs[output]=line_number
+        entries.append((gaf_file,gpad_file,gpi_file,filtermgi))
+    return entries
+
+#
+# Returns the log file of each gaf file: log_dir/gaf_file.log
+# (log_dir/gaf_file.N.log when two gaf files have the same name)
+#
+def batchLog_files(entries,log_dir):
+    log_files=[]
+    used=set()
+    for i in range(len(entries)):
+        name=os.path.basename(entries[i][0])
+        if name in used: name+=".%d"%(i+1)
+        used.add(name)
+        log_files.append(os.path.join(log_dir,name+".log"))
+    return log_files
+
+#
+# Converts one gaf file in a worker process
+# Returns (index,status,message,seconds,qc_counters,qc_categories,qc_counts,
+#          qc_samples,cache_hits,cache_misses)
+#
+def convertBatch_entry(task):
+    index,gaf_file,gpad_file,gpi_file,filtermgi,log_file,options=task
+    start=timeit.default_timer()
+    cache_hits=goa_specs.eco_code_cache.hits
+    cache_misses=goa_specs.eco_code_cache.misses
+    gaf_log=open(log_file,"w")
+    gaf_log.write("\nProgram Starts: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    gaf_log.write("\nProcessing GAF file :"+gaf_file)
+    qc=goa_qc.QcLog(gaf_log,options["qc_level"],options["qc_sample_cap"])
+    status="ok"
+    message=""
+    try:
+        goa_parser.generateGpiGpad(gaf_file,gpad_file,gpi_file,gaf_log,filtermgi,1,options["dedup_mode"],
+                                   options["dedup_budget"],options["output_codec"],options["output_level"],
+                                   options["decompress"],qc)
+    except Exception, e:
+        status="failed"
+        message=traceback.format_exc().strip().split("\n")[-1]
+        gaf_log.write("\n**********\n\nError: conversion failed\n"+traceback.format_exc())
+    qc.close()
+    gaf_log.write("\nProgram Ends: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    gaf_log.close()
+    return (index,status,message,timeit.default_timer()-start,qc.counters,qc.categories,qc.counts,
+            qc.samples,goa_specs.eco_code_cache.hits-cache_hits,goa_specs.eco_code_cache.misses-cache_misses)
+
+#
+# Converts the manifest entries with a pool of worker processes
+# The status of every file and the aggregated QC summary (qc) are written to log
+# Returns the number of files that failed
+#
+def convertBatch(entries,log,log_files,workers,options,qc):
+    tasks=[]
+    for i in range(len(entries)):
+        gaf_file,gpad_file,gpi_file,filtermgi=entries[i]
+        tasks.append((i,gaf_file,gpad_file,gpi_file,filtermgi,log_files[i],options))
+    #the workers are forked with the maps loaded and without maps.log:
+    #the eco cache statistics of every file are reported once below
+    goa_parser.waitMaps_log()
+    map_log=goa_parser.map_log
+    if map_log is not None: map_log.flush()
+    log.flush()
+    goa_parser.map_log=None
+    results=[None]*len(tasks)
+    pool=multiprocessing.Pool(max(1,min(workers,len(tasks))))
+    try:
+        done=0
+        for result in pool.imap_unordered(convertBatch_entry,tasks):
+            results[result[0]]=result
+            done+=1
+            print >>sys.stderr, "%d of %d gaf files processed - %s: %s"%(done,len(tasks),
+                                os.path.basename(entries[result[0]][0]),result[1])
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        goa_parser.map_log=map_log
+    pool.join()
+    #aggregate in manifest order
+    failed=0
+    counters=[]
+    counter_totals={}
+    log.write("\n***************\nBatch files\n***************\n")
+    log.write("gaf_file\tstatus\tseconds\trows\trejects\tlog_file\n")
+    for i in range(len(results)):
+        index,status,message,seconds,qc_counters,qc_categories,qc_counts,qc_samples=results[i][0:8]
+        cache_hits,cache_misses=results[i][8:10]
+        goa_specs.eco_code_cache.hits+=cache_hits
+        goa_specs.eco_code_cache.misses+=cache_misses
+        rows=0
+        for name,count in qc_counters:
+            if name == "row_count": rows=count
+        if status == "ok":
+            for name,count in qc_counters:
+                if name not in counter_totals:
+                    counters.append(name)
+                    counter_totals[name]=0
+                counter_totals[name]+=count
+            qc.addCounts(qc_counts,qc_categories)
+            qc.addSamples(qc_samples)
+        else:
+            #a failed file is left out of the QC summary
+            failed+=1
+            status+=" ("+message+")"
+        log.write("%s\t%s\t%.1f\t%d\t%d\t%s\n"%(entries[i][0],status,seconds,rows,sum(qc_counts.values()),
+                                                 log_files[i]))
+    qc.report(log,"GAF to GPAD/GPI - %d files, %d failed"%(len(results),failed),
+              [(name,counter_totals[name]) for name in counters])
+    goa_parser.reportEco_cache()
+    return failed
+
+#
+#goa_batch usage
+#
+def batch_usage():
+    print """\
+    \n********************************\ngoa_batch converts the GAF files listed in a manifest to GPAD and GPI files
+    \nUsage: goa_batch.py --manifest=file [--workers=N] [--dedup=mode] [--dedup-budget=MB]
+                          [--maps-log=level] [--offline] [--compress=codec] [--level=N] [--decompress=mode]
+                          [--qc-level=level] [--qc-samples=N] [--qc-summary=file]
+    Where:
+       --manifest => <required> one gaf file per line (tab delimited, # lines are comments):
+            gaf_file[<TAB>gpad_file[<TAB>gpi_file[<TAB>mgi]]]
+            empty gpad/gpi fields default to gaf_file.gpad and gaf_file.gpi, mgi is the gaf2gpad.py --mgi option
+            relative paths are relative to the manifest directory
+       --workers => <optional> number of gaf files converted at the same time (default %d)
+       --dedup, --dedup-budget, --maps-log, --offline, --compress, --level, --decompress,
+       --qc-level, --qc-samples => <optional> same as gaf2gpad.py, for every gaf file
+       --qc-summary => <optional> file to save the aggregated QC summary to: JSON (*.json) or TSV
+    \nLogs: %s/goa_batch.py.log (status of every file and the aggregated QC summary)
+          and one gaf_file.log per gaf file
+    \n********************************
+    """%(config.BATCH_WORKERS,goa_parser.GAF_CONVERTER_LOG_BASE)
+
+def usageError(message):
+    print "**********\n\nError: "+message+" - See program usage"
+    batch_usage()
+    sys.exit(2)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hf:w:d:b:l:oz:", ["help","manifest=","workers=","dedup=",
+                                   "dedup-budget=","maps-log=","offline","compress=","level=","decompress=",
+                                   "qc-level=","qc-samples=","qc-summary="])
+    except getopt.GetoptError, err:
+        print "ERROR:\n"+str(err)
+        batch_usage()
+        sys.exit(2)
+    manifest_file=""
+    workers=config.BATCH_WORKERS
+    maps_log_level=config.MAPS_LOG_LEVEL
+    offline=config.DEPENDS_OFFLINE
+    qc_summary=""
+    options={"dedup_mode":config.DEDUP_MODE,"dedup_budget":config.DEDUP_MEMORY_BUDGET,
+             "output_codec":config.OUTPUT_CODEC,"output_level":config.OUTPUT_LEVEL,
+             "decompress":config.DECOMPRESS_MODE,"qc_level":config.QC_LEVEL,"qc_sample_cap":config.QC_SAMPLE_CAP}
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            batch_usage()
+            sys.exit()
+        elif o in ("-f", "--manifest"):manifest_file = a
+        elif o in ("-w", "--workers"):
+            if not a.isdigit() or int(a) < 1: usageError("--workers must be a positive number")
+            workers = int(a)
+        elif o in ("-d", "--dedup"):
+            if a not in goa_parser.goa_dedup.DEDUP_MODES:
+                usageError("--dedup must be one of: "+", ".join(goa_parser.goa_dedup.DEDUP_MODES))
+            options["dedup_mode"] = a
+        elif o in ("-b", "--dedup-budget"):
+            if not a.isdigit() or int(a) < 1: usageError("--dedup-budget must be a positive number of MB")
+            options["dedup_budget"] = int(a)
+        elif o in ("-l", "--maps-log"):
+            if a not in goa_parser.MAPS_LOG_LEVELS:
+                usageError("--maps-log must be one of: "+", ".join(goa_parser.MAPS_LOG_LEVELS))
+            maps_log_level = a
+        elif o in ("-o", "--offline"):offline = True
+        elif o in ("-z", "--compress"):
+            if a not in goa_io.CODECS: usageError("--compress must be one of: "+", ".join(goa_io.CODECS))
+            options["output_codec"] = a
+        elif o == "--level":
+            if not a.isdigit(): usageError("--level must be a number")
+            options["output_level"] = int(a)
+        elif o == "--decompress":
+            if a not in goa_io.DECOMPRESS_MODES:
+                usageError("--decompress must be one of: "+", ".join(goa_io.DECOMPRESS_MODES))
+            options["decompress"] = a
+        elif o == "--qc-level":
+            if a not in goa_qc.QC_LEVELS: usageError("--qc-level must be one of: "+", ".join(goa_qc.QC_LEVELS))
+            options["qc_level"] = a
+        elif o == "--qc-samples":
+            if not a.isdigit(): usageError("--qc-samples must be a number")
+            options["qc_sample_cap"] = int(a)
+        elif o == "--qc-summary":qc_summary = a
+        else:
+            assert False, "unhandled option"
+    if not manifest_file or not os.path.isfile(manifest_file):
+        usageError("The manifest file: "+manifest_file+" does not exist")
+    try:
+        entries=loadManifest(manifest_file,options["output_codec"])
+    except ValueError, e:
+        usageError(str(e))
+    for entry in entries:
+        if not os.path.exists(entry[0]): usageError("The gaf file: "+entry[0]+" does not exist")
+    if not entries: usageError("The manifest file: "+manifest_file+" lists no gaf file")
+    log_dir=goa_parser.GAF_CONVERTER_LOG_BASE
+    if not os.path.isdir(log_dir): os.makedirs(log_dir)
+    if not os.path.isdir(goa_parser.GAF_CONVERTER_DATA_BASE): os.makedirs(goa_parser.GAF_CONVERTER_DATA_BASE)
+    log=open(log_dir+"/"+os.path.basename(sys.argv[0])+".log","w")
+    log.write("Program Starts: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    print >>sys.stderr, "Program Starts: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')
+    log.write("\nManifest: %s (%d gaf files, %d workers)\n"%(manifest_file,len(entries),workers))
+    log.write("\nInitiating the converter\n")
+    print >>sys.stderr, "\nInitiating the converter\n"
+    goa_parser.converter_init(log,maps_log_level,offline)
+    if goa_parser.empty_goref_containers()>0:
+        log.write("**********\n\nSome GO Ontology dependencies were not downloaded properly. Check the logs: "+
+                  config.LOCAL_GO_REF_FILE+" and "+config.LOCAL_GO_REPORT_FILE+" local files\n")
+        sys.exit(1)
+    if goa_parser.empty_eco_containers()>0:
+        log.write("**********\n\nSome ECO Evidence dependencies were not downloaded properly. Check the logs: "+
+                  config.LOCAL_MGI_GO_ECO_REPORT_FILE+" and "+config.LOCAL_MAP_FILE+" local files\n")
+        sys.exit(1)
+    qc=goa_qc.QcLog(log,options["qc_level"],options["qc_sample_cap"],None,qc_summary)
+    qc.declare(goa_qc.GAF_CATEGORIES)
+    failed=convertBatch(entries,log,batchLog_files(entries,log_dir),workers,options,qc)
+    qc.close()
+    log.write("\nProgram Ends: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    log.close()
+    print >>sys.stderr, "Program Complete - %d of %d gaf files failed\n"%(failed,len(entries))
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_dedup provides the duplicate row filters used by the converters
+# to display each gpad/gpi row only once.
+#
+# Filter modes:
+#  lines    -> stores every displayed row (exact, uses the most memory)
+#  digest   -> stores the 128-bit md5 digest of every displayed row (default)
+#  external -> stores digests in memory up to a memory budget, then spills
+#              them to sorted fixed-width run files searched on disk
+#
+# All filters have the same interface:
+#   row_filter.add(row) -> True if the row was not seen before
+#   row_filter.report(log,label) -> writes memory use and hit counts
+#   row_filter.close() -> removes any spill file
+#
+'''
+
+import os,sys,heapq,mmap
+import tempfile,shutil
+import hashlib
+import config
+
+DEDUP_MODES=["lines","digest","external"]
+DIGEST_SIZE=16
+#
+#Maximum number of run files kept by the external filter before merging them
+#
+MAX_RUNS=8
+
+#
+# Exact filter - keeps every displayed row in memory
+#
+class LineFilter:
+    mode="lines"
+
+    def __init__(self):
+        self.rows={}
+        self.hits=0
+
+    def add(self,row):
+        if row in self.rows:
+            self.hits+=1
+            return False
+        self.rows[row]=1
+        return True
+
+    def entries(self):
+        return len(self.rows)
+
+    def memory(self):
+        total=sys.getsizeof(self.rows)
+        for row in self.rows: total+=sys.getsizeof(row)
+        return total
+
+    def disk(self):
+        return 0
+
+    def report(self,log,label):
+        log.write("\n%s duplicate filter (%s): rows kept: %d; duplicate rows filtered: %d; memory: %d KB; disk: %d KB"
+                  %(label,self.mode,self.entries(),self.hits,self.memory()/1024,self.disk()/1024))
+
+    def close(self):
+        self.rows={}
+
+#
+# Digest filter - keeps the fixed-width md5 digest of every displayed row
+#
+class DigestFilter(LineFilter):
+    mode="digest"
+
+    def __init__(self):
+        self.digests=set()
+        self.hits=0
+
+    def add(self,row):
+        digest=hashlib.md5(row).digest()
+        if digest in self.digests:
+            self.hits+=1
+            return False
+        self.digests.add(digest)
+        return True
+
+    def entries(self):
+        return len(self.digests)
+
+    def memory(self):
+        return sys.getsizeof(self.digests)+len(self.digests)*sys.getsizeof("x"*DIGEST_SIZE)
+
+    def close(self):
+        self.digests=set()
+
+#
+# Sorted run of digests stored on disk as fixed-width records
+#
+class DigestRun:
+    def __init__(self,run_file):
+        self.run_file=run_file
+        self.size=os.path.getsize(run_file)
+        self.count=self.size/DIGEST_SIZE
+        self.fh=open(run_file,"rb")
+        self.map=mmap.mmap(self.fh.fileno(),0,access=mmap.ACCESS_READ)
+
+    #binary search of the digest in the run
+    def contains(self,digest):
+        lo=0
+        hi=self.count
+        while lo < hi:
+            mid=(lo+hi)/2
+            offset=mid*DIGEST_SIZE
+            value=self.map[offset:offset+DIGEST_SIZE]
+            if value < digest: lo=mid+1
+            elif value > digest: hi=mid
+            else: return True
+        return False
+
+    def records(self):
+        for i in range(self.count):
+            offset=i*DIGEST_SIZE
+            yield self.map[offset:offset+DIGEST_SIZE]
+
+    def close(self):
+        self.map.close()
+        self.fh.close()
+        os.remove(self.run_file)
+
+#
+# External filter - digests are kept in memory until the memory budget
+# is reached, then spilled to sorted run files searched with binary search
+#
+class ExternalDigestFilter(DigestFilter):
+    mode="external"
+
+    def __init__(self,budget_mb=None,tmp_dir=None):
+        DigestFilter.__init__(self)
+        if not budget_mb: budget_mb=config.DEDUP_MEMORY_BUDGET
+        entry_size=sys.getsizeof("x"*DIGEST_SIZE)+DIGEST_SIZE*2
+        self.max_entries=max(1,int(budget_mb*1024*1024/entry_size))
+        self.work_dir=tempfile.mkdtemp(prefix="goa_dedup.",dir=tmp_dir)
+        self.runs=[]
+        self.spills=0
+
+    def add(self,row):
+        digest=hashlib.md5(row).digest()
+        if digest in self.digests:
+            self.hits+=1
+            return False
+        for run in self.runs:
+            if run.contains(digest):
+                self.hits+=1
+                return False
+        self.digests.add(digest)
+        if len(self.digests)>=self.max_entries: self._spill()
+        return True
+
+    #write the in-memory digests as a new sorted run
+    def _spill(self):
+        run_file=os.path.join(self.work_dir,"run.%d"%(self.spills))
+        rfh=open(run_file,"wb")
+        rfh.write("".join(sorted(self.digests)))
+        rfh.close()
+        self.runs.append(DigestRun(run_file))
+        self.digests=set()
+        self.spills+=1
+        if len(self.runs)>MAX_RUNS: self._merge()
+
+    #merge all runs into a single sorted run
+    def _merge(self):
+        run_file=os.path.join(self.work_dir,"merge.%d"%(self.spills))
+        rfh=open(run_file,"wb")
+        for digest in heapq.merge(*[run.records() for run in self.runs]):
+            rfh.write(digest)
+        rfh.close()
+        for run in self.runs: run.close()
+        self.runs=[DigestRun(run_file)]
+
+    def entries(self):
+        total=len(self.digests)
+        for run in self.runs: total+=run.count
+        return total
+
+    def memory(self):
+        return sys.getsizeof(self.digests)+len(self.digests)*sys.getsizeof("x"*DIGEST_SIZE)
+
+    def disk(self):
+        total=0
+        for run in self.runs: total+=run.size
+        return total
+
+    def close(self):
+        for run in self.runs: run.close()
+        self.runs=[]
+        self.digests=set()
+        if os.path.isdir(self.work_dir):
+            shutil.rmtree(self.work_dir,True)
+
+#
+# Returns a new duplicate row filter
+# mode: lines, digest or external (default config.DEDUP_MODE)
+# budget_mb: memory budget of the external filter (default config.DEDUP_MEMORY_BUDGET)
+#
+def newRowFilter(mode=None,budget_mb=None,tmp_dir=None):
+    if not mode: mode=config.DEDUP_MODE
+    if mode == "lines": return LineFilter()
+    elif mode == "digest": return DigestFilter()
+    elif mode == "external": return ExternalDigestFilter(budget_mb,tmp_dir)
+    raise ValueError("Unknown duplicate filter mode: %s (expected one of %s)"%(mode,"|".join(DEDUP_MODES)))
+
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_depends refreshes the local index files (config.REMOTE_INDEX)
+# used by the converters.
+#
+# A local file is refreshed when it is missing or when the time elapsed
+# since it was last fetched or verified is over its config.UPDATE_INDEX
+# entry (days). All the files due are fetched concurrently
+# (one thread per file) with conditional requests (If-None-Match with
+# the last ETag, If-Modified-Since with the last Last-Modified header or
+# the local mtime). A file that comes back with the same md5 is not
+# replaced - only its check time is updated. New content is written to a
+# temp file in the data directory then renamed over the local file, so
+# a failed download never leaves a partial file behind. The MGI
+# GO_eco_association report is stored as the table of its distinct
+# evidence code/reference/ECO code triples while it is downloaded.
+#
+# The url, validators, md5, fetch time and last check time of every
+# file are kept in the dependency manifest (config.LOCAL_DEPENDS_MANIFEST_FILE).
+#
+# Offline mode (config.DEPENDS_OFFLINE or --offline) never refreshes a
+# file that exists locally - only missing files are fetched.
+#
+# The remote hosts can be replaced by a mirror (config.DEPENDS_MIRROR
+# or --mirror): a directory or a base url holding files with the same
+# names as the remote files.
+#
+# Usage: goa_depends.py [--force] [--offline] [--mirror=dir_or_url]
+#
+'''
+
+import os,sys,getopt,time
+import tempfile,threading,socket
+import urllib,urllib2
+import hashlib,json
+from email.utils import formatdate
+import goa_specs,config
+
+BLOCK_SIZE=1024*1024
+DAY_SECONDS=24*60*60
+
+#
+#Local files that are transformed while downloaded
+#mgi_eco: only the distinct (evidenceCode, mgiRef, ecoCode) triples are kept
+#(the table loaded by goa_specs.Eco)
+#A transform raises ValueError when the content is not valid: the fetch fails
+#and the local file is kept
+#
+POST_PROCESS={config.LOCAL_MGI_GO_ECO_REPORT_FILE:goa_specs.mgiEco_table}
+
+def readBlocks(response):
+    while True:
+        block=response.read(BLOCK_SIZE)
+        if not block: break
+        yield block
+
+#
+# Returns the md5 of a local file
+#
+def fileDigest(local_file):
+    digest=hashlib.md5()
+    lfh=open(local_file,"rb")
+    for block in readBlocks(lfh): digest.update(block)
+    lfh.close()
+    return digest.hexdigest()
+
+#
+# Returns the time (seconds) elapsed since the local file was last
+# fetched or verified - the file mtime when it is not in the manifest
+#
+def dependencyAge(local_file,entry,now=None):
+    if now is None: now=time.time()
+    checked_at=entry.get("checked_at") or os.path.getmtime(local_file)
+    return now - checked_at
+
+#
+# True if the local file is older than its update index (days)
+#
+def isExpired(local_file,update_days,entry={},now=None):
+    return dependencyAge(local_file,entry,now) > update_days*DAY_SECONDS
+
+#
+# Returns the url to fetch - mirror replaces the remote host and path
+#
+def remoteUrl(remote_url,mirror=""):
+    if mirror: remote_url=mirror.rstrip("/")+"/"+os.path.basename(remote_url)
+    if "://" not in remote_url:
+        remote_url="file://"+urllib.pathname2url(os.path.abspath(remote_url))
+    return remote_url
+
+#
+# Manifest: local file -> {url,etag,last_modified,md5,fetched_at,checked_at}
+#
+def loadManifest(manifest_file=None):
+    if not manifest_file: manifest_file=config.LOCAL_DEPENDS_MANIFEST_FILE
+    if not os.path.isfile(manifest_file): return {}
+    try:
+        mfh=open(manifest_file)
+        manifest=json.load(mfh)
+        mfh.close()
+    except (IOError,ValueError):
+        return {}
+    entries={}
+    for local_file in manifest:
+        entries[str(local_file)]=dict([(str(key),value) for (key,value) in manifest[local_file].items()])
+    return entries
+
+def saveManifest(manifest,manifest_file=None):
+    if not manifest_file: manifest_file=config.LOCAL_DEPENDS_MANIFEST_FILE
+    (fd,tmp_file)=tempfile.mkstemp(prefix=".depends.",dir=os.path.dirname(manifest_file))
+    mfh=os.fdopen(fd,"w")
+    json.dump(manifest,mfh,indent=1,sort_keys=True)
+    mfh.close()
+    umask=os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_file,0666 & ~umask)
+    os.rename(tmp_file,manifest_file)
+
+#
+# Returns a copy of the manifest entry of a file verified up to date
+#
+def checkedEntry(entry,url):
+    checked=dict(entry)
+    checked["url"]=url
+    checked["checked_at"]=time.time()
+    return checked
+
+#
+# Fetches one dependency
+# Returns (status,manifest entry,message)
+# status: fetched, unchanged, not modified or failed
+#
+def fetchDependency(local_file,url,entry,file_mode=0644):
+    request=urllib2.Request(url)
+    if os.path.isfile(local_file):
+        if entry.get("etag"): request.add_header("If-None-Match",entry["etag"])
+        last_modified=entry.get("last_modified") or formatdate(os.path.getmtime(local_file),usegmt=True)
+        request.add_header("If-Modified-Since",last_modified)
+    try:
+        response=urllib2.urlopen(request,timeout=config.DEPENDS_TIMEOUT)
+    except urllib2.HTTPError, e:
+        if e.code == 304 and os.path.isfile(local_file):
+            return ("not modified",checkedEntry(entry,url),"")
+        return ("failed",entry,str(e))
+    except (urllib2.URLError,IOError,OSError,socket.error), e:
+        return ("failed",entry,str(e))
+    (fd,tmp_file)=tempfile.mkstemp(prefix="."+os.path.basename(local_file)+".",
+                                   dir=os.path.dirname(local_file))
+    try:
+        tfh=os.fdopen(fd,"wb")
+        digest=hashlib.md5()
+        size=0
+        transform=POST_PROCESS.get(local_file,readBlocks)
+        for block in transform(response):
+            tfh.write(block)
+            digest.update(block)
+            size+=len(block)
+        tfh.close()
+        headers=response.info()
+        response.close()
+        if size == 0:
+            os.remove(tmp_file)
+            return ("failed",entry,"empty response")
+        now=time.time()
+        new_entry={"url":url,"etag":headers.getheader("ETag",""),
+                   "last_modified":headers.getheader("Last-Modified",""),"md5":digest.hexdigest(),
+                   "fetched_at":now,"checked_at":now}
+        if os.path.isfile(local_file) and fileDigest(local_file) == new_entry["md5"]:
+            os.remove(tmp_file)
+            if "fetched_at" in entry: new_entry["fetched_at"]=entry["fetched_at"]
+            return ("unchanged",new_entry,"")
+        os.chmod(tmp_file,file_mode)
+        os.rename(tmp_file,local_file)
+        return ("fetched",new_entry,"%d bytes"%(size))
+    except (IOError,OSError,socket.error,ValueError), e:
+        if os.path.isfile(tmp_file): os.remove(tmp_file)
+        return ("failed",entry,str(e))
+
+#
+# Refreshes the local files that are missing or expired
+# force: refresh every file regardless of its age
+# offline: only fetch the files missing locally
+# Returns the number of files that could not be refreshed
+#
+def fetchDepends(log,mirror=None,force=False,offline=None):
+    if mirror is None: mirror=config.DEPENDS_MIRROR
+    if offline is None: offline=config.DEPENDS_OFFLINE
+    manifest=loadManifest()
+    umask=os.umask(0)
+    os.umask(umask)
+    now=time.time()
+    jobs=[]
+    for local_file in sorted(config.REMOTE_INDEX):
+        if os.path.isfile(local_file):
+            if offline: continue
+            if not force:
+                entry=manifest.get(local_file,{})
+                if not isExpired(local_file,config.UPDATE_INDEX.get(local_file,0),entry,now): continue
+        jobs.append((local_file,remoteUrl(config.REMOTE_INDEX[local_file],mirror)))
+    if not jobs: return 0
+    results={}
+    def fetch(local_file,url):
+        results[local_file]=fetchDependency(local_file,url,manifest.get(local_file,{}),0666 & ~umask)
+    threads=[threading.Thread(target=fetch,args=job) for job in jobs]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    failed=0
+    for (local_file,url) in jobs:
+        (status,entry,message)=results[local_file]
+        if status == "failed": failed+=1
+        if entry: manifest[local_file]=entry
+        log.write("Dependency %s (%s): %s %s\n"%(os.path.basename(local_file),url,status,message))
+    saveManifest(manifest)
+    return failed
+
+#
+#goa_depends usage
+#
+def depends_usage():
+    print """\
+    \n********************************\ngoa_depends refreshes the converter dependencies under %s
+    \nUsage: goa_depends.py [--force] [--offline] [--mirror=dir_or_url]
+    Where:
+       --force  => <optional> refresh every dependency regardless of its age
+       --offline => <optional> only fetch the dependencies missing locally
+       --mirror => <optional> directory or base url used instead of the remote hosts
+    \n********************************
+    """%(config.GAF_CONVERTER_DATA_BASE)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hfom:", ["help","force","offline","mirror="])
+    except getopt.GetoptError, err:
+        print "ERROR:\n"+str(err)
+        depends_usage()
+        sys.exit(2)
+    force=False
+    offline=None
+    mirror=None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            depends_usage()
+            sys.exit()
+        elif o in ("-f", "--force"):force = True
+        elif o in ("-o", "--offline"):offline = True
+        elif o in ("-m", "--mirror"):mirror = a
+        else:
+            assert False, "unhandled option"
+    if not os.path.isdir(config.GAF_CONVERTER_DATA_BASE): os.makedirs(config.GAF_CONVERTER_DATA_BASE)
+    failed=fetchDepends(sys.stdout,mirror,force,offline)
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
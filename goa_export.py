@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_export writes the gpad, gpi and gaf rows of the converters to a
+# columnar binary file - Parquet or Arrow IPC - next to the TSV file
+# (gpad_file.parquet, gpad_file.arrow) or instead of it, so the analytics
+# jobs read typed columns instead of parsing the TSV file again.
+#
+# ExportWriter stands in for the TSV output file: it gets the same
+# writes (and passes them to the TSV file unless the export replaces it).
+#   columns: one string column per field, named with the goa_specs
+#            *_FIELDS_LABEL labels
+#   metadata: the converter header lines (displayGFile_header) under
+#             goa.header, the file type and the sort order
+#   rows: sorted on GO_ID, DB_Object_ID and Evidence_Code (the fields
+#         of the file in this order) with goa_sort, then written in row
+#         groups (record batches) of config.EXPORT_ROW_GROUP_ROWS rows,
+#         so the min/max statistics of each row group let readers skip
+#         the row groups of the other GO_IDs/objects
+# Parquet columns are dictionary encoded by the Parquet writer. Arrow
+# columns are dictionary arrays sharing one dictionary per column for
+# the whole file (the distinct values of each column are kept in memory).
+#
+# Needs the pyarrow module (optional - only the --export option uses it).
+#
+'''
+
+import os
+import goa_sort,goa_io,config
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow=None
+
+EXPORT_FORMATS=["parquet","arrow"]
+EXPORT_EXTENSIONS={"parquet":".parquet","arrow":".arrow"}
+#predicate pushdown fields - rows are sorted on the fields of the file in this order
+SORT_FIELDS=["GO_ID","DB_Object_ID","Evidence_Code"]
+
+#
+# Returns the export file name of a gpad/gpi/gaf file
+# (the compression extension is dropped: x.gpad.gz -> x.gpad.parquet)
+#
+def exportName(gf_file,export_format):
+    return goa_io.stripCodecExtension(gf_file)+EXPORT_EXTENSIONS[export_format]
+
+#
+# Opens a converter output file
+# export_format: None (the TSV file only), parquet or arrow
+# export_only: the export file replaces the TSV file
+# g_fields/g_labels: the fields of the file and their column names
+# Returns a goa_io output file or an ExportWriter
+#
+def openOutput(gf_file,output_codec,output_level,export_format,export_only,gf_type,g_fields,g_labels,tmp_dir=None):
+    if not export_format: return goa_io.openOutput(gf_file,output_codec,output_level)
+    output=None
+    if not export_only: output=goa_io.openOutput(gf_file,output_codec,output_level)
+    if tmp_dir is None: tmp_dir=goa_io.workDir(gf_file)
+    return ExportWriter(exportName(gf_file,export_format),export_format,gf_type,g_fields,g_labels,
+                        output,tmp_dir)
+
+#
+# Output file that writes the rows to an export file (and to the TSV output file if set)
+#
+class ExportWriter:
+    def __init__(self,export_file,export_format,gf_type,g_fields,g_labels,output=None,tmp_dir=None,
+                 row_group_rows=None):
+        if pyarrow is None:
+            raise IOError("%s export needs the pyarrow module: %s"%(export_format,export_file))
+        self.export_file=export_file
+        self.export_format=export_format
+        self.gf_type=gf_type
+        self.columns=[g_labels[field] for field in g_fields]
+        self.sort_indexes=[g_fields.index(field) for field in SORT_FIELDS if field in g_fields]
+        self.output=output
+        self.name=export_file
+        if output is not None: self.name=output.name
+        self.row_group_rows=row_group_rows or config.EXPORT_ROW_GROUP_ROWS
+        self.sorter=goa_sort.ExternalSort(tmp_dir)
+        self.header=[]
+        self.pending=""
+        self.rows=0
+
+    def write(self,data):
+        if self.output is not None: self.output.write(data)
+        lines=(self.pending+data).split("\n")
+        self.pending=lines.pop()
+        for line in lines: self.addLine(line)
+
+    def flush(self):
+        if self.output is not None: self.output.flush()
+
+    #
+    # Keeps a header line or adds a row to the sorter (sort fields first)
+    #
+    def addLine(self,line):
+        if line.startswith("!"):
+            if not self.rows: self.header.append(line)
+            return
+        if not line: return
+        fields=line.split("\t")
+        keys=[fields[i] for i in self.sort_indexes if i < len(fields)]
+        keys+=[""]*(len(self.sort_indexes)-len(keys))
+        self.sorter.add(goa_sort.escapeRecord("\t".join(keys+[line])))
+        self.rows+=1
+
+    #
+    # Returns the rows (lists of fields) in sort order
+    #
+    def sortedRows(self):
+        width=len(self.columns)
+        key_count=len(self.sort_indexes)
+        for record in goa_sort.readRecords(self.sorter.sortedFile()):
+            fields=goa_sort.unescapeRecord(record).split("\t")[key_count:]
+            if len(fields) != width: fields=(fields+[""]*width)[:width]
+            yield fields
+
+    #
+    # Returns the row groups: lists of columns of up to row_group_rows rows
+    #
+    def rowGroups(self):
+        group=[]
+        for fields in self.sortedRows():
+            group.append(fields)
+            if len(group) >= self.row_group_rows:
+                yield zip(*group)
+                group=[]
+        if group: yield zip(*group)
+
+    def metadata(self):
+        return {"goa.header":"\n".join(self.header),"goa.file_type":self.gf_type,
+                "goa.sort":",".join([self.columns[i] for i in self.sort_indexes])}
+
+    def emptyTable(self):
+        arrays=[pyarrow.array([],type=pyarrow.string()) for column in self.columns]
+        return pyarrow.Table.from_arrays(arrays,self.columns).replace_schema_metadata(self.metadata())
+
+    def writeParquet(self,export_file):
+        writer=None
+        try:
+            for group in self.rowGroups():
+                arrays=[pyarrow.array(column,type=pyarrow.string()) for column in group]
+                table=pyarrow.Table.from_arrays(arrays,self.columns).replace_schema_metadata(self.metadata())
+                if writer is None:
+                    writer=pyarrow.parquet.ParquetWriter(export_file,table.schema,use_dictionary=True)
+                writer.write_table(table,row_group_size=self.row_group_rows)
+            if writer is None:
+                table=self.emptyTable()
+                writer=pyarrow.parquet.ParquetWriter(export_file,table.schema,use_dictionary=True)
+                writer.write_table(table)
+        finally:
+            if writer is not None: writer.close()
+
+    def writeArrow(self,export_file):
+        #one dictionary per column for the whole file (the Arrow file format
+        #has no dictionary replacement between record batches)
+        values=[set() for column in self.columns]
+        for fields in self.sortedRows():
+            for i in range(len(fields)): values[i].add(fields[i])
+        dictionaries=[]
+        codes=[]
+        for column_values in values:
+            column_values=sorted(column_values)
+            dictionaries.append(pyarrow.array(column_values,type=pyarrow.string()))
+            codes.append(dict(zip(column_values,range(len(column_values)))))
+        values=None
+        sink=pyarrow.OSFile(export_file,"wb")
+        writer=None
+        try:
+            for group in self.rowGroups():
+                arrays=[]
+                for i in range(len(group)):
+                    indices=pyarrow.array(map(codes[i].__getitem__,group[i]),type=pyarrow.int32())
+                    arrays.append(pyarrow.DictionaryArray.from_arrays(indices,dictionaries[i]))
+                table=pyarrow.Table.from_arrays(arrays,self.columns).replace_schema_metadata(self.metadata())
+                if writer is None: writer=pyarrow.RecordBatchFileWriter(sink,table.schema)
+                writer.write_table(table)
+            if writer is None:
+                table=self.emptyTable()
+                writer=pyarrow.RecordBatchFileWriter(sink,table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None: writer.close()
+            sink.close()
+
+    #
+    # Closes the TSV output file and writes the export file
+    # (written to a temp file renamed into place)
+    #
+    def close(self):
+        if self.output is not None: self.output.close()
+        if self.pending: self.addLine(self.pending)
+        self.pending=""
+        tmp_file=self.export_file+".tmp"
+        try:
+            if self.export_format == "parquet": self.writeParquet(tmp_file)
+            else: self.writeArrow(tmp_file)
+            os.rename(tmp_file,self.export_file)
+        finally:
+            self.sorter.close()
+            if os.path.isfile(tmp_file): os.remove(tmp_file)
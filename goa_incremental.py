@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_incremental keeps the conversion of every GAF row of the last
+# gaf2gpad.py --incremental run in a sidecar file next to the GPAD file
+# (gpad_file.rows), so the next run only converts the rows that were
+# added or changed since - the other rows are taken from the sidecar.
+#
+# Every row still goes through the duplicate filters, the feature type
+# and protein tallies in file order, and rejected rows are converted
+# again on every run, so the outputs and the QC summary are the same as
+# a full rebuild (gaf2gpad.py --verify checks it).
+#
+# The sidecar is only used when it was written for the same GAF version,
+# the same --mgi option and the same map source files (md5) - and by the
+# same SIDECAR_VERSION of the row conversion. Otherwise every row is
+# converted and a new sidecar is written.
+#
+# Sidecar file layout:
+#   header line: GOA-ROWS-SIDECAR <sidecar version> <python version>
+#   marshal record 1: the signature (gaf version, mgi, map source files md5)
+#   marshal record 2: (gpad lines,gpi lines) - the distinct lines in output order
+#   marshal record 3: row digest -> (gpad line index,gpi line index,feature type,
+#                                    protein,protein object id,empty protein)
+#
+# The line tables are the previous GPAD/GPI rows, so the run can also
+# write delta files (--delta): the rows removed (-) and added (+) since
+# the previous run (the GPI delta is not written with --mgi).
+#
+'''
+
+import os,sys,marshal
+import tempfile,hashlib
+import goa_io
+
+#
+#Bump when the conversion of a GAF row changes
+#
+SIDECAR_VERSION=1
+SIDECAR_MAGIC="GOA-ROWS-SIDECAR"
+
+def sidecarHeader():
+    return "%s %d %d.%d\n"%(SIDECAR_MAGIC,SIDECAR_VERSION,sys.version_info[0],sys.version_info[1])
+
+#
+# Returns the sidecar/delta file names of a gpad/gpi file
+# (the compression extension is dropped: x.gpad.gz -> x.gpad.rows)
+#
+def sidecarName(gpad_file):
+    return goa_io.stripCodecExtension(gpad_file)+".rows"
+
+def deltaName(gp_file):
+    return goa_io.stripCodecExtension(gp_file)+".delta"
+
+#
+# Returns the key of a GAF row (list of fields)
+#
+def rowKey(fields):
+    return hashlib.md5("\0".join(fields)).digest()
+
+#
+# Duplicate filter stand-in that keeps the row instead of writing it
+# (gets the gpad/gpi line of one converted GAF row)
+#
+class RowCapture:
+    def __init__(self):
+        self.line=None
+
+    def add(self,row):
+        self.line=row
+        return False
+
+#
+# Rows of the previous run (loaded from the sidecar) and of this run
+#
+class RowCache:
+    def __init__(self,sidecar_file,delta=False):
+        self.sidecar_file=sidecar_file
+        self.delta=delta
+        self.signature=None
+        self.status="no sidecar"
+        #previous run
+        self.rows={}
+        self.gpad_lines=[]
+        self.gpi_lines=[]
+        #this run
+        self.new_rows={}
+        self.new_gpad=[]
+        self.new_gpi=[]
+        self.gpad_index={}
+        self.gpi_index={}
+        self.reused=0
+        self.converted=0
+
+    #
+    # Loads the sidecar - its rows are only used if it has the same signature
+    #
+    def load(self,signature):
+        self.signature=signature
+        if not os.path.isfile(self.sidecar_file): return
+        try:
+            sfh=open(self.sidecar_file,"rb")
+            if sfh.readline() != sidecarHeader():
+                sfh.close()
+                self.status="sidecar from another version - ignored"
+                return
+            previous=marshal.load(sfh)
+            (self.gpad_lines,self.gpi_lines)=marshal.load(sfh)
+            if previous != signature:
+                sfh.close()
+                self.status="sidecar out of date (GAF version, --mgi or map source files changed)"
+                return
+            self.rows=marshal.load(sfh)
+            sfh.close()
+        except (IOError,OSError,EOFError,ValueError,TypeError):
+            self.rows={}
+            self.gpad_lines=[]
+            self.gpi_lines=[]
+            self.status="sidecar unreadable - ignored"
+            return
+        self.status="sidecar loaded: %d rows"%(len(self.rows))
+
+    #
+    # Returns the conversion of a row of the previous run or None:
+    # (gpad line,gpi line,feature type,protein,protein object id,empty protein)
+    #
+    def get(self,key):
+        row=self.rows.get(key)
+        if row is None: return None
+        gpad_index,gpi_index,feature_type,protein,object_id,empty_protein=row
+        gpi_line=None
+        if gpi_index >= 0: gpi_line=self.gpi_lines[gpi_index]
+        return (self.gpad_lines[gpad_index],gpi_line,feature_type,protein,object_id,empty_protein)
+
+    def _lineIndex(self,line,lines,index):
+        if line is None: return -1
+        i=index.get(line)
+        if i is None:
+            i=len(lines)
+            lines.append(line)
+            index[line]=i
+        return i
+
+    #keeps the conversion of a row of this run
+    def put(self,key,row):
+        gpad_line,gpi_line,feature_type,protein,object_id,empty_protein=row
+        self.new_rows[key]=(self._lineIndex(gpad_line,self.new_gpad,self.gpad_index),
+                            self._lineIndex(gpi_line,self.new_gpi,self.gpi_index),
+                            feature_type,protein,object_id,empty_protein)
+
+    #
+    # Writes the sidecar of this run - the file is replaced atomically
+    # Returns False if the sidecar could not be written
+    #
+    def save(self):
+        sidecar_dir=os.path.dirname(os.path.abspath(self.sidecar_file))
+        try:
+            (fd,tmp_file)=tempfile.mkstemp(prefix=".rows.",dir=sidecar_dir)
+            sfh=os.fdopen(fd,"wb")
+            sfh.write(sidecarHeader())
+            marshal.dump(self.signature,sfh)
+            marshal.dump((self.new_gpad,self.new_gpi),sfh)
+            marshal.dump(self.new_rows,sfh)
+            sfh.close()
+            os.rename(tmp_file,self.sidecar_file)
+        except (IOError,OSError,ValueError):
+            if "tmp_file" in locals() and os.path.isfile(tmp_file): os.remove(tmp_file)
+            return False
+        return True
+
+    #
+    # Writes the rows removed (-<TAB>row) and added (+<TAB>row) since the previous run
+    # Returns (added,removed)
+    #
+    def writeDelta(self,delta_file,old_lines,new_lines):
+        old=set(old_lines)
+        new=set(new_lines)
+        added=0
+        removed=0
+        dfh=open(delta_file,"w")
+        for line in old_lines:
+            if line not in new:
+                dfh.write("-\t"+line+"\n")
+                removed+=1
+        for line in new_lines:
+            if line not in old:
+                dfh.write("+\t"+line+"\n")
+                added+=1
+        dfh.close()
+        return (added,removed)
+
+    #
+    # Saves the sidecar, writes the delta files if set and the
+    # incremental conversion tally to log
+    #
+    def finish(self,log,gpad_file,gpi_file,filtermgi):
+        log.write("\n***************\nIncremental conversion\n***************\n")
+        log.write("Previous run: %s\n"%(self.status))
+        log.write("Rows reused: %d\nRows converted: %d\n"%(self.reused,self.converted))
+        if self.save(): log.write("Sidecar saved: %s (%d rows)\n"%(self.sidecar_file,len(self.new_rows)))
+        else: log.write("Sidecar could not be saved: %s\n"%(self.sidecar_file))
+        if not self.delta: return
+        deltas=[(gpad_file,"GPAD",self.gpad_lines,self.new_gpad)]
+        if not filtermgi: deltas.append((gpi_file,"GPI",self.gpi_lines,self.new_gpi))
+        for gp_file,label,old_lines,new_lines in deltas:
+            delta_file=deltaName(gp_file)
+            (added,removed)=self.writeDelta(delta_file,old_lines,new_lines)
+            log.write("%s delta: %d rows added, %d rows removed - %s\n"%(label,added,removed,delta_file))
+
+#
+# Compares two gpad/gpi files, the !Date header lines excepted
+# Returns the number of the first line that differs (0 if the files are the same)
+#
+def compareOutputs(file_a,file_b):
+    afh=goa_io.openInput(file_a)
+    bfh=goa_io.openInput(file_b)
+    line_number=0
+    try:
+        while True:
+            line_a=afh.readline()
+            line_b=bfh.readline()
+            line_number+=1
+            if line_a == line_b:
+                if not line_a: return 0
+                continue
+            if line_a.startswith("!Date:") and line_b.startswith("!Date:"): continue
+            return line_number
+    finally:
+        afh.close()
+        bfh.close()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_index builds on-disk offset indexes of GAF, GPAD and GPI files to
+# get the rows of one DB:DB_Object_ID or one GO_ID without reading the
+# whole file.
+#
+# Index keys (field positions from goa_specs):
+#   object -> DB:DB_Object_ID (gaf, gpad and gpi files)
+#   go     -> GO_ID           (gaf and gpad files)
+#
+# Index file (data_file.key.idx):
+#   header line: GOA-INDEX <index version> <file type> <key> <data file size> <data file mtime>
+#   records: fixed-width (8-byte key hash, 8-byte row offset) sorted on
+#            the hash then the offset
+# The records are sorted with goa_sort (bounded memory), so the index of
+# a multi-GB file takes 16 bytes per row on disk. A lookup is a binary
+# search of the key hash in the mmapped records, then a seek to each
+# matching row (rows of another key with the same hash are skipped).
+# The rows come back in file order.
+#
+# The index is out of date when the data file size or mtime changed -
+# lookups then rebuild it (API: openIndex(..,build=True)).
+# Compressed data files cannot be indexed (decompress them first).
+#
+# Usage: goa_index.py --file=data_file [--key=object|go] [--type=gaf|gpad|gpi]
+#        [--build] [--lookup=key ...] [--tmpdir=dir]
+#
+'''
+
+import getopt,sys,os
+import mmap,struct,hashlib
+import goa_specs,goa_sort,goa_io
+
+INDEX_VERSION=1
+INDEX_MAGIC="GOA-INDEX"
+RECORD_SIZE=16
+HASH_SIZE=8
+FILE_TYPES=["gaf","gpad","gpi"]
+INDEX_KEYS=["object","go"]
+
+#
+# Key fields of each file type: key -> fields joined with ":"
+#
+KEY_FIELDS={"gpad":{"object":(goa_specs.gpad_db_index,goa_specs.gpad_db_object_index),
+                    "go":(goa_specs.gpad_goid_index,)},
+            "gpi":{"object":(goa_specs.gpi_db_index,goa_specs.gpi_db_object_index)}}
+for gaf_type,gaf_fields in (("gaf1",goa_specs.GAF1_FIELDS),("gaf",goa_specs.GAF_FIELDS)):
+    KEY_FIELDS[gaf_type]={"object":(gaf_fields.index("DB"),gaf_fields.index("DB_Object_ID")),
+                          "go":(gaf_fields.index("GO_ID"),)}
+
+def indexName(data_file,key):
+    return "%s.%s.idx"%(data_file,key)
+
+def keyHash(key):
+    return hashlib.md5(key).digest()[:HASH_SIZE]
+
+#
+# Returns the key of a row (None for a short row)
+#
+def rowKey(fields,key_fields):
+    if len(fields) <= max(key_fields): return None
+    return ":".join([fields[i] for i in key_fields])
+
+#
+# Returns the file type of a data file from its version header line
+# (gaf1 for a GAF 1.x file) or None
+#
+def detectType(data_file):
+    dfh=open(data_file,"rb")
+    try:
+        for line in dfh:
+            if not line.startswith("!"): return None
+            for file_type in FILE_TYPES:
+                if line.startswith("!%s-version:"%(file_type)):
+                    if file_type == "gaf" and "1." in line.split(":",1)[1]: return "gaf1"
+                    return file_type
+    finally:
+        dfh.close()
+    return None
+
+def indexHeader(file_type,key,data_file):
+    stat=os.stat(data_file)
+    return "%s %d %s %s %d %r\n"%(INDEX_MAGIC,INDEX_VERSION,file_type,key,stat.st_size,stat.st_mtime)
+
+#
+# Builds the index of one key of a data file
+# file_type: gaf, gaf1, gpad or gpi (default: from the data file header)
+# Returns the index file
+#
+def buildIndex(data_file,key,index_file=None,file_type=None,tmp_dir=None):
+    if not goa_io.isPlainFile(data_file):
+        raise ValueError("%s: only plain (not compressed) regular files can be indexed"%(data_file))
+    if file_type is None: file_type=detectType(data_file)
+    if file_type is None:
+        raise ValueError("%s: unknown file type (no gaf/gpad/gpi-version header) - set the file type"%(data_file))
+    if file_type == "gaf" and detectType(data_file) == "gaf1": file_type="gaf1"
+    if key not in KEY_FIELDS[file_type]:
+        raise ValueError("%s files have no %s key"%(file_type.rstrip("1"),key))
+    if index_file is None: index_file=indexName(data_file,key)
+    if tmp_dir is None: tmp_dir=os.path.dirname(os.path.abspath(index_file))
+    key_fields=KEY_FIELDS[file_type][key]
+    header=indexHeader(file_type,key,data_file)
+    sorter=goa_sort.ExternalSort(tmp_dir)
+    try:
+        dfh=open(data_file,"rb")
+        offset=0
+        for line in dfh:
+            row_offset=offset
+            offset+=len(line)
+            if line.startswith("!"): continue
+            row_key=rowKey(line.rstrip("\r\n").split("\t"),key_fields)
+            if row_key is None: continue
+            sorter.add(keyHash(row_key).encode("hex")+"%016x"%(row_offset))
+        dfh.close()
+        tmp_file=index_file+".tmp"
+        ifh=open(tmp_file,"wb")
+        ifh.write(header)
+        for record in sorter.sorted(): ifh.write(record.decode("hex"))
+        ifh.close()
+        os.rename(tmp_file,index_file)
+    finally:
+        sorter.close()
+    return index_file
+
+#
+# Offset index of a data file
+#   index.lookup(key) -> rows (no newline) of the key in file order
+#
+class GoaIndex:
+    def __init__(self,data_file,key,index_file=None):
+        if index_file is None: index_file=indexName(data_file,key)
+        self.data_file=data_file
+        self.key=key
+        self.index_file=index_file
+        self.ifh=open(index_file,"rb")
+        fields=self.ifh.readline().split()
+        if len(fields) != 6 or fields[0] != INDEX_MAGIC or fields[1] != str(INDEX_VERSION) or fields[3] != key:
+            self.ifh.close()
+            raise ValueError("%s: not a %s index of version %d"%(index_file,key,INDEX_VERSION))
+        self.file_type=fields[2]
+        self.key_fields=KEY_FIELDS[self.file_type][key]
+        self.base=self.ifh.tell()
+        stat=os.stat(data_file)
+        if int(fields[4]) != stat.st_size or float(fields[5]) != stat.st_mtime:
+            self.ifh.close()
+            raise ValueError("%s: out of date with %s"%(index_file,data_file))
+        self.count=(os.path.getsize(index_file)-self.base)/RECORD_SIZE
+        self.map=mmap.mmap(self.ifh.fileno(),0,access=mmap.ACCESS_READ)
+        self.dfh=open(data_file,"rb")
+
+    def _hash(self,i):
+        offset=self.base+i*RECORD_SIZE
+        return self.map[offset:offset+HASH_SIZE]
+
+    #
+    # Returns the offsets of the rows with the key hash (binary search)
+    #
+    def offsets(self,key):
+        target=keyHash(key)
+        lo=0
+        hi=self.count
+        while lo < hi:
+            mid=(lo+hi)/2
+            if self._hash(mid) < target: lo=mid+1
+            else: hi=mid
+        offsets=[]
+        while lo < self.count and self._hash(lo) == target:
+            offset=self.base+lo*RECORD_SIZE+HASH_SIZE
+            offsets.append(struct.unpack(">Q",self.map[offset:offset+8])[0])
+            lo+=1
+        return offsets
+
+    #
+    # Returns the rows of the key in file order
+    #
+    def lookup(self,key):
+        rows=[]
+        for offset in self.offsets(key):
+            self.dfh.seek(offset)
+            row=self.dfh.readline().rstrip("\r\n")
+            if rowKey(row.split("\t"),self.key_fields) == key: rows.append(row)
+        return rows
+
+    def close(self):
+        self.map.close()
+        self.ifh.close()
+        self.dfh.close()
+
+#
+# Opens the index of a key of a data file
+# build: (re)builds the index when it is missing or out of date
+#
+def openIndex(data_file,key,build=True,file_type=None,tmp_dir=None):
+    index_file=indexName(data_file,key)
+    if os.path.isfile(index_file):
+        try:
+            return GoaIndex(data_file,key,index_file)
+        except ValueError:
+            if not build: raise
+    elif not build:
+        raise ValueError("%s: no %s index"%(data_file,key))
+    buildIndex(data_file,key,index_file,file_type,tmp_dir)
+    return GoaIndex(data_file,key,index_file)
+
+#
+#goa_index usage
+#
+def index_usage():
+    print >>sys.stderr, """\
+    \n********************************\ngoa_index looks up the rows of an object or a GO_ID in a GAF, GPAD or GPI file
+    \nUsage: goa_index.py --file=data_file [--key=object|go] [--type=gaf|gpad|gpi] [--build]
+                          [--lookup=key ...] [--tmpdir=dir]
+    Where:
+       --file   => <required> gaf, gpad or gpi file (plain text)
+       --key    => <optional> object (DB:DB_Object_ID - default) or go (GO_ID)
+       --type   => <optional> file type (default: from the file version header)
+       --build  => <optional> (re)build the index data_file.key.idx
+       --lookup => <optional> key to look up, e.g. MGI:MGI:87853 or GO:0005634 (repeatable)
+            the rows are written to stdout - a missing or out of date index is built first
+       --tmpdir => <optional> directory of the sort spill files (default: the index directory)
+    \n********************************
+    """
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hf:k:t:bl:", ["help","file=","key=","type=","build",
+                                   "lookup=","tmpdir="])
+    except getopt.GetoptError, err:
+        print >>sys.stderr, "ERROR:\n"+str(err)
+        index_usage()
+        sys.exit(2)
+    data_file=""
+    key="object"
+    file_type=None
+    build=False
+    lookups=[]
+    tmp_dir=None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            index_usage()
+            sys.exit()
+        elif o in ("-f", "--file"):data_file = a
+        elif o in ("-k", "--key"):key = a
+        elif o in ("-t", "--type"):file_type = a
+        elif o in ("-b", "--build"):build = True
+        elif o in ("-l", "--lookup"):lookups.append(a)
+        elif o == "--tmpdir":tmp_dir = a
+        else:
+            assert False, "unhandled option"
+    if not data_file or not os.path.isfile(data_file):
+        print >>sys.stderr, "**********\n\nError: The data file: "+data_file+" does not exist - See program usage"
+        index_usage()
+        sys.exit(2)
+    if key not in INDEX_KEYS or (file_type is not None and file_type not in FILE_TYPES):
+        print >>sys.stderr, "**********\n\nError: --key must be one of: %s and --type one of: %s - See program usage"%(
+              ", ".join(INDEX_KEYS),", ".join(FILE_TYPES))
+        index_usage()
+        sys.exit(2)
+    if not build and not lookups:
+        print >>sys.stderr, "**********\n\nError: nothing to do (--build or --lookup) - See program usage"
+        index_usage()
+        sys.exit(2)
+    try:
+        if build:
+            index_file=buildIndex(data_file,key,None,file_type,tmp_dir)
+            print >>sys.stderr, "Index built: "+index_file
+        if lookups:
+            index=openIndex(data_file,key,True,file_type,tmp_dir)
+            for lookup_key in lookups:
+                for row in index.lookup(lookup_key): print row
+            index.close()
+    except ValueError, e:
+        print >>sys.stderr, "Error: "+str(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
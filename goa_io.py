@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_io opens the converters input and output files with transparent
+# compression.
+#
+# Input codecs are detected from the first bytes of the file:
+#   gzip  -> 1f 8b (multi-member files are read to the end)
+#   bgzip -> gzip with a BC extra subfield (BGZF blocks)
+#   zstd  -> 28 b5 2f fd
+#   none  -> anything else
+# Compressed input is decompressed as it is read, in one of the
+# decompression modes (config.DECOMPRESS_MODE or --decompress):
+#   inline  -> in the reading thread
+#   thread  -> in a separate thread (zlib releases the GIL) feeding a bounded queue
+#   process -> by a gzip/zstd child process feeding a pipe
+# Compressed readers are line iterators that support readline() and
+# seek(0) (the file is decompressed again from the start).
+#
+# Inputs that are not regular files (- for stdin, pipes, fifos) are read
+# once: the codec is detected from the first bytes kept in memory and
+# the reader cannot be rewound.
+#
+# Outputs can be - (stdout), fifos or file descriptors (/dev/fd/N) -
+# workDir() then returns the system temp directory for the spill files.
+#
+# Output codecs: none, gzip, bgzip (BGZF blocks + EOF block, readable
+# by gzip and indexable by bgzip tools) and zstd. The codec is given
+# explicitly or taken from the file extension (.gz/.bgz/.zst).
+#
+# zstd uses the zstandard module when installed, otherwise the zstd
+# command line tool.
+#
+# TabReader splits the rows of the GO TSV files (gaf, gpad, gpi, MGI
+# reports) into fields: the input is read in blocks and split on \n and
+# \t only. GO files are not quoted - a " is a plain character (the csv
+# excel-tab dialect reads a field that starts with " across tabs and
+# lines). Comment lines (!) are not split.
+#
+'''
+
+import os,sys,stat,struct
+import tempfile
+import zlib,gzip
+import threading,Queue
+import subprocess
+import cStringIO
+import config
+
+CODECS=["none","gzip","bgzip","zstd"]
+DECOMPRESS_MODES=["inline","thread","process"]
+CODEC_EXTENSIONS={"gzip":".gz","bgzip":".gz","zstd":".zst"}
+BLOCK_SIZE=1024*1024
+QUEUE_BLOCKS=16
+
+GZIP_MAGIC="\x1f\x8b"
+ZSTD_MAGIC="\x28\xb5\x2f\xfd"
+#
+#BGZF: gzip member with FEXTRA, subfield BC holding the block size - 1
+#
+BGZF_HEADER="\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+BGZF_EOF=("\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00"
+          "\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+BGZF_BLOCK_DATA=65280
+
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+
+MAGIC_SIZE=18
+
+#
+# Returns the codec of the first bytes of a file
+#
+def magicCodec(magic):
+    if magic.startswith(GZIP_MAGIC):
+        if len(magic) >= 14 and ord(magic[3]) & 4 and magic[12:14] == "BC": return "bgzip"
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC): return "zstd"
+    return "none"
+
+#
+# Returns the codec of a file from its first bytes
+#
+def detectCodec(path):
+    fh=open(path,"rb")
+    magic=fh.read(MAGIC_SIZE)
+    fh.close()
+    return magicCodec(magic)
+
+#
+# True if the input is a plain (uncompressed) regular file - the only
+# inputs that can be read by byte ranges
+#
+def isPlainFile(path):
+    return path != "-" and os.path.isfile(path) and detectCodec(path) == "none"
+
+#
+# Returns the output codec of a file name (from its extension)
+#
+def codecFromName(path):
+    if path.endswith(".bgz"): return "bgzip"
+    if path.endswith(".gz"): return "gzip"
+    if path.endswith(".zst"): return "zstd"
+    return "none"
+
+#
+# Removes the compression extension of a file name (x.gaf.gz -> x.gaf)
+#
+def stripCodecExtension(path):
+    for ext in (".gz",".bgz",".zst"):
+        if path.endswith(ext): return path[:-len(ext)]
+    return path
+
+#
+# Binary stream of an input whose first bytes were already read
+# to detect its codec
+#
+class PeekedStream:
+    def __init__(self,fh,head):
+        self.fh=fh
+        self.head=head
+        self.name=getattr(fh,"name","<stream>")
+
+    def read(self,size=-1):
+        if not self.head: return self.fh.read(size)
+        if size < 0: size=len(self.head)
+        data=self.head[:size]
+        self.head=self.head[size:]
+        return data
+
+    def close(self):
+        if self.fh is not sys.stdin: self.fh.close()
+
+#
+# Blocks of a binary stream
+#
+def readBlocks(fh):
+    while True:
+        data=fh.read(BLOCK_SIZE)
+        if not data: break
+        yield data
+
+#
+# Decompressed blocks of a gzip/bgzip stream (all members)
+#
+def gzipBlocks(fh):
+    inflater=zlib.decompressobj(16+zlib.MAX_WBITS)
+    for data in readBlocks(fh):
+        while data:
+            block=inflater.decompress(data)
+            if block: yield block
+            data=inflater.unused_data
+            if data: inflater=zlib.decompressobj(16+zlib.MAX_WBITS)
+    block=inflater.flush()
+    if block: yield block
+
+def zstdBlocks(fh):
+    for block in zstandard.ZstdDecompressor().read_to_iter(fh,read_size=BLOCK_SIZE):
+        if block: yield block
+
+def inlineBlocks(fh,codec):
+    if codec == "none": return readBlocks(fh)
+    if codec in ("gzip","bgzip"): return gzipBlocks(fh)
+    if zstandard is None: return processBlocks(fh,codec)
+    return zstdBlocks(fh)
+
+#
+# Decompressed blocks read from a gzip/zstd child process
+# A regular file is the child stdin, other streams are fed by a thread
+#
+def processBlocks(fh,codec):
+    if codec == "zstd": command=["zstd","-dcq"]
+    else: command=["gzip","-dc"]
+    if isinstance(fh,file): stdin=fh
+    else: stdin=subprocess.PIPE
+    try:
+        proc=subprocess.Popen(command,stdin=stdin,stdout=subprocess.PIPE,bufsize=BLOCK_SIZE)
+    except OSError, e:
+        if codec == "zstd": raise IOError("zstd input needs the zstandard module or the zstd tool: %s"%(e))
+        return threadBlocks(fh,codec)
+    if stdin == subprocess.PIPE:
+        feeder=threading.Thread(target=feedPipe,args=(fh,proc.stdin))
+        feeder.daemon=True
+        feeder.start()
+    return pipeBlocks(proc,getattr(fh,"name","<stream>"))
+
+def feedPipe(fh,pipe):
+    try:
+        for data in readBlocks(fh): pipe.write(data)
+    except IOError:
+        pass #the child process was stopped
+    finally:
+        try: pipe.close()
+        except IOError: pass
+
+def pipeBlocks(proc,name):
+    try:
+        while True:
+            block=proc.stdout.read(BLOCK_SIZE)
+            if not block: break
+            yield block
+    finally:
+        if proc.poll() is None: proc.kill()
+        proc.stdout.close()
+        status=proc.wait()
+    if status > 0: raise IOError("decompression of %s failed (exit status %d)"%(name,status))
+
+#
+# Decompressed blocks produced by a separate thread
+#
+def threadBlocks(fh,codec):
+    queue=Queue.Queue(QUEUE_BLOCKS)
+    stop=threading.Event()
+    def produce():
+        try:
+            for block in inlineBlocks(fh,codec):
+                if stop.is_set(): return
+                queue.put(("block",block))
+            queue.put(("end",None))
+        except Exception, e:
+            queue.put(("error",e))
+    producer=threading.Thread(target=produce)
+    producer.daemon=True
+    producer.start()
+    try:
+        while True:
+            kind,value=queue.get()
+            if kind == "end": break
+            if kind == "error": raise value
+            yield value
+    finally:
+        stop.set()
+        while producer.is_alive():
+            try: queue.get(True,0.1)
+            except Queue.Empty: pass
+
+def decompressBlocks(fh,codec,decompress):
+    if codec == "none": return readBlocks(fh)
+    if decompress == "thread": return threadBlocks(fh,codec)
+    if decompress == "process": return processBlocks(fh,codec)
+    return inlineBlocks(fh,codec)
+
+#
+# Line reader of a compressed file or of a stream - decompressed blocks are
+# split into lines with a cStringIO buffer (lines split on \n only, like a file)
+# stream: the open (peeked) stream of an input that is not a regular file
+#
+class CompressedInput:
+    def __init__(self,path,codec,decompress,stream=None):
+        self.name=path
+        self.codec=codec
+        self.decompress=decompress
+        self.closed=False
+        self.blocks=None
+        self.fh=stream
+        self.rewindable=stream is None
+        self._open()
+
+    def _open(self):
+        if self.rewindable: self.fh=open(self.name,"rb")
+        self.blocks=decompressBlocks(self.fh,self.codec,self.decompress)
+        self.lines=cStringIO.StringIO("")
+        self.pending=""
+
+    #loads the next complete lines in the buffer - False at the end of the file
+    def _fill(self):
+        if self.blocks is None: return False
+        for block in self.blocks:
+            data=self.pending+block
+            cut=data.rfind("\n")+1
+            if cut == 0:
+                self.pending=data
+                continue
+            self.lines=cStringIO.StringIO(data[:cut])
+            self.pending=data[cut:]
+            return True
+        self.blocks=None
+        if not self.pending: return False
+        self.lines=cStringIO.StringIO(self.pending)
+        self.pending=""
+        return True
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line=self.lines.readline()
+        if not line:
+            if not self._fill(): raise StopIteration
+            line=self.lines.readline()
+        return line
+
+    def readline(self):
+        try:
+            return self.next()
+        except StopIteration:
+            return ""
+
+    def read(self):
+        return "".join(self)
+
+    #the rest of the input as blocks of text (not split on lines)
+    def iterBlocks(self):
+        rest=self.lines.read()
+        if rest: yield rest
+        if self.pending: yield self.pending
+        self.pending=""
+        if self.blocks is not None:
+            for block in self.blocks: yield block
+        self.blocks=None
+
+    #only rewinding is supported: decompression starts again
+    def seek(self,offset,whence=0):
+        if offset != 0 or whence != 0: raise IOError("compressed input %s can only be rewound"%(self.name))
+        if not self.rewindable: raise IOError("input %s is a stream and cannot be rewound"%(self.name))
+        self._close_blocks()
+        self._open()
+
+    def _close_blocks(self):
+        if self.blocks is not None and hasattr(self.blocks,"close"): self.blocks.close()
+        self.blocks=None
+        if self.fh is not None: self.fh.close()
+        self.fh=None
+
+    def close(self):
+        self._close_blocks()
+        self.closed=True
+
+#
+# Returns the blocks of text of an input: a plain file is read in BLOCK_SIZE
+# blocks, a reader with iterBlocks() (CompressedInput, GFileReader) gives its
+# blocks, any other iterable (lines) is used as is
+#
+def inputBlocks(source):
+    if hasattr(source,"iterBlocks"): return source.iterBlocks()
+    if isinstance(source,file): return readBlocks(source)
+    return source
+
+#
+# Rows of a GO TSV file as lists of fields
+# Lines are split on \n (a trailing \r is dropped) and fields on \t only
+# Comment lines (!) are not split: they come as a one field row [line], or
+# are skipped with skip_comments - comments counts them in both cases
+# The source is read once: every iteration resumes from the last row read
+# (the rows can be taken by batches with itertools.islice)
+#
+class TabReader:
+    def __init__(self,source,skip_comments=False):
+        self.source=source
+        self.skip_comments=skip_comments
+        self.comments=0
+        self.rows=None
+
+    def __iter__(self):
+        if self.rows is None: self.rows=self.iterRows()
+        return self.rows
+
+    def iterRows(self):
+        pending=""
+        for block in inputBlocks(self.source):
+            data=pending+block
+            lines=data.split("\n")
+            pending=lines.pop()
+            if "\r" in data: lines=[line.rstrip("\r") for line in lines]
+            #comment lines are looked for only in the blocks that may have one
+            if "!" not in data:
+                for line in lines: yield line.split("\t")
+                continue
+            for line in lines:
+                if line[:1] == "!":
+                    self.comments+=1
+                    if not self.skip_comments: yield [line]
+                else: yield line.split("\t")
+        if not pending: return
+        pending=pending.rstrip("\r")
+        if pending[:1] == "!":
+            self.comments+=1
+            if not self.skip_comments: yield [pending]
+        else: yield pending.split("\t")
+
+#
+# Opens a converter input file - plain regular files are returned as is
+# path: file name, fifo or - (stdin)
+# decompress: inline, thread or process (default config.DECOMPRESS_MODE)
+#
+def openInput(path,decompress=None):
+    if not decompress: decompress=config.DECOMPRESS_MODE
+    if decompress not in DECOMPRESS_MODES:
+        raise ValueError("Unknown decompression mode: %s (expected one of %s)"%(decompress,"|".join(DECOMPRESS_MODES)))
+    if path != "-" and os.path.isfile(path):
+        codec=detectCodec(path)
+        if codec == "none": return open(path,"rb")
+        return CompressedInput(path,codec,decompress)
+    if path == "-": fh=sys.stdin
+    else: fh=open(path,"rb")
+    head=""
+    while len(head) < MAGIC_SIZE:
+        data=fh.read(MAGIC_SIZE-len(head))
+        if not data: break
+        head+=data
+    return CompressedInput(path,magicCodec(head),decompress,PeekedStream(fh,head))
+
+#
+# Opens the binary stream of an output - for - a copy of stdout
+# (closing it leaves sys.stdout open)
+#
+def openStream(path):
+    if path != "-": return open(path,"wb")
+    sys.stdout.flush()
+    return os.fdopen(os.dup(sys.stdout.fileno()),"wb")
+
+#
+# Returns True if the path is stdin/stdout (-), a file descriptor (/dev/fd/N)
+# or an existing file that is not a regular file (fifo, device)
+#
+def isStream(path):
+    if path == "-" or path.startswith("/dev/fd/"): return True
+    return os.path.exists(path) and not stat.S_ISREG(os.stat(path).st_mode)
+
+#
+# Directory for the temp files of an output: the directory of a
+# regular (or new) file, else (stdout, pipe, fifo) the system temp directory
+#
+def workDir(path):
+    if path != "-":
+        if not os.path.exists(path): return os.path.dirname(os.path.abspath(path))
+        real_path=os.path.realpath(path)
+        if stat.S_ISREG(os.stat(real_path).st_mode): return os.path.dirname(real_path)
+    return tempfile.gettempdir()
+
+#
+# BGZF writer: the data is written in independent gzip blocks of at
+# most BGZF_BLOCK_DATA bytes followed by the BGZF end of file block
+#
+class BgzfWriter:
+    def __init__(self,path,level):
+        self.name=path
+        self.level=level
+        self.fh=openStream(path)
+        self.buffer=[]
+        self.size=0
+        self.closed=False
+
+    def write(self,text):
+        self.buffer.append(text)
+        self.size+=len(text)
+        if self.size >= BGZF_BLOCK_DATA: self._flush_blocks(False)
+
+    def _flush_blocks(self,final):
+        data="".join(self.buffer)
+        start=0
+        while len(data)-start >= BGZF_BLOCK_DATA or (final and start < len(data)):
+            self._write_block(data[start:start+BGZF_BLOCK_DATA])
+            start+=BGZF_BLOCK_DATA
+        data=data[start:]
+        self.buffer=[data] if data else []
+        self.size=len(data)
+
+    def _write_block(self,data):
+        deflater=zlib.compressobj(self.level,zlib.DEFLATED,-zlib.MAX_WBITS)
+        compressed=deflater.compress(data)+deflater.flush()
+        block_size=len(BGZF_HEADER)+2+len(compressed)+8
+        self.fh.write(BGZF_HEADER+struct.pack("<H",block_size-1)+compressed
+                      +struct.pack("<II",zlib.crc32(data) & 0xffffffff,len(data)))
+
+    def flush(self):
+        self._flush_blocks(True)
+        self.fh.flush()
+
+    def close(self):
+        if self.closed: return
+        self._flush_blocks(True)
+        self.fh.write(BGZF_EOF)
+        self.fh.close()
+        self.closed=True
+
+#
+# zstd writer through the zstd command line tool
+#
+class ZstdProcessWriter:
+    def __init__(self,path,level):
+        self.name=path
+        try:
+            self.fh=openStream(path)
+            self.proc=subprocess.Popen(["zstd","-q","-c","-%d"%(level)],stdin=subprocess.PIPE,
+                                       stdout=self.fh,bufsize=BLOCK_SIZE)
+        except OSError, e:
+            raise IOError("zstd output needs the zstandard module or the zstd tool: %s"%(e))
+        self.closed=False
+
+    def write(self,text):
+        self.proc.stdin.write(text)
+
+    def flush(self):
+        self.proc.stdin.flush()
+
+    def close(self):
+        if self.closed: return
+        self.proc.stdin.close()
+        status=self.proc.wait()
+        self.fh.close()
+        self.closed=True
+        if status != 0: raise IOError("zstd compression of %s failed (exit status %d)"%(self.name,status))
+
+class ZstdWriter:
+    def __init__(self,path,level):
+        self.name=path
+        self.fh=openStream(path)
+        self.writer=zstandard.ZstdCompressor(level=level).stream_writer(self.fh)
+        self.closed=False
+
+    def write(self,text):
+        self.writer.write(text)
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        if self.closed: return
+        self.writer.flush(zstandard.FLUSH_FRAME)
+        self.fh.close()
+        self.closed=True
+
+#
+# Opens a converter output file (a file name, fifo, /dev/fd/N or - for stdout)
+# codec: none, gzip, bgzip or zstd (default config.OUTPUT_CODEC, then the file extension)
+# level: compression level (default config.OUTPUT_LEVEL)
+#
+def openOutput(path,codec=None,level=None):
+    if not codec: codec=config.OUTPUT_CODEC or codecFromName(path)
+    if codec not in CODECS:
+        raise ValueError("Unknown output codec: %s (expected one of %s)"%(codec,"|".join(CODECS)))
+    if level is None: level=config.OUTPUT_LEVEL
+    if codec == "none": return openStream(path)
+    if codec == "gzip":
+        gzh=gzip.GzipFile("","wb",min(max(level,0),9),openStream(path))
+        gzh.myfileobj=gzh.fileobj #closed with the gzip file
+        gzh.name=path
+        return gzh
+    if codec == "bgzip":
+        return BgzfWriter(path,min(max(level,0),9))
+    if zstandard is None: return ZstdProcessWriter(path,level)
+    return ZstdWriter(path,level)
+
+#
+# Default output name of a converter: input name without its compression
+# extension + the output extension + the codec extension
+#
+def outputName(input_file,extension,codec=None):
+    name=stripCodecExtension(input_file)+extension
+    if codec and codec != "none": name+=CODEC_EXTENSIONS[codec]
+    return name
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_markers keeps the MGI marker report (MRK_List2.rpt) used to
+# generate the MGI GPI file (gaf2gpad.py --mgi) in a compact marker store.
+#
+# The store is built once from the report and cached beside it
+# (MRK_List2.rpt.store) - the next runs load it instead of parsing the
+# report again, until the report changes (size or mtime).
+#   markers:   MGI accession id -> (symbol,name,synonyms,gpi type) of every
+#              marker (one dict of tuples - the gpi type is "" if the feature
+#              type is not a goa_specs.gpi_type)
+#   genes:     the MGI accession ids of the gene markers in report order
+#   rejects:   the report rows with a field count mismatch
+# The GPI rows of the genes are formatted as they are written (geneRows),
+# so the store only keeps the marker fields.
+#
+# The last store loaded stays in memory (loadStore), so a process that
+# converts several files (goa_server.py jobs are forked from the server)
+# only reads it once.
+#
+# Store file layout:
+#   header line: GOA-MARKERS <store version> <python version>
+#   marshal record 1: the report signature (size,mtime)
+#   marshal record 2: (genes,markers,rejects)
+#
+'''
+
+import os,sys,marshal
+import tempfile
+import goa_specs,goa_io
+
+#
+#Bump when the gene rows or the marker records change
+#
+STORE_VERSION=3
+STORE_MAGIC="GOA-MARKERS"
+
+MGI_TAXON="taxon:10090"
+MGI_DB="MGI"
+
+MRK_FIELDS=goa_specs.MRK_FIELDS
+GPI_FIELDS=goa_specs.GPI_FIELDS
+mrk_ftype_index=goa_specs.mrk_ftype_index
+mrk_object_index=goa_specs.mrk_object_index
+mrk_object_name_index=goa_specs.mrk_object_name_index
+mrk_object_syn_index=goa_specs.mrk_object_syn_index
+mrk_object_id_index=goa_specs.mrk_object_id_index
+
+#last store loaded (see loadStore)
+resident=None
+
+def storeName(report_file):
+    return report_file+".store"
+
+def storeHeader():
+    return "%s %d %d.%d\n"%(STORE_MAGIC,STORE_VERSION,sys.version_info[0],sys.version_info[1])
+
+def reportSignature(report_file):
+    stat=os.stat(report_file)
+    return (stat.st_size,stat.st_mtime)
+
+#
+# Returns the GPI row of a gene marker
+#
+def geneRow(mgi_id,marker):
+    symbol,name,synonyms,gpi_type=marker
+    values={"DB":MGI_DB,"DB_Object_ID":mgi_id,"DB_Object_Symbol":symbol,"DB_Object_Name":name,
+            "DB_Object_Synonym":synonyms,"DB_Object_Type":gpi_type,"Taxon":MGI_TAXON}
+    return "\t".join([values.get(field,"") for field in GPI_FIELDS])
+
+#
+# Marker records of the MGI marker report
+#
+class MarkerStore:
+    def __init__(self,report_file,signature,genes,markers,rejects,source):
+        self.report_file=report_file
+        self.signature=signature
+        self.genes=genes
+        self.markers=markers
+        self.rejects=rejects
+        self.source=source   #how the store was loaded (for the log)
+
+    #
+    # Returns (symbol,name,synonyms,gpi type) of an MGI accession id or None
+    #
+    def marker(self,mgi_id):
+        return self.markers.get(mgi_id)
+
+    #
+    # Yields the GPI rows of the gene markers in report order
+    #
+    def geneRows(self):
+        markers=self.markers
+        for mgi_id in self.genes:
+            yield geneRow(mgi_id,markers[mgi_id])
+
+#
+# Builds the store from the report
+#
+def buildStore(report_file,signature):
+    genes=[]
+    markers={}
+    rejects=[]
+    rfh=open(report_file,'rb')
+    for mrk_row in goa_io.TabReader(rfh):
+        #header line
+        if len(mrk_row) > 3 and mrk_row[3].startswith("genome"): continue
+        if len(mrk_row) != len(MRK_FIELDS):
+            rejects.append(mrk_row)
+            continue
+        mgi_id=mrk_row[mrk_object_id_index]
+        gpi_type=goa_specs.gpi_type.get(mrk_row[mrk_ftype_index],"")
+        markers[mgi_id]=(mrk_row[mrk_object_index],mrk_row[mrk_object_name_index],
+                         mrk_row[mrk_object_syn_index],gpi_type)
+        if gpi_type: genes.append(mgi_id)
+    rfh.close()
+    return MarkerStore(report_file,signature,genes,markers,rejects,"built from the report")
+
+#
+# Returns the cached store of the report or None (missing or out of date)
+#
+def readStore(report_file,signature):
+    store_file=storeName(report_file)
+    if not os.path.isfile(store_file): return None
+    try:
+        sfh=open(store_file,"rb")
+        try:
+            if sfh.readline() != storeHeader(): return None
+            if marshal.load(sfh) != signature: return None
+            genes,markers,rejects=marshal.load(sfh)
+        finally:
+            sfh.close()
+    except (IOError,OSError,EOFError,ValueError,TypeError):
+        return None
+    return MarkerStore(report_file,signature,genes,markers,rejects,"loaded from "+store_file)
+
+#
+# Writes the store beside the report - the file is replaced atomically
+# Returns False if the store could not be written
+#
+def saveStore(store):
+    store_file=storeName(store.report_file)
+    try:
+        (fd,tmp_file)=tempfile.mkstemp(prefix=".store.",dir=os.path.dirname(os.path.abspath(store_file)))
+        sfh=os.fdopen(fd,"wb")
+        sfh.write(storeHeader())
+        marshal.dump(store.signature,sfh)
+        marshal.dump((store.genes,store.markers,store.rejects),sfh)
+        sfh.close()
+        os.rename(tmp_file,store_file)
+    except (IOError,OSError,ValueError):
+        if "tmp_file" in locals() and os.path.isfile(tmp_file): os.remove(tmp_file)
+        return False
+    return True
+
+#
+# Returns the store of the report: the resident store if the report did not
+# change, else the cached store, else a store built from the report (and cached)
+#
+def loadStore(report_file):
+    global resident
+    signature=reportSignature(report_file)
+    if resident is not None and resident.report_file == report_file and resident.signature == signature:
+        resident.source="resident"
+        return resident
+    store=readStore(report_file,signature)
+    if store is None:
+        store=buildStore(report_file,signature)
+        if saveStore(store): store.source+=" and saved to "+storeName(report_file)
+    resident=store
+    return store
@@ -22,8 +22,10 @@
 '''
  
 import getopt, sys 
-import goa_specs,config 
-import os,csv
+import goa_specs,goa_sort,goa_dedup,goa_snapshot,goa_depends,goa_io,goa_qc,goa_incremental,goa_export,goa_markers,config 
+import goa_profile
+import os,itertools,operator,gc
+import tempfile,shutil,multiprocessing,threading
 from datetime import datetime
 
 #
@@ -49,6 +51,10 @@ LOCAL_GO_XREF_FILE=config.LOCAL_GO_XREF_FILE
 LOCAL_MRK_REPORT_FILE=config.LOCAL_MRK_REPORT_FILE
 LOCAL_GO_REPORT_FILE=config.LOCAL_GO_REPORT_FILE
 LOCAL_MGI_GO_ECO_REPORT_FILE=config.LOCAL_MGI_GO_ECO_REPORT_FILE
+LOCAL_MAPS_SNAPSHOT_FILE=config.LOCAL_MAPS_SNAPSHOT_FILE
+#source files of the maps snapshot
+MAPS_SOURCE_FILES=[LOCAL_GO_REF_FILE,LOCAL_GO_REPORT_FILE,LOCAL_GO_XREF_FILE,
+                   LOCAL_ECO_MAP_FILE,LOCAL_MGI_GO_ECO_REPORT_FILE]
 
 GAF_CONVERTER_LOG_BASE=config.GAF_CONVERTER_LOG_BASE
 GAF_CONVERTER_DATA_BASE=config.GAF_CONVERTER_DATA_BASE
@@ -94,12 +100,21 @@ mrk_object_name_index=goa_specs.mrk_object_name_index
 mrk_object_syn_index=goa_specs.mrk_object_syn_index
 mrk_object_id_index=goa_specs.mrk_object_id_index
 
+PLAN_FIELD=goa_specs.PLAN_FIELD
+PLAN_TAXON=goa_specs.PLAN_TAXON
+PLAN_EVIDENCE=goa_specs.PLAN_EVIDENCE
+PLAN_PARENT=goa_specs.PLAN_PARENT
+PLAN_GPAD=goa_specs.PLAN_GPAD
+
 
 gaf=goa_specs.gaf()
 eco=goa_specs.Eco()
 goref=goa_specs.Goref()
 goref_collection= goref.COLLECTION
 go_id2aspect=goref.GO_ONTOLOGY_MAP
+map_log=None        #maps.log - set by converter_init
+map_log_thread=None #background full dump of the maps to maps.log
+MAPS_LOG_LEVELS=config.MAPS_LOG_LEVELS
   
 
 #
@@ -140,41 +155,79 @@ def displayGFile_header(gfh,gaf_header,title,g_fields,g_labels,gf_type,gaf_versi
     for i in range(len(g_fields)): fields.append(g_labels[g_fields[i]])
     gfh.write("\n!\n!"+"\t".join(fields)+"\n")
 
+#
+#Single pass reader of a gaf/gpad/gpi file: reads the header block
+#(the "!" lines before the first data line) and the gaf version once,
+#then hands over the remaining lines - works on pipes and stdin
+#  header: the header lines (stripped)
+#  version: the gaf version (the last gaf-version line)
+#  header_lines: the header lines as read (for the row count)
+#
+class GFileReader:
+    def __init__(self,gfh):
+        self.gfh=gfh
+        self.name=getattr(gfh,"name","")
+        self.header=[]
+        self.header_lines=[]
+        self.version=""
+        self.first_line=None
+        #header lines are read with readline: the rest of a plain file can then be read in blocks
+        while True:
+            line=gfh.readline()
+            if not line: break
+            stripped=line.strip()
+            if not stripped.startswith("!"):
+               self.first_line=line
+               break
+            self.header_lines.append(line)
+            self.header.append(stripped)
+            if "gaf-version:" in stripped: self.version=stripped.replace("gaf-version:","")
+
+    #lines that follow the header block
+    def __iter__(self):
+        if self.first_line is not None: yield self.first_line
+        for line in self.gfh: yield line
+
+    #lines that follow the header block as blocks of text (see goa_io.TabReader)
+    def iterBlocks(self):
+        if self.first_line is not None: yield self.first_line
+        for block in goa_io.inputBlocks(self.gfh): yield block
+
+    #writes the whole file (header block included) to a plain file
+    def copy(self,plain_file):
+        pfh=open(plain_file,"wb")
+        pfh.writelines(self.header_lines)
+        for block in self.iterBlocks(): pfh.write(block)
+        pfh.close()
+
+    def close(self):
+        self.gfh.close()
+
 #
 #   
-#Get GAF version
+#Get GAF version - gfh must be seekable (see GFileReader)
 #
 def getGaf_version(gfh):
-    gaf_version=""
     gfh.seek(0,0)
-    for line in gfh:
-        line=line.strip()
-        if line.startswith("!"):
-           if "gaf-version:" in line: gaf_version=line.replace("gaf-version:","")
-        else:
-           gfh.seek(0,0) #Again set the pointer to the beginning
-           break
+    gaf_version=GFileReader(gfh).version
+    gfh.seek(0,0) #Again set the pointer to the beginning
     return gaf_version
 
 
 #
-#Get the gaf/gpad/gpi file header
+#Get the gaf/gpad/gpi file header - gfh must be seekable (see GFileReader)
 #
 def getGFile_header(gfh,header):
     #Set the pointer to the beginning of the file
     gfh.seek(0,0)
-    for line in gfh:
-        line=line.strip()
-        if line.startswith("!"):
-           header.append(line)
-        else:
-           gfh.seek(0,0) #Reset the pointer to the beginning
-           break    
+    header.extend(GFileReader(gfh).header)
+    gfh.seek(0,0) #Reset the pointer to the beginning
 
 #
 # Displays corresponding gpad/gpi row from a gaf row
+# g_plan is the gpad/gpi projection plan of the gaf version (gaf.gpad_plan/gaf.gpi_plan)
 #
-def writeGP_row(gaf_row,gf_row_displayed,gfh,g_fields,is_gpad,is_gene_variant,parent_gp_id,evidence_code):
+def writeGP_row(gaf_row,gf_row_displayed,gfh,g_plan,is_gpad,is_gene_variant,parent_gp_id,evidence_code):
     #set taxon
     taxa=gaf_row[gaf.taxon_index].split("|")
     inter_taxon="";
@@ -184,325 +237,467 @@ def writeGP_row(gaf_row,gf_row_displayed,gfh,g_fields,is_gpad,is_gene_variant,pa
         inter_taxon="".join(taxa[1:end])
     if is_gpad==1: taxon=inter_taxon
     gf_row=[]
-    for i in range(len(g_fields)):
-        if g_fields[i] in gaf.fields:
-           gaf_index=gaf.fields.index(g_fields[i])
-           if gaf_index==gaf.taxon_index:
-              gf_row.append(taxon)
-           else:
-              gf_row.append(gaf_row[gaf_index])
-        else: #both gpad.Annotation_Properties and gpi.Parent_Object_ID are not gaf fields
-           if is_gpad:
-              #set GPAD.Annotation_Properties to gaf.evidence code
-              if i == gpad_annot_properties_index:
-                 gf_row.append(evidence_code)
-              else:
-                 gf_row.append(" ")
-           else:
-              if i==gpi_parent_object_id_index:
-                 if is_gene_variant:gf_row.append(parent_gp_id)
-                 else:gf_row.append(" ")
-              else:gf_row.append(" ")
+    for plan_type,gaf_index in g_plan:
+        if plan_type==PLAN_FIELD:
+           gf_row.append(gaf_row[gaf_index])
+        elif plan_type==PLAN_TAXON:
+           gf_row.append(taxon)
+        #both gpad.Annotation_Properties and gpi.Parent_Object_ID are not gaf fields
+        elif plan_type==PLAN_EVIDENCE:
+           #set GPAD.Annotation_Properties to gaf.evidence code
+           gf_row.append(evidence_code)
+        elif plan_type==PLAN_PARENT and is_gene_variant:
+           gf_row.append(parent_gp_id)
+        else:gf_row.append(" ")
 
     line="\t".join(gf_row) 
-    if not line in gf_row_displayed:
-       gf_row_displayed[line]=1
+    if gf_row_displayed.add(line):
        gfh.write(line+"\n")
 #
 #Load GPI file into memory - assuming GPI file not too big
+#Returns the gpi index and the number of gpi rows read:
+#  (DB,Object_ID) -> list of (parent_id,gpi row) - the last row of each parent_id
+#One lookup gives all the gpi rows of a gpad row
+#Bad rows are rejected to the goa_qc log qc (default: every reject in log)
 #
-def loadGpi(gpi_file,gpi_map,log,gpad_map_keys):
+def loadGpi(gpi_file,log,decompress=None,qc=None):
+    if qc is None: qc=goa_qc.QcLog(log,"full")
     log.write("\nGPI file data log:\n")
-    reader = csv.reader(open(gpi_file, 'rb'), dialect='excel-tab')
+    reader = goa_io.TabReader(goa_io.openInput(gpi_file,decompress),skip_comments=True)
+    gpi_index={}
     row_count=0
-    fieldCountMis=0
-    missFields=0
-    for line in reader:
-        if not line[0].startswith("!"):
-            gpi_row=[]
+    for gpi_row in reader:
+        if not gpi_row[0].startswith("!"):
             row_count+=1
-            if row_count%10000==0: print "%d lines processed"%(row_count)
-            for field in line:
-                gpi_row.append(field)
+            if row_count%10000==0: print >>sys.stderr, "%d lines processed"%(row_count)
             #
             #Data validation step
             #if number of fields does not match, store line in log
             if len(gpi_row) != len(GPI_FIELDS):
-                log.write("\t".join(gpi_row)+"\tFields count mismatch:%d - %d" %(len(gpi_row),len(GPI_FIELDS))+"\n")
-                fieldCountMis+=1
+                qc.reject("gpi_fieldCountMis",gpi_row,"\tFields count mismatch:%d - %d" %(len(gpi_row),len(GPI_FIELDS)))
                 continue
             #if missing required fields, store line in log
             field_missing_index=gaf.gpi_has_missing_fields(gpi_row)
             if field_missing_index :
-                log.write("\t".join(gpi_row)+"\tFirst required GPI field missing is at index:%d"%(field_missing_index)+"\n")
-                missFields+=1
+                qc.reject("gpi_missFields",gpi_row,"\tFirst required GPI field missing is at index:%d"%(field_missing_index))
                 continue
-            db_object_key=gpi_row[gpi_db_index]+":="+gpi_row[gpi_db_object_index]
-            parent_id=gpi_row[gpi_parent_object_id_index]
-            key= db_object_key+":="+parent_id
-            gpi_map[key]=gpi_row
-            if db_object_key in gpad_map_keys:
-                if parent_id in gpad_map_keys[db_object_key]: gpad_map_keys[db_object_key][parent_id]+=1
-                else: gpad_map_keys[db_object_key][parent_id]=1
-            else:
-                gpad_map_keys[db_object_key]={}
-                gpad_map_keys[db_object_key][parent_id]=1
-           
-           
-    log.write("Total number of lines from the gpi file:%s is :%d; total Indexed:%d"%(gpi_file,row_count,len(gpi_map))+"\n")
+            db_object_key=(gpi_row[gpi_db_index],gpi_row[gpi_db_object_index])
+            parents=gpi_index.get(db_object_key)
+            if parents is None:
+                parents={}
+                gpi_index[db_object_key]=parents
+            parents[gpi_row[gpi_parent_object_id_index]]=gpi_row
+    #parents in the order they are joined (the parent dict order)
+    indexed=0
+    for db_object_key in gpi_index:
+        parents=gpi_index[db_object_key].items()
+        gpi_index[db_object_key]=parents
+        indexed+=len(parents)
+    log.write("Total number of lines from the gpi file:%s is :%d; total Indexed:%d"%(gpi_file,row_count,indexed)+"\n")
+    return gpi_index,row_count
 
 #
-# Generates a GAF file from the specified  gpad and gpi files 
-# The default GAF version is 2.0 but the user 
-# can specify the GAF version
+# Returns the name of the first validation check a gpad row fails:
+# fieldCountMis, missFields, badDB or "" if the row is valid.
+# Invalid rows are rejected to the goa_qc log qc
 #
-def generateGaf(gaf_file,gpad_file,gpi_file,log,gaf_version):
-    gafh=open(gaf_file,"w")
-    gpi_map={}         #Loads gpi file into a dictionary indexed by DB:=Object_ID:=parent_id
-    gpad_map_keys={}   #Indexes Object_IDs by parent_id - to detect cases where an object is assigned 
-                       # to more than one parent
-    gaf_header=[] 
-    loadGpi(gpi_file,gpi_map,log,gpad_map_keys) #index GPI file  
-    type="" 
-    title="!gaf-version: %s\n"%(gaf_version)
-    mult_parents=0
+def checkGpad_row(gpad_row,qc):
+    #
+    #Data validation step
+    #if number of fields does not match, store line in log
+    if len(gpad_row) != len(GPAD_FIELDS):
+        qc.reject("fieldCountMis",gpad_row,"\tFields count mismatch:%d - %d" %(len(gpad_row),len(GPAD_FIELDS)))
+        return "fieldCountMis"
+    #if missing required fields, store line in log
+    field_missing_index=gaf.gpad_has_missing_fields(gpad_row)
+    if field_missing_index :
+        qc.reject("missFields",gpad_row,"\tThe first GPAD missing field is at index %d"%(field_missing_index))
+        return "missFields"
+    #if bad database abbreviation, store line in log
+    if gpad_row[gpad_db_index] not in goref.GO_DATABASES:
+        qc.reject("badDB",gpad_row,"\tThe DB field has an invalid value")
+        return "badDB"
+    return ""
+
+#
+# Displays the GAF row(s) of a given gpad row - one row for each
+# (parent_id,gpi_row) indexed for the gpad DB:=Object_ID
+# Ambiguous evidence codes and unknown GO_IDs are rejected to the goa_qc log qc
+#
+def writeGaf_row(gpad_row,parents,gafh,qc):
+    db=gpad_row[gpad_db_index]
+    object_id= gpad_row[gpad_db_object_index]
+    object_form_id=""
+    #get associated gpi row(s) for this gpad line 
+    for parent_id,gpi_row in parents:
+        gaf_row=[""]*len(gaf.fields) #initiate gaf row with empty fields
+        if parent_id:
+            fields=parent_id.split(":")
+            object_form_id=db+":"+object_id
+            if len(fields)>1:
+                db=fields[0]
+                object_id= "".join(fields[1:len(fields)])
+        taxon=gpi_row[gpi_taxon_index]
+        gaf_row[gaf.db_index]=db
+        gaf_row[gaf.object_index]=object_id
+        if gpad_row[gpad_taxon_index]:taxon+="|"+gpad_row[gpad_taxon_index]
+        gaf_row[gaf.taxon_index]=taxon
+        #Set the product_form_id only for gaf 2.0
+        if gaf.product_form_id_index >= 0:
+            if object_id == object_form_id: object_form_id=""
+            gaf_row[gaf.product_form_id_index]=object_form_id
+        if "|" in gpad_row[gpad_relationship_index]:
+            fields= gpad_row[gpad_relationship_index].split("|")
+            gaf_row[gaf.qual_index]="|".join(fields[0:len(fields)-1])
+        #
+        #Set gaf.evidence_code to gpad.annotation_properties or 
+        #get it from eco.ECO_EVIDENCE_MAP - ECO_GOREF2EVIDENCE_MAP
+        #
+        gaf_row[gaf.annotation_extension_index]=gpad_row[gpad_annot_extension_index]
+        eco_code= gpad_row[gpad_evidence_index]
+        go_ref=gpad_row[gpad_goref_index]
+        evidence_code= eco.getECO_code(go_ref,eco_code,goref.COLLECTION,eco.ECO_GOREF2EVIDENCE_MAP)
+        
+        gaf_row[gaf.evidence_index]=evidence_code
+        if eco_code not in gaf_row[gaf.annotation_extension_index]:
+            gaf_row[gaf.annotation_extension_index]+="|"+eco_code
+        #set GAF.Annotation_Extension = 
+        #gpad_annot_extension_index=GPAD_FIELDS.index("Annotation_Extension")
+        #gaf.annotation_extension_index
+        if evidence_code not in GAF_EVIDENCE_CODES:
+           qc.reject("eco_w_mult_ev",gpad_row," -Ambiguous Evidence code:"+evidence_code)
+
+        if gpad_row[gpad_goid_index] not in go_id2aspect:
+            #This means we can't compute the GAF.Aspect field - since we are using the go_id2aspect map
+            qc.reject("go_missing",(gpad_row[gpad_goid_index],)," not found in MGI GO_terms report")
+            continue
+        else:
+            gaf_row[gaf.aspect_index]=go_id2aspect[gpad_row[gpad_goid_index]]
+        #now map the rest of empty gaf fields to corresponding gpad and gpi fields
+        #using the gaf projection plan
+        for i,source,source_index in gaf.gaf_plan:
+            if not gaf_row[i]:
+                if source==PLAN_GPAD:
+                    gaf_row[i]=gpad_row[source_index]
+                else:
+                    gaf_row[i]=gpi_row[source_index]
+      
+        # Display row 
+        gafh.write("\t".join(gaf_row)+"\n")
+
+#
+# Joins the gpad file with the gpi file indexed in memory
+# Bad rows are rejected to the goa_qc log qc
+#
+def joinGpadGpi(gpad_file,gpi_file,gafh,log,tally,decompress=None,qc=None):
+    if qc is None: qc=goa_qc.QcLog(log,"full")
+    goa_profile.run.start("gpi_index")
+    gpi_index,gpi_count=loadGpi(gpi_file,log,decompress,qc) #index GPI file
+    goa_profile.run.stop("gpi_index",gpi_count)
     log.write("==================\nAnnotated DB:Object_Form_ID  with multiple gene parents:\n")
-    for key in gpad_map_keys:
-        if len(gpad_map_keys[key])>1:
-            parents="|".join(gpad_map_keys[key].keys())
-            log.write(key+"\t%d [%s]"%(len(gpad_map_keys[key]),parents)+"\n")
-            mult_parents+=1
-    #initiate gaf object
-    gaf._init(gaf_version)
-    displayGFile_header(gafh,gaf_header,title,gaf.fields,GAF_FIELDS_LABEL,type,gaf_version)
+    for db_object_key in sorted([key for key in gpi_index if len(gpi_index[key])>1]):
+        parents=gpi_index[db_object_key]
+        log.write(":=".join(db_object_key)+"\t%d [%s]"%(len(parents),"|".join([parent_id for parent_id,gpi_row in parents]))+"\n")
+        tally["mult_parents"]+=1
     #process the gpad and corresponding gpi
     log.write("=================\nGPAD and GPI data log:\n")
-    reader = csv.reader(open(gpad_file, 'rb'), dialect='excel-tab')
-    row_count=0
-    missFields=0
-    object_missing=0
-    fieldCountMis=0
-    go_missing=0
-    eco_w_mult_ev=0
-    badDB=0
-
+    goa_profile.run.start("join",hot=True)
+    reader = goa_io.TabReader(goa_io.openInput(gpad_file,decompress))
     for line in reader:
-        row_count+=1
-        if row_count%10000==0: print "%d lines processed"%(row_count)
+        tally["row_count"]+=1
+        if tally["row_count"]%10000==0: print >>sys.stderr, "%d lines processed"%(tally["row_count"])
         if not line[0].startswith("!"):
             gpad_row=[]
             for field in line:
                 gpad_row.append(field)
-            #
-            #Data validation step
-            #if number of fields does not match, store line in log
-            if len(gpad_row) != len(GPAD_FIELDS):
-                log.write("\t".join(gpad_row)+"\tFields count mismatch:%d - %d" %(len(gpad_row),len(GPAD_FIELDS))+"\n")
-                fieldCountMis+=1
+            if checkGpad_row(gpad_row,qc): continue 
+            parents=gpi_index.get((gpad_row[gpad_db_index],gpad_row[gpad_db_object_index]))
+            if parents is None:
+                qc.reject("object_missing",(gpad_row[gpad_db_object_index],)," Not in GPI file")
                 continue
-            #if missing required fields, store line in log
-            field_missing_index=gaf.gpad_has_missing_fields(gpad_row)
+            writeGaf_row(gpad_row,parents,gafh,qc)
+    goa_profile.run.stop("join",tally["row_count"],hot=True)
+
+#
+# Validates and sorts the gpi file by DB:=Object_ID using bounded memory
+# Each sort record is: DB:=Object_ID, gpi line number, gpi row
+# Returns the sorter and the number of gpi rows read
+# Bad rows are rejected to the goa_qc log qc
+#
+def sortGpi(gpi_file,log,tmp_dir,decompress=None,qc=None):
+    if qc is None: qc=goa_qc.QcLog(log,"full")
+    log.write("\nGPI file data log:\n")
+    sorter=goa_sort.ExternalSort(tmp_dir)
+    reader = goa_io.TabReader(goa_io.openInput(gpi_file,decompress),skip_comments=True)
+    row_count=0
+    for line in reader:
+        if not line[0].startswith("!"):
+            gpi_row=[]
+            row_count+=1
+            if row_count%10000==0: print >>sys.stderr, "%d lines processed"%(row_count)
+            for field in line:
+                gpi_row.append(field)
+            if len(gpi_row) != len(GPI_FIELDS):
+                qc.reject("gpi_fieldCountMis",gpi_row,"\tFields count mismatch:%d - %d" %(len(gpi_row),len(GPI_FIELDS)))
+                continue
+            field_missing_index=gaf.gpi_has_missing_fields(gpi_row)
             if field_missing_index :
-                log.write("\t".join(gpad_row)+"\tThe first GPAD missing field is at index %d"%(field_missing_index)+"\n")
-                missFields+=1
-                continue 
-            db=gpad_row[gpad_db_index]
-            #if bad database name
-            #if bad database abbreviation, store line in log
-            if db not in goref.GO_DATABASES:
-                log.write("\t".join(gpad_row)+"\tThe DB field has an invalid value\n")
-                badDB+=1
+                qc.reject("gpi_missFields",gpi_row,"\tFirst required GPI field missing is at index:%d"%(field_missing_index))
                 continue
-            object_id= gpad_row[gpad_db_object_index]
-            db_object_key= db+":="+object_id
-            object_form_id=""
-            if db_object_key not in gpad_map_keys:
-                log.write(gpad_row[gpad_db_object_index]+" Not in GPI file\n")
-                object_missing +=1
+            db_object_key=gpi_row[gpi_db_index]+":="+gpi_row[gpi_db_object_index]
+            sorter.add(db_object_key+"\t%012d\t"%(row_count)+goa_sort.escapeRecord("\t".join(gpi_row)))
+    return sorter,row_count
+
+#
+# Iterates over the sorted gpi records grouped by DB:=Object_ID
+# Yields (DB:=Object_ID, parents) where parents lists (parent_id,gpi row)
+# with the last gpi row of each parent_id - the same as loadGpi() does
+#
+def iterGpi_groups(sorted_gpi_file):
+    group_key=None
+    parents={}
+    for record in goa_sort.readRecords(sorted_gpi_file):
+        db_object_key,row_id,row=record.split("\t",2)
+        gpi_row=goa_sort.unescapeRecord(row).split("\t")
+        if db_object_key != group_key:
+            if group_key is not None: yield group_key,parents.items()
+            group_key=db_object_key
+            parents={}
+        parents[gpi_row[gpi_parent_object_id_index]]=gpi_row
+    if group_key is not None: yield group_key,parents.items()
+
+#
+# File-like writer used by the sorted join - every write is tagged with
+# the current gpad row number so that the join output can be replayed
+# in the original gpad file order
+#
+class RowTagWriter:
+    def __init__(self,sorter,channel,tag):
+        self.sorter=sorter
+        self.channel=channel
+        self.tag=tag        #shared [gpad row number, write sequence]
+
+    def write(self,text):
+        self.tag[1]+=1
+        self.sorter.add("%012d\t%012d\t%s\t%s"%(self.tag[0],self.tag[1],self.channel,goa_sort.escapeRecord(text)))
+
+#
+# Joins the gpad file with the gpi file using bounded memory:
+# both files are sorted on DB:=Object_ID with spill files, merge-joined 
+# row by row, then the GAF rows and the rejects are replayed in
+# the gpad file order - the output is the same as joinGpadGpi()
+#
+def joinGpadGpi_sorted(gpad_file,gpi_file,gafh,log,tally,tmp_dir=None,decompress=None,qc=None):
+    if qc is None: qc=goa_qc.QcLog(log,"full")
+    goa_profile.run.start("gpi_sort")
+    gpi_sorter,gpi_count=sortGpi(gpi_file,log,tmp_dir,decompress,qc)
+    goa_profile.run.stop("gpi_sort",gpi_count)
+    gpad_sorter=goa_sort.ExternalSort(tmp_dir)
+    out_sorter=goa_sort.ExternalSort(tmp_dir)
+    try:
+        gpi_sorted_file=gpi_sorter.sortedFile()
+        indexed=0
+        mult_parents=[]
+        for db_object_key,parents in iterGpi_groups(gpi_sorted_file):
+            indexed+=len(parents)
+            if len(parents)>1:
+                mult_parents.append(db_object_key+"\t%d [%s]"%(len(parents),"|".join([parent_id for parent_id,gpi_row in parents]))+"\n")
+        log.write("Total number of lines from the gpi file:%s is :%d; total Indexed:%d"%(gpi_file,gpi_count,indexed)+"\n")
+        log.write("==================\nAnnotated DB:Object_Form_ID  with multiple gene parents:\n")
+        for line in mult_parents: log.write(line)
+        tally["mult_parents"]+=len(mult_parents)
+        mult_parents=[]
+        log.write("=================\nGPAD and GPI data log:\n")
+        #
+        #Validate and sort the gpad rows
+        goa_profile.run.start("join",hot=True)
+        tag=[0,0]
+        out_gafh=RowTagWriter(out_sorter,"g",tag)
+        #the rejects are found in sorted order: all are tagged then sampled in gpad order
+        if qc.innerLevel() == "counts": inner_level="counts"
+        else: inner_level="full"
+        out_qc=goa_qc.QcLog(RowTagWriter(out_sorter,"l",tag),inner_level,tagged=True)
+        reader = goa_io.TabReader(goa_io.openInput(gpad_file,decompress))
+        for line in reader:
+            tally["row_count"]+=1
+            if tally["row_count"]%10000==0: print >>sys.stderr, "%d lines processed"%(tally["row_count"])
+            if not line[0].startswith("!"):
+                gpad_row=[]
+                for field in line:
+                    gpad_row.append(field)
+                tag[0]=tally["row_count"]
+                if checkGpad_row(gpad_row,out_qc): continue
+                db_object_key= gpad_row[gpad_db_index]+":="+gpad_row[gpad_db_object_index]
+                gpad_sorter.add(db_object_key+"\t%012d\t"%(tally["row_count"])+goa_sort.escapeRecord("\t".join(gpad_row)))
+        #
+        #Merge join the sorted gpad and gpi rows
+        groups=iterGpi_groups(gpi_sorted_file)
+        group=next(groups,None)
+        for record in gpad_sorter.sorted():
+            db_object_key,row_id,row=record.split("\t",2)
+            gpad_row=goa_sort.unescapeRecord(row).split("\t")
+            tag[0]=int(row_id)
+            while group is not None and group[0]+"\t" < db_object_key+"\t":
+                group=next(groups,None)
+            if group is None or group[0] != db_object_key:
+                out_qc.reject("object_missing",(gpad_row[gpad_db_object_index],)," Not in GPI file")
                 continue
-            #get associated gpi row(s) for this gpad line 
-            for parent_id in gpad_map_keys[db_object_key]:
-                gaf_row=[]
-                for i in range(len(gaf.fields)):gaf_row.append("") #initiate gaf row with empty fields
-                gpi_row=gpi_map[db_object_key+":="+parent_id]
-                if parent_id:
-                    fields=parent_id.split(":")
-                    object_form_id=db+":"+object_id
-                    if len(fields)>1:
-                        db=fields[0]
-                        object_id= "".join(fields[1:len(fields)])
-                taxon=gpi_row[gpi_taxon_index]
-                gaf_row[gaf.db_index]=db
-                gaf_row[gaf.object_index]=object_id
-                if gpad_row[gpad_taxon_index]:taxon+="|"+gpad_row[gpad_taxon_index]
-                gaf_row[gaf.taxon_index]=taxon
-                #Set the product_form_id only for gaf 2.0
-                if gaf.product_form_id_index in range(len(gaf.fields)):
-                    if object_id == object_form_id: object_form_id=""
-                    gaf_row[gaf.product_form_id_index]=object_form_id
-                if "|" in gpad_row[gpad_relationship_index]:
-                    fields= gpad_row[gpad_relationship_index].split("|")
-                    gaf_row[gaf.qual_index]="|".join(fields[0:len(fields)-1])
-                #
-                #Set gaf.evidence_code to gpad.annotation_properties or 
-                #get it from eco.ECO_EVIDENCE_MAP - ECO_GOREF2EVIDENCE_MAP
-                #
-                gaf_row[gaf.annotation_extension_index]=gpad_row[gpad_annot_extension_index]
-                eco_code= gpad_row[gpad_evidence_index]
-                go_ref=gpad_row[gpad_goref_index]
-                evidence_code= eco.getECO_code(go_ref,eco_code,goref.COLLECTION,eco.ECO_GOREF2EVIDENCE_MAP)
-                
-                gaf_row[gaf.evidence_index]=evidence_code
-                if eco_code not in gaf_row[gaf.annotation_extension_index]:
-                    gaf_row[gaf.annotation_extension_index]+="|"+eco_code
-                #set GAF.Annotation_Extension = 
-                #gpad_annot_extension_index=GPAD_FIELDS.index("Annotation_Extension")
-                #gaf.annotation_extension_index
-                if evidence_code not in GAF_EVIDENCE_CODES:
-                   log.write("\t".join(gpad_row)+" -Ambiguous Evidence code:"+evidence_code+"\n") 
-                   eco_w_mult_ev+=1
-
-                if gpad_row[gpad_goid_index] not in go_id2aspect:
-                    #This means we can't compute the GAF.Aspect field - since we are using the go_id2aspect map
-                    log.write(gpad_row[gpad_goid_index]+" not found in MGI GO_terms report\n")
-                    go_missing+=1
-                    continue
-                else:
-                    gaf_row[gaf.aspect_index]=go_id2aspect[gpad_row[gpad_goid_index]]
-                #now map the rest of empty gaf fields to corresponding gpad and gpi fields
-                for i in range(len(gaf.fields)):
-                    if i == gaf.db_index : continue
-                    elif i == gaf.object_index : continue
-                    elif i == gaf.taxon_index: continue
-                    elif i == gaf.evidence_index: continue
-                    elif i== gaf.aspect_index: continue
-                    elif i== gaf.qual_index:continue
-                    elif i== gaf.product_form_id_index: continue
-                    elif i== gaf.annotation_extension_index: continue
-                    if not gaf_row[i]:
-                        if gaf.fields[i] in GPAD_FIELDS:
-                            gpad_index=GPAD_FIELDS.index(gaf.fields[i])
-                            gaf_row[i]=gpad_row[gpad_index]
-                        elif gaf.fields[i] in GPI_FIELDS:
-                            gpi_index=GPI_FIELDS.index(gaf.fields[i])
-                            gaf_row[i]=gpi_row[gpi_index]
-              
-                # Display row 
-                gafh.write("\t".join(gaf_row)+"\n")
+            writeGaf_row(gpad_row,group[1],out_gafh,out_qc)
+        gpad_sorter.close()
+        gpi_sorter.close()
+        #
+        #Replay the GAF rows and rejects in gpad file order
+        qc.addCounts(out_qc.counts,out_qc.categories)
+        for record in out_sorter.sorted():
+            row_id,seq,channel,text=record.split("\t",3)
+            if channel == "g": gafh.write(goa_sort.unescapeRecord(text))
+            else: qc.replay([goa_sort.unescapeRecord(text)])
+        goa_profile.run.stop("join",tally["row_count"],hot=True)
+    finally:
+        gpad_sorter.close()
+        gpi_sorter.close()
+        out_sorter.close()
+
+#
+# Generates a GAF file from the specified  gpad and gpi files 
+# The default GAF version is 2.0 but the user 
+# can specify the GAF version
+# If streaming is set, the gpad and gpi files are joined using
+# bounded-memory sort files created under tmp_dir instead of
+# indexing the gpi file in memory
+# Compressed gpad/gpi files are detected (see goa_io), the gaf file is
+# written with output_codec/output_level (default from the file name)
+# Bad rows are rejected to the goa_qc log qc (default: a QcLog of log
+# with the config.QC_LEVEL) - its summary replaces the tally
+# export_format: also write the gaf rows to a parquet or arrow file (see goa_export),
+# instead of the gaf file if export_only is set
+#
+def generateGaf(gaf_file,gpad_file,gpi_file,log,gaf_version,streaming=False,tmp_dir=None,
+                output_codec=None,output_level=None,decompress=None,qc=None,export_format=None,export_only=False):
+    goa_profile.run.start("gaf_header")
+    own_qc=qc is None
+    if own_qc: qc=goa_qc.QcLog(log)
+    qc.declare(goa_qc.GPAD_CATEGORIES)
+    gaf_header=[] 
+    type="" 
+    title="!gaf-version: %s\n"%(gaf_version)
+    #initiate gaf object
+    gaf._init(gaf_version)
+    gafh=goa_export.openOutput(gaf_file,output_codec,output_level,export_format,export_only,
+                               "gaf",gaf.fields,GAF_FIELDS_LABEL,tmp_dir)
+    displayGFile_header(gafh,gaf_header,title,gaf.fields,GAF_FIELDS_LABEL,type,gaf_version)
+    tally={"row_count":0,"mult_parents":0}
+    goa_profile.run.stop("gaf_header")
+    if streaming:
+        joinGpadGpi_sorted(gpad_file,gpi_file,gafh,log,tally,tmp_dir,decompress,qc)
+    else:
+        joinGpadGpi(gpad_file,gpi_file,gafh,log,tally,decompress,qc)
     #              
-    log.write("\nTotal rows in GPAD file: %d " %(row_count))
-    log.write("\nTotal rows with Fields count mismatch : %d " %(fieldCountMis))
-    log.write("\nTotal rows with missing required fields : %d " %(missFields))
-    log.write("\nTotal Object_id in GPAD but not in GPI : %d " %(object_missing))
-    log.write("\nTotal Annotated DB:Object_Form_ID with multiple gene parents : %d " %(mult_parents))
-    log.write("\nTotal rows with ECO code mapping to multiple base Evidence code : %d " %(eco_w_mult_ev))
-    log.write("\nTotal rows with invalid DB name : %d " %(badDB))
-    log.write("\nTotal GPAD rows with GO_ID not in MGI GO_terms report : %d \n" %(go_missing))
+    goa_profile.run.start("tally")
+    qc.report(log,"GPAD to GAF",[("row_count",tally["row_count"]),("mult_parents",tally["mult_parents"])])
+    if own_qc: qc.close()
+    reportEco_cache()
+    goa_profile.run.stop("tally")
+    goa_profile.run.count("gpad_rows_read",tally["row_count"])
 
+    goa_profile.run.start("close")
     gafh.close()
+    goa_profile.run.stop("close")
 
 #
 # Create the expected directory structure and
 # downloads dependencies (gaf-eco-map, mrk_list2.rpt) if needed
 #
-def setup_depends(log):
+def setup_depends(log,offline=None):
     try:
-        right_now = datetime.now().strftime("%Y%m%d")
         if not os.path.isdir('%s' % (GAF_CONVERTER_LOG_BASE)):
             os.system('mkdir %s' % (GAF_CONVERTER_LOG_BASE))
         if not os.path.isdir('%s' % (GAF_CONVERTER_DATA_BASE)):
             os.system('mkdir %s' % (GAF_CONVERTER_DATA_BASE))
-        if not os.path.isdir('%s' % (GAF_CONVERTER_DATA_TEMP)):
-            os.system('mkdir %s' % (GAF_CONVERTER_DATA_TEMP))
         #
-        # Download reports as needed
+        # Download reports as needed (concurrent conditional requests - see goa_depends.py)
         #
-        if not os.path.isfile('%s' % (LOCAL_MRK_REPORT_FILE)):
-            os.system('wget -q -O %s "%s"' %(LOCAL_MRK_REPORT_FILE,REMOTE_MRK_REPORT_FILE))
-        else:
-            local_f_mtime = datetime.fromtimestamp(os.path.getmtime(LOCAL_MRK_REPORT_FILE))
-            local_f_mtime=local_f_mtime.strftime("%Y%m%d")
-            diff_time= int(right_now) - int(local_f_mtime)
-            if diff_time > update_index[LOCAL_MRK_REPORT_FILE]:
-                os.system('cp -Rp %s %s' %(LOCAL_MRK_REPORT_FILE,GAF_CONVERTER_DATA_TEMP))
-                os.system('wget -q -O %s "%s"' %(LOCAL_MRK_REPORT_FILE,REMOTE_MRK_REPORT_FILE))
-
-        if not os.path.isfile('%s' % (LOCAL_ECO_MAP_FILE)):
-            os.system('wget -q -O %s "%s"' %(LOCAL_ECO_MAP_FILE,REMOTE_ECO_MAP_FILE))
-        else:
-            local_f_mtime = datetime.fromtimestamp(os.path.getmtime(LOCAL_ECO_MAP_FILE))
-            local_f_mtime=local_f_mtime.strftime("%Y%m%d")
-            diff_time= int(right_now) - int(local_f_mtime)
-            if diff_time > update_index[LOCAL_ECO_MAP_FILE]:
-                os.system('cp -Rp %s %s' %(LOCAL_ECO_MAP_FILE,GAF_CONVERTER_DATA_TEMP))
-                os.system('wget -q -O %s "%s"' %(LOCAL_ECO_MAP_FILE,REMOTE_ECO_MAP_FILE))
-
-        if not os.path.isfile('%s' % (LOCAL_GO_REF_FILE)):
-            os.system('wget -q -O %s "%s"' %(LOCAL_GO_REF_FILE,REMOTE_GO_REF_FILE))
-        else:
-            local_f_mtime = datetime.fromtimestamp(os.path.getmtime(LOCAL_GO_REF_FILE))
-            local_f_mtime=local_f_mtime.strftime("%Y%m%d")
-            diff_time= int(right_now) - int(local_f_mtime)
-            if diff_time > update_index[LOCAL_GO_REF_FILE]:
-                os.system('cp -Rp %s %s' %(LOCAL_GO_REF_FILE,GAF_CONVERTER_DATA_TEMP))
-                os.system('wget -q -O %s "%s"' %(LOCAL_GO_REF_FILE,REMOTE_GO_REF_FILE))
-
-        if not os.path.isfile('%s' % (LOCAL_GO_XREF_FILE)):
-            os.system('wget -q -O %s "%s"' %(LOCAL_GO_XREF_FILE,REMOTE_GO_XREF_FILE))
-        else:
-            local_f_mtime = datetime.fromtimestamp(os.path.getmtime(LOCAL_GO_XREF_FILE))
-            local_f_mtime=local_f_mtime.strftime("%Y%m%d")
-            diff_time= int(right_now) - int(local_f_mtime)
-            if diff_time > update_index[LOCAL_GO_XREF_FILE]:
-                os.system('cp -Rp %s %s' %(LOCAL_GO_XREF_FILE,GAF_CONVERTER_DATA_TEMP))
-                os.system('wget -q -O %s "%s"' %(LOCAL_GO_XREF_FILE,REMOTE_GO_XREF_FILE))
-
-        if not os.path.isfile('%s' % (LOCAL_GO_REPORT_FILE)):
-            os.system('wget -q -O %s "%s"' %(LOCAL_GO_REPORT_FILE,REMOTE_GO_REPORT_FILE))
-        else:
-            local_f_mtime = datetime.fromtimestamp(os.path.getmtime(LOCAL_GO_REPORT_FILE))
-            local_f_mtime=local_f_mtime.strftime("%Y%m%d")
-            diff_time= int(right_now) - int(local_f_mtime)
-            if diff_time > update_index[LOCAL_GO_REPORT_FILE]:
-                os.system('cp -Rp %s %s' %(LOCAL_GO_REPORT_FILE,GAF_CONVERTER_DATA_TEMP))
-                os.system('wget -q -O %s "%s"' %(LOCAL_GO_REPORT_FILE,REMOTE_GO_REPORT_FILE))
-        if not os.path.isfile('%s' % (LOCAL_MGI_GO_ECO_REPORT_FILE)):
-            os.system('wget -q -O %s "%s"' %(LOCAL_MGI_GO_ECO_REPORT_FILE,REMOTE_MGI_GO_REPORT_FILE))
-            #Only get the three fields from mgi_eco (evidenceCode, mgiRef, ecoCode)
-            temp_file=LOCAL_MGI_GO_ECO_REPORT_FILE+".temp"
-            os.system("cut -f '6 8 12' %s > %s"%(LOCAL_MGI_GO_ECO_REPORT_FILE,temp_file))
-            if os.path.isfile('%s' % (temp_file)):
-                os.system("mv %s %s"%(temp_file,LOCAL_MGI_GO_ECO_REPORT_FILE))
-
-        else:
-            local_f_mtime = datetime.fromtimestamp(os.path.getmtime(LOCAL_MGI_GO_ECO_REPORT_FILE))
-            local_f_mtime=local_f_mtime.strftime("%Y%m%d")
-            diff_time= int(right_now) - int(local_f_mtime)
-            if diff_time > update_index[LOCAL_MGI_GO_ECO_REPORT_FILE]:
-                os.system('cp -Rp %s %s' %(LOCAL_MGI_GO_ECO_REPORT_FILE,GAF_CONVERTER_DATA_TEMP))
-                os.system('wget -q -O %s "%s"' %(LOCAL_MGI_GO_ECO_REPORT_FILE,REMOTE_MGI_GO_REPORT_FILE))
-                #Only get the three fields from mgi_eco (evidenceCode, mgiRef, ecoCode)
-                temp_file=LOCAL_MGI_GO_ECO_REPORT_FILE+".temp"
-                os.system("cut -f '6 8 12' %s > %s"%(LOCAL_MGI_GO_ECO_REPORT_FILE,temp_file))
-                if os.path.isfile('%s' % (temp_file)):
-                    os.system("mv %s %s"%(temp_file,LOCAL_MGI_GO_ECO_REPORT_FILE))
+        goa_depends.fetchDepends(log,offline=offline)
     except OSError, e:
         errStr= "Error %d: %s" % (e.args[0], e.args[1])
         log.write("Converter Initiation failed:" + errStr+"\n")
-        #restore the files
-        os.system("mv %s/* %s"%(GAF_CONVERTER_DATA_TEMP,GAF_CONVERTER_DATA_BASE))
         sys.exit(1)
     return 0
 #
+# Loads the GO_REF/ECO maps: from the compiled snapshot unless a source
+# file changed since the last build, else from the source files
+# (the snapshot is then saved for the next runs)
+# Returns how the maps were loaded
+#
+def loadMaps():
+    maps=goa_snapshot.loadSnapshot(LOCAL_MAPS_SNAPSHOT_FILE,MAPS_SOURCE_FILES)
+    if maps is not None:
+        goref.importMaps(maps["goref"])
+        eco.importMaps(maps["eco"])
+        return "Maps loaded from snapshot: %s\n"%(LOCAL_MAPS_SNAPSHOT_FILE)
+    signatures=goa_snapshot.sourceSignatures(MAPS_SOURCE_FILES)
+    goref._init(LOCAL_GO_REF_FILE,LOCAL_GO_REPORT_FILE,LOCAL_GO_XREF_FILE,None)
+    eco._init(LOCAL_ECO_MAP_FILE,LOCAL_MGI_GO_ECO_REPORT_FILE,None)
+    maps={"goref":goref.exportMaps(),"eco":eco.exportMaps()}
+    message="Maps built from the source files\n"
+    if goa_snapshot.saveSnapshot(LOCAL_MAPS_SNAPSHOT_FILE,signatures,maps):
+        message+="Maps snapshot saved: %s\n"%(LOCAL_MAPS_SNAPSHOT_FILE)
+    return message
+
+#
 # Initiate converter
 #  
-def converter_init(log):
-    setup_depends(log)
+def converter_init(log,maps_log_level=None,offline=None):
+    goa_profile.run.start("setup_depends")
+    setup_depends(log,offline)
+    goa_profile.run.stop("setup_depends")
     #Load dictionaries 
-    map_log_file=GAF_CONVERTER_LOG_BASE+"/maps.log"
-    map_log=open(map_log_file,"w")
-    goref._init(LOCAL_GO_REF_FILE,LOCAL_GO_REPORT_FILE,LOCAL_GO_XREF_FILE,map_log)
-    eco._init(LOCAL_ECO_MAP_FILE,LOCAL_MGI_GO_ECO_REPORT_FILE,map_log)
+    global map_log,map_log_thread
+    if not maps_log_level: maps_log_level=config.MAPS_LOG_LEVEL
+    map_log=None
+    if maps_log_level != "off":
+        map_log_file=GAF_CONVERTER_LOG_BASE+"/maps.log"
+        map_log=open(map_log_file,"w")
+    goa_profile.run.start("load_maps")
+    message=loadMaps()
+    goa_profile.run.stop("load_maps")
+    if map_log is None: return
+    map_log.write(message)
+    if maps_log_level == "summary":
+        goref.summary(map_log)
+        eco.summary(map_log)
+    else:
+        #the maps are not modified once loaded - dump them while the converter runs
+        map_log_thread=threading.Thread(target=reportMaps,args=(map_log,))
+        map_log_thread.start()
+
+#
+#Writes the content of all the maps to maps.log
+#
+def reportMaps(mlog):
+    goref.report(mlog)
+    eco.report(mlog)
+    mlog.flush()
+
+#
+#Waits for the background dump of the maps to maps.log
+#
+def waitMaps_log():
+    global map_log_thread
+    if map_log_thread is None: return
+    map_log_thread.join()
+    map_log_thread=None
+
+#
+#Displays the ECO code cache statistics in maps.log
+#
+def reportEco_cache():
+    goa_profile.run.setCounter("eco_cache_lookups",goa_specs.eco_code_cache.hits+goa_specs.eco_code_cache.misses)
+    goa_profile.run.setCounter("eco_cache_hits",goa_specs.eco_code_cache.hits)
+    waitMaps_log()
+    if map_log is None: return
+    eco.reportCache(map_log)
+    map_log.flush()
 
 #
 #returns true if one of the key maps is empty
@@ -522,65 +717,45 @@ def empty_eco_containers():
     if len(eco.MGI_ECO_MAP)<=0: is_empty=1
     return  is_empty
 #
-#Generates gpad and gpi files 
-#from a gaf file using goa specification
-#Both the gpi and gpad file will have the same
-#version as the input gaf file
+# Dictionary that remembers the order in which keys were first set.
+# Used by the gaf chunk workers so that the parent process can rebuild
+# protein_map and feature_type_map with the same key insertion order
+# as a single process run
 #
-def generateGpiGpad(gaf_file,gpad_file,gpi_file,log,filtermgi):
-    gafh=open(gaf_file)
-    gpad=open(gpad_file,"w")
-    gpi=open(gpi_file,"w")
-    gaf_header=[]
-    gaf_version=getGaf_version(gafh)
-    #initiate gaf object
-    gaf._init(gaf_version)
-    getGFile_header(gafh,gaf_header)
-    gafh.close()
-    gpad_row_displayed={} #structure to filter gpad duplicate rows if any
-    gpi_row_displayed={}  #structure to filter gpi duplicate rows if any
-    feature_type_map={}
-    protein_map={}        #stores protein-gene mapping
-    totalEmptyProt=0      #Keeps track of entries where the protein field is empty
-    fieldCountMis=0       #Keeps track of entrie where the field count !=17
-    missFields=0          #Keeps track of entries where at least one required field is empty
-    badEvCode=0           #Keeps track of entries where the provided Evidence code is invalid
-    badDB=0               #Keeps track of entries where the provided DB is invalid
-    badAspect=0           #Keeps track of entries where the GAF Aspect field is invalid
-    badIsoform=0           #Keeps track of entries where the GAF Gene form id field is invalid
-    row_count=0
-    req_gaf_fields={}
-    gpad_title="!gpad-version: %s\n"%(gaf_version)
-    gpi_title="!gpi-version: %s\n"%(gaf_version)
-    type="gpad"
-    displayGFile_header(gpad,gaf_header,gpad_title,GPAD_FIELDS,GPAD_FIELDS_LABEL,type,gaf_version)
-    type="gpi"
-    displayGFile_header(gpi,gaf_header,gpi_title,GPI_FIELDS,GPI_FIELDS_LABEL,type,gaf_version)
-    
-    log.write("GAF file data log:\n")
-    reader = csv.reader(open(gaf_file, 'rb'), dialect='excel-tab')
+class KeyOrderDict(dict):
+    def __init__(self):
+        dict.__init__(self)
+        self.key_order=[]
+
+    def __setitem__(self,key,value):
+        if key not in self: self.key_order.append(key)
+        dict.__setitem__(self,key,value)
+
+#
+# Converts the rows of a gaf reader into gpad and gpi rows
+# Bad rows are rejected to the goa_qc log qc, rows are tallied in the tally map
+#
+def convertGaf_rows(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                    feature_type_map,protein_map,tally,show_progress=True):
     for line in reader:
-        row_count+=1
-        if row_count%10000==0: print "%d lines processed"%(row_count)
+        tally["row_count"]+=1
+        if show_progress and tally["row_count"]%10000==0: print >>sys.stderr, "%d lines processed"%(tally["row_count"])
         if not line[0].startswith("!"):
            gaf_row=[]
            for field in line:
                gaf_row.append(field)
            #if number of fields does not match, store line in log
            if len(gaf_row) != len(gaf.fields): 
-              log.write("\t".join(gaf_row)+"\tFields count mismatch:%d - %d" %(len(gaf_row),len(gaf.fields))+"\n")
-              fieldCountMis+=1
+              qc.reject("fieldCountMis",gaf_row,"\tFields count mismatch:%d - %d" %(len(gaf_row),len(gaf.fields)))
               continue       
            #if missing required fields, store line in log
            field_missing_index=gaf.has_missing_fields(gaf_row)
            if field_missing_index :
-              log.write("\t".join(gaf_row)+"\tThe first GAF missing field is at index %d"%(field_missing_index)+"\n")
-              missFields+=1
+              qc.reject("missFields",gaf_row,"\tThe first GAF missing field is at index %d"%(field_missing_index))
               continue
            #if bad database abbreviation, store line in log
            if gaf_row[0] not in goref.GO_DATABASES:
-              log.write("\t".join(gaf_row)+"\tThe DB field has an invalid value\n")
-              badDB+=1
+              qc.reject("badDB",gaf_row,"\tThe DB field has an invalid value")
               continue 
            #
            # Set GPAD ECO code  
@@ -591,14 +766,12 @@ def generateGpiGpad(gaf_file,gpad_file,gpi_file,log,filtermgi):
            # if invalid evidence code, skip and store line in log
            eco_code= eco.getECO_code(go_ref,evidence_code,goref.COLLECTION,eco.GAF_ECO_MAP)
            if not eco_code:
-              log.write("\t".join(gaf_row)+"\tBad Evidence code\n")
-              badEvCode +=1
+              qc.reject("badEvCode",gaf_row,"\tBad Evidence code")
               continue
            # Skip if bad Aspect field
            relationship=gaf.getGPAD_relationship(gaf_row)
            if not relationship:
-              log.write("\t".join(gaf_row)+"\tBad Aspect field\n")
-              badAspect+=1
+              qc.reject("badAspect",gaf_row,"\tBad Aspect field")
               continue
            #Initiate GPI parent id in case this is a gene variant
            parent_gp_id=gaf.getParent_gp_id(gaf_row)
@@ -611,10 +784,9 @@ def generateGpiGpad(gaf_file,gpad_file,gpi_file,log,filtermgi):
                protein=gaf_row[gaf.product_form_id_index] #GAF - field 17
                #if "|" in protein or len(protein.split(":"))>2:
                if "|" in protein:
-                   log.write("\t".join(gaf_row)+"\t --- Bad Gene Product Form ID field\n")
-                   badIsoform+=1
+                   qc.reject("badIsoform",gaf_row,"\t --- Bad Gene Product Form ID field")
                    continue
-               totalEmptyProt+=gaf.setProtein(protein_map,gaf_row)
+               tally["totalEmptyProt"]+=gaf.setProtein(protein_map,gaf_row)
            #overwrite the evidence code in the gaf line with the translated ECO code
            gaf_row[gaf.evidence_index]=eco_code
            #Store the ECO code in  gaf.annotation_extension field used in evidence property note
@@ -634,98 +806,599 @@ def generateGpiGpad(gaf_file,gpad_file,gpi_file,log,filtermgi):
            gaf_row[gaf.qual_index]= gaf.getGPAD_relationship(gaf_row)
            #Display gpad  row - filter duplicates
            is_gpad=1
-           writeGP_row(gaf_row,gpad_row_displayed,gpad,GPAD_FIELDS,is_gpad,is_g_variant,parent_gp_id,evidence_code)
+           writeGP_row(gaf_row,gpad_row_displayed,gpad,gaf.gpad_plan,is_gpad,is_g_variant,parent_gp_id,evidence_code)
            #
            #Display gpi  row - filter duplicates
            is_gpad=0
            if not filtermgi:
-              writeGP_row(gaf_row,gpi_row_displayed,gpi,GPI_FIELDS,is_gpad,is_g_variant,parent_gp_id,evidence_code)
-    mrkCountMis=0
+              writeGP_row(gaf_row,gpi_row_displayed,gpi,gaf.gpi_plan,is_gpad,is_g_variant,parent_gp_id,evidence_code)
+
+#
+# Returns the values of column at the positions keep (a list)
+#
+def takeColumn(column,keep):
+    if len(keep)==1: return [column[keep[0]]]
+    return list(operator.itemgetter(*keep)(column))
+
+#
+# Maps the distinct values of a column with value_map, calling
+# compute(value) for the values not mapped yet
+# Returns the mapped column
+#
+def mapColumn(column,value_map,compute):
+    for value in set(column):
+        if value not in value_map: value_map[value]=compute(value)
+    return map(value_map.__getitem__,column)
+
+#
+# Returns the GPAD relationship of a (qualifier,aspect) pair
+#
+def columnRelationship(qualifier_aspect):
+    gaf_row=[""]*len(gaf.fields)
+    gaf_row[gaf.qual_index],gaf_row[gaf.aspect_index]=qualifier_aspect
+    return gaf.getGPAD_relationship(gaf_row)
+
+#
+# Returns the (gpi taxon,gpad interacting taxon) of a gaf taxon field
+#
+def columnTaxon(taxon):
+    taxa=taxon.split("|")
+    return (taxa[0],"".join(taxa[1:]))
+
+#
+# Joins the gpad or gpi rows of a batch from the columns of the projection plan g_plan
+#
+def joinGP_columns(g_plan,columns,taxon_column,evidence_column,parent_column,blank_column):
+    gf_columns=[]
+    for plan_type,gaf_index in g_plan:
+        if plan_type==PLAN_FIELD: gf_columns.append(columns[gaf_index])
+        elif plan_type==PLAN_TAXON: gf_columns.append(taxon_column)
+        elif plan_type==PLAN_EVIDENCE: gf_columns.append(evidence_column)
+        elif plan_type==PLAN_PARENT: gf_columns.append(parent_column)
+        else: gf_columns.append(blank_column)
+    return map("\t".join,zip(*gf_columns))
+
+#
+# Writes the rows of a batch not filtered as duplicates in one write
+#
+def writeGP_rows(gf_rows,gf_row_displayed,gfh):
+    gf_rows=[line for line in gf_rows if gf_row_displayed.add(line)]
+    if gf_rows: gfh.write("\n".join(gf_rows)+"\n")
+
+#
+# Columnar engine (--engine=columnar): converts the rows of a gaf reader
+# by batches of batch_rows rows (default config.COLUMNAR_BATCH_ROWS).
+# The rows of a batch are turned into columns and every check and mapping of
+# convertGaf_rows runs over a whole column - the ECO code, the relationship,
+# the DB check and the taxon split once per distinct value of the run (value_maps).
+# Rejects, tallies and duplicate filters still follow the file order, so the
+# gpad/gpi files and the QC summary are the same as with convertGaf_rows
+#
+def convertGaf_columnar(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                        feature_type_map,protein_map,tally,show_progress=True,batch_rows=None):
+    if batch_rows is None: batch_rows=config.COLUMNAR_BATCH_ROWS
+    value_maps={"db":{},"eco":{},"relationship":{},"taxon":{}}
+    #the batches make no reference cycles - without the cyclic garbage collector
+    #the columns of a batch are not scanned again and again while they are built
+    gc_enabled=gc.isenabled()
+    gc.disable()
+    rows=iter(reader)
+    try:
+        while True:
+            batch=list(itertools.islice(rows,batch_rows))
+            if not batch: break
+            start=tally["row_count"]
+            convertGaf_batch(batch,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                             feature_type_map,protein_map,tally,value_maps)
+            if show_progress:
+                for row_count in range(start-start%10000+10000,tally["row_count"]+1,10000):
+                    print >>sys.stderr, "%d lines processed"%(row_count)
+    finally:
+        if gc_enabled: gc.enable()
+
+#
+# Converts one batch of gaf rows (see convertGaf_columnar)
+#
+def convertGaf_batch(batch,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                     feature_type_map,protein_map,tally,value_maps):
+    tally["row_count"]+=len(batch)
+    field_count=len(gaf.fields)
+    rows=[line for line in batch if not line[0].startswith("!")]
+    rejects=[None]*len(rows)
+    good=[]
+    for i in range(len(rows)):
+        if len(rows[i]) == field_count: good.append(i)
+        else: rejects[i]=("fieldCountMis","\tFields count mismatch:%d - %d" %(len(rows[i]),field_count))
+    keep=[]
+    if good:
+        columns=zip(*[rows[i] for i in good])
+        #checks in the order of convertGaf_rows - the first failed check rejects the row
+        missing=[0]*len(good)
+        for field_index in gaf.required_indexes:
+            for j in [j for j,value in enumerate(columns[field_index]) if not value]:
+                if not missing[j]: missing[j]=field_index+1
+        db_valid=mapColumn(columns[gaf.db_index],value_maps["db"],goref.GO_DATABASES.__contains__)
+        eco_codes=mapColumn(zip(columns[gaf.goref_index],columns[gaf.evidence_index]),value_maps["eco"],
+                            lambda (go_ref,evidence_code):eco.getECO_code(go_ref,evidence_code,
+                                                                         goref.COLLECTION,eco.GAF_ECO_MAP))
+        relationships=mapColumn(zip(columns[gaf.qual_index],columns[gaf.aspect_index]),
+                                value_maps["relationship"],columnRelationship)
+        if 0 <= gaf.product_form_id_index < field_count:
+            proteins=columns[gaf.product_form_id_index]
+            variants=[":" in protein for protein in proteins]
+        else:
+            proteins=None
+            variants=[False]*len(good)
+        for j in range(len(good)):
+            if missing[j]:
+                rejects[good[j]]=("missFields","\tThe first GAF missing field is at index %d"%(missing[j]))
+            elif not db_valid[j]:
+                rejects[good[j]]=("badDB","\tThe DB field has an invalid value")
+            elif not eco_codes[j]:
+                rejects[good[j]]=("badEvCode","\tBad Evidence code")
+            elif not relationships[j]:
+                rejects[good[j]]=("badAspect","\tBad Aspect field")
+            elif variants[j] and "|" in proteins[j]:
+                rejects[good[j]]=("badIsoform","\t --- Bad Gene Product Form ID field")
+            else:
+                keep.append(j)
+    for i in range(len(rows)):
+        if rejects[i] is not None: qc.reject(rejects[i][0],rows[i],rejects[i][1])
+    if not keep: return
+    #
+    # Output columns of the kept rows - as convertGaf_rows sets the gaf row fields
+    #
+    out_columns={}
+    for g_plan in (gaf.gpad_plan,gaf.gpi_plan):
+        for plan_type,gaf_index in g_plan:
+            if plan_type==PLAN_FIELD and gaf_index not in out_columns:
+                out_columns[gaf_index]=takeColumn(columns[gaf_index],keep)
+    dbs=takeColumn(columns[gaf.db_index],keep)
+    objects=takeColumn(columns[gaf.object_index],keep)
+    evidence_codes=takeColumn(columns[gaf.evidence_index],keep)
+    eco_codes=takeColumn(eco_codes,keep)
+    parents=[" "]*len(keep)
+    if proteins is not None:
+        proteins=takeColumn(proteins,keep)
+        variants=takeColumn(variants,keep)
+        out_dbs=list(dbs)
+        out_objects=list(objects)
+        for k in [k for k in range(len(keep)) if variants[k]]:
+            #a gene variant protein is never empty (it has a ":")
+            protein_map[proteins[k]]=objects[k]
+            parents[k]=dbs[k]+":"+objects[k]
+            out_dbs[k],out_objects[k]=proteins[k].split(":",1)
+        out_columns[gaf.db_index]=out_dbs
+        out_columns[gaf.object_index]=out_objects
+    out_columns[gaf.evidence_index]=eco_codes
+    #no Annotation_Extension field in GAF 1.0: the index -1 sets the last field as convertGaf_rows does
+    extension_index=gaf.annotation_extension_index%field_count
+    extensions=takeColumn(columns[extension_index],keep)
+    out_columns[extension_index]=[extension+"|"+eco_code if extension else eco_code
+                                                 for extension,eco_code in zip(extensions,eco_codes)]
+    out_columns[gaf.qual_index]=takeColumn(relationships,keep)
+    #Keep tally of feature types - new feature types are added in file order
+    batch_features={}
+    feature_order=[]
+    for feature_type in takeColumn(columns[gaf.feature_type_index],keep):
+        if feature_type in batch_features:
+           batch_features[feature_type]+=1
+        else:
+           batch_features[feature_type]=1
+           feature_order.append(feature_type)
+    for feature_type in feature_order:
+        if feature_type in feature_type_map:
+           feature_type_map[feature_type]+=batch_features[feature_type]
+        else:
+           feature_type_map[feature_type]=batch_features[feature_type]
+    taxa=mapColumn(takeColumn(columns[gaf.taxon_index],keep),value_maps["taxon"],columnTaxon)
+    blanks=[" "]*len(keep)
+    gpad_rows=joinGP_columns(gaf.gpad_plan,out_columns,[taxon[1] for taxon in taxa],evidence_codes,parents,blanks)
+    writeGP_rows(gpad_rows,gpad_row_displayed,gpad)
+    if not filtermgi:
+        gpi_rows=joinGP_columns(gaf.gpi_plan,out_columns,[taxon[0] for taxon in taxa],evidence_codes,parents,blanks)
+        writeGP_rows(gpi_rows,gpi_row_displayed,gpi)
+
+#
+# Converts the gaf rows with the conversions of the previous run kept by
+# row_cache (goa_incremental.RowCache): only the new rows and the rejected
+# rows are converted (by convertGaf_rows), then every row is tallied and
+# written in file order as convertGaf_rows does
+#
+def convertGaf_incremental(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                           feature_type_map,protein_map,tally,row_cache):
+    gpad_capture=goa_incremental.RowCapture()
+    gpi_capture=goa_incremental.RowCapture()
+    for line in reader:
+        key=goa_incremental.rowKey(line)
+        row=row_cache.get(key)
+        if row is None:
+            gpad_capture.line=None
+            gpi_capture.line=None
+            row_features={}
+            row_proteins={}
+            row_tally=newGaf_tally()
+            convertGaf_rows([line],None,None,qc,filtermgi,gpad_capture,gpi_capture,
+                            row_features,row_proteins,row_tally,False)
+            if gpad_capture.line is None:
+                #comment or rejected row - converted again next time
+                tally["row_count"]+=1
+                if tally["row_count"]%10000==0: print >>sys.stderr, "%d lines processed"%(tally["row_count"])
+                continue
+            protein=None
+            object_id=None
+            for protein in row_proteins: object_id=row_proteins[protein]
+            row=(gpad_capture.line,gpi_capture.line,row_features.keys()[0],protein,object_id,
+                 row_tally["totalEmptyProt"])
+            row_cache.converted+=1
+        else:
+            row_cache.reused+=1
+        row_cache.put(key,row)
+        gpad_line,gpi_line,feature_type,protein,object_id,empty_protein=row
+        tally["row_count"]+=1
+        if tally["row_count"]%10000==0: print >>sys.stderr, "%d lines processed"%(tally["row_count"])
+        tally["totalEmptyProt"]+=empty_protein
+        if protein is not None: protein_map[protein]=object_id
+        if feature_type in feature_type_map:
+           feature_type_map[feature_type]+=1
+        else:
+           feature_type_map[feature_type]=1
+        if gpad_row_displayed.add(gpad_line): gpad.write(gpad_line+"\n")
+        if gpi_line is not None and gpi_row_displayed.add(gpi_line): gpi.write(gpi_line+"\n")
+
+#
+# Returns the signature of the incremental conversion sidecar: the
+# conversion depends on the gaf version, filtermgi and the map source files
+#
+def incrementalSignature(gaf_version,filtermgi):
+    sources=[(os.path.basename(source_file),digest) for (source_file,size,mtime,digest)
+             in goa_snapshot.sourceSignatures(MAPS_SOURCE_FILES)]
+    return {"gaf_version":gaf_version,"mgi":filtermgi,"sources":sources}
+
+#
+# Splits the gaf file into byte ranges that start and end on line boundaries
+# Returns the list of (start,end) offsets
+#
+def splitGaf_chunks(gaf_file,chunk_count):
+    size=os.path.getsize(gaf_file)
+    bounds=[0]
+    gfh=open(gaf_file,'rb')
+    for i in range(1,chunk_count):
+        gfh.seek(size*i/chunk_count)
+        gfh.readline()
+        offset=gfh.tell()
+        if offset > bounds[-1] and offset < size: bounds.append(offset)
+    gfh.close()
+    bounds.append(size)
+    chunks=[]
+    for i in range(len(bounds)-1):
+        chunks.append((bounds[i],bounds[i+1]))
+    return chunks
+
+#
+# Iterates over the blocks of the gaf file in the byte range [start,end)
+# (start and end are line boundaries - see splitGaf_chunks)
+#
+def readGaf_chunk(gaf_file,start,end):
+    gfh=open(gaf_file,'rb')
+    gfh.seek(start)
+    offset=start
+    while offset < end:
+        block=gfh.read(min(goa_io.BLOCK_SIZE,end-offset))
+        if not block: break
+        offset+=len(block)
+        yield block
+    gfh.close()
+
+#
+# Worker: converts one byte range of the gaf file into gpad/gpi/log shard files
+# task=(gaf_file,start,end,shard_prefix,filtermgi,dedup_mode,dedup_budget,qc_level,qc_sample_cap,engine)
+# The shard log is a tagged goa_qc log replayed by the parent
+# Returns the shard tally, the shard feature type and protein maps
+# (with their key insertion order), the shard duplicate rows counts,
+# the shard ECO code cache hits and misses and the shard reject counts
+#
+def convertGaf_chunk(task):
+    gaf_file,start,end,shard_prefix,filtermgi,dedup_mode,dedup_budget,qc_level,qc_sample_cap,engine=task
+    gpad=open(shard_prefix+".gpad","w")
+    gpi=open(shard_prefix+".gpi","w")
+    log=open(shard_prefix+".log","w")
+    qc=goa_qc.QcLog(log,qc_level,qc_sample_cap,tagged=True)
+    shard_dir=os.path.dirname(shard_prefix)
+    gpad_row_displayed=goa_dedup.newRowFilter(dedup_mode,dedup_budget,shard_dir)
+    gpi_row_displayed=goa_dedup.newRowFilter(dedup_mode,dedup_budget,shard_dir)
+    feature_type_map=KeyOrderDict()
+    protein_map=KeyOrderDict()
+    tally=newGaf_tally()
+    #worker processes are reused - only report this chunk cache lookups
+    cache_hits=goa_specs.eco_code_cache.hits
+    cache_misses=goa_specs.eco_code_cache.misses
+    reader = goa_io.TabReader(readGaf_chunk(gaf_file,start,end))
+    convertGaf=convertGaf_rows
+    if engine=="columnar": convertGaf=convertGaf_columnar
+    convertGaf(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+               feature_type_map,protein_map,tally,False)
+    gpad_row_displayed.close()
+    gpi_row_displayed.close()
+    gpad.close()
+    gpi.close()
+    log.close()
+    eco_cache=goa_specs.eco_code_cache
+    return (tally,feature_type_map.key_order,dict(feature_type_map),
+            protein_map.key_order,dict(protein_map),
+            gpad_row_displayed.hits,gpi_row_displayed.hits,
+            eco_cache.hits-cache_hits,eco_cache.misses-cache_misses,
+            qc.categories,qc.counts)
+
+#
+# Appends the rows of a shard file to the output, filtering rows
+# already displayed by previous shards
+#
+def mergeGP_shard(shard_file,gf_row_displayed,gfh):
+    for line in open(shard_file):
+        if gf_row_displayed.add(line[:-1]):
+            gfh.write(line)
+
+#
+# Converts the gaf body with a pool of worker processes.
+# Each worker converts a byte range of the gaf file into shard files,
+# the shards are then merged in file order - filtering duplicates 
+# across shards - so the output is the same as a single process run
+# A compressed or streamed gaf file (gaf_reader: its GFileReader) is
+# first copied to a plain file in the shard directory
+#
+def convertGaf_parallel(gaf_file,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                        feature_type_map,protein_map,tally,workers,dedup_mode=None,dedup_budget=None,
+                        decompress=None,gaf_reader=None,tmp_dir=None,engine=None):
+    if tmp_dir is None: tmp_dir=os.path.dirname(os.path.abspath(gpad.name))
+    shard_dir=tempfile.mkdtemp(prefix="gaf_shards.",dir=tmp_dir)
+    try:
+        if not goa_io.isPlainFile(gaf_file):
+            plain_gaf=os.path.join(shard_dir,"input.gaf")
+            if gaf_reader is None: gaf_reader=GFileReader(goa_io.openInput(gaf_file,decompress))
+            gaf_reader.copy(plain_gaf)
+            gaf_file=plain_gaf
+        tasks=[]
+        chunks=splitGaf_chunks(gaf_file,workers*4)
+        for i in range(len(chunks)):
+            start,end=chunks[i]
+            tasks.append((gaf_file,start,end,os.path.join(shard_dir,"shard.%d"%(i)),filtermgi,
+                          dedup_mode,dedup_budget,qc.innerLevel(),qc.sample_cap,engine))
+        pool=multiprocessing.Pool(workers)
+        try:
+            i=0
+            for result in pool.imap(convertGaf_chunk,tasks):
+                shard_tally,feature_order,shard_features,protein_order,shard_proteins=result[0:5]
+                gpad_hits,gpi_hits,cache_hits,cache_misses,qc_categories,qc_counts=result[5:11]
+                #duplicates already filtered within the shard
+                gpad_row_displayed.hits+=gpad_hits
+                gpi_row_displayed.hits+=gpi_hits
+                goa_specs.eco_code_cache.hits+=cache_hits
+                goa_specs.eco_code_cache.misses+=cache_misses
+                shard_prefix=tasks[i][3]
+                mergeGP_shard(shard_prefix+".gpad",gpad_row_displayed,gpad)
+                if not filtermgi:mergeGP_shard(shard_prefix+".gpi",gpi_row_displayed,gpi)
+                qc.replay(open(shard_prefix+".log"))
+                qc.addCounts(qc_counts,qc_categories)
+                for key in shard_tally: tally[key]+=shard_tally[key]
+                for feature_type in feature_order:
+                    if feature_type in feature_type_map:
+                        feature_type_map[feature_type]+=shard_features[feature_type]
+                    else:
+                        feature_type_map[feature_type]=shard_features[feature_type]
+                for protein in protein_order:protein_map[protein]=shard_proteins[protein]
+                for ext in (".gpad",".gpi",".log"): os.remove(shard_prefix+ext)
+                i+=1
+                print >>sys.stderr, "%d of %d gaf chunks processed - %d lines"%(i,len(tasks),tally["row_count"])
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        pool.join()
+    finally:
+        shutil.rmtree(shard_dir,True)
+
+#
+# Returns a new tally map for the gaf conversion counters
+#
+#(the rejected rows are counted by the goa_qc log)
+#
+def newGaf_tally():
+    return {"row_count":0,       #Keeps track of the number of lines read
+            "totalEmptyProt":0}  #Keeps track of entries where the protein field is empty
+
+#
+#Generates gpad and gpi files 
+#from a gaf file using goa specification
+#Both the gpi and gpad file will have the same
+#version as the input gaf file
+#If workers > 1, the gaf rows are converted by a pool of worker processes
+#Duplicate rows are filtered with goa_dedup filters (dedup_mode: lines, digest
+#or external - default config.DEDUP_MODE)
+#A compressed gaf file is detected (see goa_io), the gpad and gpi files are
+#written with output_codec/output_level (default from the file names)
+#The gaf file is read once (it can be a pipe or - for stdin)
+#Bad rows are rejected to the goa_qc log qc (default: a QcLog of log
+#with the config.QC_LEVEL) - its summary replaces the tally
+#With row_cache (goa_incremental.RowCache) only the rows changed since the
+#previous run are converted, in one process
+#engine: row (convertGaf_rows) or columnar (convertGaf_columnar) - default config.ENGINE
+#export_format: also write the gpad/gpi rows to a parquet or arrow file (see goa_export),
+#instead of the gpad/gpi files if export_only is set
+#
+def generateGpiGpad(gaf_file,gpad_file,gpi_file,log,filtermgi,workers=1,dedup_mode=None,dedup_budget=None,
+                    output_codec=None,output_level=None,decompress=None,qc=None,row_cache=None,engine=None,
+                    export_format=None,export_only=False):
+    if engine is None: engine=config.ENGINE
+    goa_profile.run.start("gaf_header")
+    own_qc=qc is None
+    if own_qc: qc=goa_qc.QcLog(log)
+    qc.declare(goa_qc.GAF_CATEGORIES)
+    tmp_dir=goa_io.workDir(gpad_file)
+    gaf_reader=GFileReader(goa_io.openInput(gaf_file,decompress))
+    gpad=goa_export.openOutput(gpad_file,output_codec,output_level,export_format,export_only,
+                               "gpad",GPAD_FIELDS,GPAD_FIELDS_LABEL,tmp_dir)
+    gpi=goa_export.openOutput(gpi_file,output_codec,output_level,export_format,export_only,
+                              "gpi",GPI_FIELDS,GPI_FIELDS_LABEL,tmp_dir)
+    gaf_header=gaf_reader.header
+    gaf_version=gaf_reader.version
+    #initiate gaf object
+    gaf._init(gaf_version)
+    gpad_row_displayed=goa_dedup.newRowFilter(dedup_mode,dedup_budget,tmp_dir) #filters gpad duplicate rows if any
+    gpi_row_displayed=goa_dedup.newRowFilter(dedup_mode,dedup_budget,tmp_dir)  #filters gpi duplicate rows if any
+    feature_type_map={}
+    protein_map={}        #stores protein-gene mapping
+    tally=newGaf_tally()
+    gpad_title="!gpad-version: %s\n"%(gaf_version)
+    gpi_title="!gpi-version: %s\n"%(gaf_version)
+    type="gpad"
+    displayGFile_header(gpad,gaf_header,gpad_title,GPAD_FIELDS,GPAD_FIELDS_LABEL,type,gaf_version)
+    type="gpi"
+    displayGFile_header(gpi,gaf_header,gpi_title,GPI_FIELDS,GPI_FIELDS_LABEL,type,gaf_version)
+    
+    log.write("GAF file data log:\n")
+    goa_profile.run.stop("gaf_header")
+    goa_profile.run.start("convert",hot=True)
+    if workers > 1 and row_cache is None:
+        gpad.flush()
+        gpi.flush()
+        log.flush()
+        waitMaps_log()
+        convertGaf_parallel(gaf_file,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                            feature_type_map,protein_map,tally,workers,dedup_mode,dedup_budget,decompress,
+                            gaf_reader,tmp_dir,engine)
+    else:
+        #the header lines are counted as read rows
+        tally["row_count"]=len(gaf_reader.header_lines)
+        reader = goa_io.TabReader(gaf_reader)
+        if row_cache is not None:
+            row_cache.load(incrementalSignature(gaf_version,filtermgi))
+            convertGaf_incremental(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                                   feature_type_map,protein_map,tally,row_cache)
+        elif engine=="columnar":
+            convertGaf_columnar(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                                feature_type_map,protein_map,tally)
+        else:
+            convertGaf_rows(reader,gpad,gpi,qc,filtermgi,gpad_row_displayed,gpi_row_displayed,
+                            feature_type_map,protein_map,tally)
+    gaf_reader.close()
+    goa_profile.run.stop("convert",tally["row_count"],hot=True)
     if filtermgi:
-       mrkCountMis+=generateGPI_mgi(gpi,protein_map,log)
+       generateGPI_mgi(gpi,protein_map,log,gpi_row_displayed,qc)
+    goa_profile.run.start("tally")
     log.write("***************\nGAF file features tally\n*************\n\n")
     log.write("feature_type\tRow Count\n")
     for feature_type in feature_type_map:
         log.write(feature_type+"\t%d"%(feature_type_map[feature_type])+"\n")
    
-    log.write("\nTotal rows with empty Protein field: %d " %(totalEmptyProt))
-    log.write("\nTotal rows with invalid Evidence Code : %d " %(badEvCode))
-    log.write("\nTotal Protein ID count: %d " %(len(protein_map)))
-    log.write("\nTotal GAF rows with field count !=%d : %d" %(len(gaf.fields),fieldCountMis))
-    log.write("\nTotal GAF rows with invalid DB : %d" %(badDB))
-    log.write("\nTotal GAF rows with invalid Aspect : %d" %(badAspect))
-    log.write("\nTotal GAF rows with invalid Gene form ID : %d" %(badIsoform))
-    if filtermgi: 
-       log.write("\nTotal MGI Marker report: rows with field count !=%d : %d" %(len(MRK_FIELDS),mrkCountMis))
+    counters=[("row_count",tally["row_count"]),("totalEmptyProt",tally["totalEmptyProt"]),
+              ("protein_ids",len(protein_map))]
+    qc.report(log,"GAF to GPAD/GPI",counters)
+    if own_qc: qc.close()
+    if row_cache is not None: row_cache.finish(log,gpad_file,gpi_file,filtermgi)
+    gpad_row_displayed.report(log,"GPAD")
+    gpi_row_displayed.report(log,"GPI")
+    for label,row_filter in (("gpad",gpad_row_displayed),("gpi",gpi_row_displayed)):
+        goa_profile.run.count(label+"_rows_written",row_filter.entries())
+        goa_profile.run.count(label+"_duplicates",row_filter.hits)
+    goa_profile.run.count("gaf_rows_read",tally["row_count"])
+    gpad_row_displayed.close()
+    gpi_row_displayed.close()
+    reportEco_cache()
+    goa_profile.run.stop("tally")
     log.write("\nProgram Complete")
+    goa_profile.run.start("close")
     gpad.close()
     gpi.close()
+    goa_profile.run.stop("close")
+
+#
+# Checks the gpad and gpi files generated from gaf_file (by an incremental
+# run) against a full rebuild written to a temp directory, and the QC
+# counts of qc against the QC counts of the full rebuild
+# Writes the result to log - returns True if they are the same
+#
+def verifyGpiGpad(gaf_file,gpad_file,gpi_file,log,filtermgi,qc,dedup_mode=None,dedup_budget=None,decompress=None):
+    verify_dir=tempfile.mkdtemp(prefix="gaf_verify.",dir=goa_io.workDir(gpad_file))
+    #the rebuild runs under its own goa_profile run: its stages and counters
+    #are not added to the run verified (and it is not profiled)
+    run=goa_profile.run
+    run.start("verify")
+    try:
+        full_gpad=os.path.join(verify_dir,"full.gpad")
+        full_gpi=os.path.join(verify_dir,"full.gpi")
+        full_log=open(os.path.join(verify_dir,"full.log"),"w")
+        full_qc=goa_qc.QcLog(full_log,"counts")
+        goa_profile.newRun("verify")
+        try:
+            generateGpiGpad(gaf_file,full_gpad,full_gpi,full_log,filtermgi,1,dedup_mode,dedup_budget,
+                            "none",None,decompress,full_qc)
+        finally:
+            goa_profile.run=run
+        full_log.close()
+        log.write("\n***************\nVerification against a full rebuild\n***************\n")
+        same=True
+        for label,gp_file,full_file in (("GPAD",gpad_file,full_gpad),("GPI",gpi_file,full_gpi)):
+            line_number=goa_incremental.compareOutputs(gp_file,full_file)
+            if line_number:
+                log.write("%s: differs from the full rebuild at line %d\n"%(label,line_number))
+                same=False
+            else:
+                log.write("%s: same as the full rebuild\n"%(label))
+        if qc.counters != full_qc.counters or qc.counts != full_qc.counts:
+            log.write("QC summary: differs from the full rebuild\n")
+            same=False
+        else:
+            log.write("QC summary: same as the full rebuild\n")
+        return same
+    finally:
+        run.stop("verify")
+        shutil.rmtree(verify_dir,True)
 
 #
 #generates the GPI file using MGI MRK_List2.rpt and 
 #gpi_type as defined by Mary Dolan
+#The marker report is read through the goa_markers store: the gene rows
+#are formatted from the stored markers as they are written, then the protein
+#rows of protein_map
+#gpi_row_displayed is the goa_dedup filter used to filter gpi duplicate rows
+#Marker rows with a field count mismatch and proteins of markers missing from
+#the report are rejected to the goa_qc log qc (default: a QcLog of log)
+#Returns the number of marker rows with a field count mismatch
 #
-def generateGPI_mgi(gpi,protein_map,log):
-     reader = csv.reader(open(LOCAL_MGI_REPORT_FILE, 'rb'), dialect='excel-tab')
-     log.write("\n************\nData log for MGI marker report :"+LOCAL_MGI_REPORT_FILE+"\n************\n") 
-     total=0
-     mgi2symbol={} #maps mgi accession id to marker symbol
-     mgi2name={}   #maps mgi accession id to marker name
-     mgi2syn={}    #maps mgi accession id to marker synonym
-     gpi_row_displayed={}
-     taxon = "taxon:10090"
-     db="MGI"
-     for line in reader:
-         if not line[3].startswith("genome"):
-            mrk_row=[]
-            for field in line:
-                mrk_row.append(field)
-            if len(mrk_row) != len(MRK_FIELDS):
-               log.write(line+" -------- %d" %(len(mrk_row))+"\n")
-               total+=1
-               continue
-            mgi_id=mrk_row[mrk_object_id_index]
-            mgi2symbol[mgi_id]=mrk_row[mrk_object_index]
-            mgi2name[mgi_id]=mrk_row[mrk_object_name_index]
-            mgi2syn[mgi_id]=mrk_row[mrk_object_syn_index]
-            ftype=mrk_row[mrk_ftype_index]
-            if ftype in goa_specs.gpi_type:
-               mrk_row[mrk_ftype_index]=goa_specs.gpi_type[ftype]
-               writeGPI_MGI_row(mrk_row,gpi_row_displayed,gpi,taxon,db) 
+def generateGPI_mgi(gpi,protein_map,log,gpi_row_displayed=None,qc=None):
+     if qc is None: qc=goa_qc.QcLog(log)
+     qc.declare(goa_qc.MRK_CATEGORIES)
+     goa_profile.run.start("marker_store")
+     store=goa_markers.loadStore(LOCAL_MRK_REPORT_FILE)
+     goa_profile.run.stop("marker_store",len(store.markers))
+     goa_profile.run.start("mgi_gpi")
+     log.write("\n************\nData log for MGI marker report :"+LOCAL_MRK_REPORT_FILE+"\n************\n")
+     log.write("Marker store: %s - %d markers, %d gene rows\n"%(store.source,len(store.markers),
+               len(store.genes)))
+     if gpi_row_displayed is None: gpi_row_displayed=goa_dedup.newRowFilter()
+     for mrk_row in store.rejects:
+         qc.reject("mrk_fieldCountMis",mrk_row," -------- %d" %(len(mrk_row)))
+     for line in store.geneRows():
+         if gpi_row_displayed.add(line): gpi.write(line+"\n")
      #Now display proteins from protein_map
-     writeGPI_PROT_row(protein_map,gpi_row_displayed,gpi,mgi2symbol,mgi2name,mgi2syn,taxon,log,db) 
-     return total
-#
-# Write MGI genes
-#
-def writeGPI_MGI_row(mrk_row,gpi_row_displayed,gpi,taxon,db):
-    gpi_row=[]
-    for i in range(len(GPI_FIELDS)):
-        if GPI_FIELDS[i] in MRK_FIELDS:
-           mrk_index=MRK_FIELDS.index(GPI_FIELDS[i])
-           gpi_row.append(mrk_row[mrk_index])
-        elif i == gpi_taxon_index:
-           gpi_row.append(taxon)
-        elif i ==gpi_db_index:
-           gpi_row.append(db) 
-        else:
-           gpi_row.append("")
-    line="\t".join(gpi_row)
-    if not line in gpi_row_displayed:
-       gpi_row_displayed[line]=1
-       gpi.write(line+"\n")
+     writeGPI_PROT_row(protein_map,gpi_row_displayed,gpi,store,goa_markers.MGI_TAXON,qc,goa_markers.MGI_DB)
+     goa_profile.run.stop("mgi_gpi",len(store.genes)+len(protein_map))
+     return len(store.rejects)
 #
-# Write assocated protein 
+# Write assocated protein - only the markers of protein_map are looked up
 #
-def writeGPI_PROT_row(protein_map,gpi_row_displayed,gpi,mgi2symbol,mgi2name,mgi2syn,taxon,log,db):
+def writeGPI_PROT_row(protein_map,gpi_row_displayed,gpi,store,taxon,qc,db):
     for protein in protein_map:
         mgi_id=protein_map[protein]
         fields=protein.split(":")
         prot_db=fields[0]
         protein_id=fields[1]
-        if not mgi_id in mgi2symbol:
-            log.write(protein_id+"\n"+mgi_id+" - not in MGI\n")
+        marker=store.marker(mgi_id)
+        if marker is None:
+            qc.reject("mrk_notInMgi",[protein,mgi_id]," - not in MGI")
         else:
+            symbol,name,synonyms,gpi_type=marker
             gpi_row=[]
             for i in range(len(GPI_FIELDS)):
                 if i == gpi_db_index:
@@ -733,11 +1406,11 @@ def writeGPI_PROT_row(protein_map,gpi_row_displayed,gpi,mgi2symbol,mgi2name,mgi2
                 elif i==gpi_db_object_index:
                     gpi_row.append(protein_id)
                 elif i== gpi_object_symbol_index:
-                    gpi_row.append(mgi2symbol[mgi_id])
+                    gpi_row.append(symbol)
                 elif i == gpi_object_name_index:
-                    gpi_row.append(mgi2name[mgi_id])
+                    gpi_row.append(name)
                 elif i == gpi_object_syn_index:
-                    gpi_row.append(mgi2syn[mgi_id])
+                    gpi_row.append(synonyms)
                 elif i== gpi_object_type_index:
                     gpi_row.append("protein")
                 elif i == gpi_taxon_index:
@@ -747,8 +1420,7 @@ def writeGPI_PROT_row(protein_map,gpi_row_displayed,gpi,mgi2symbol,mgi2name,mgi2
                 else:
                     gpi_row.append("")
             line="\t".join(gpi_row)
-            if not line in gpi_row_displayed:
-                gpi_row_displayed[line]=1
+            if gpi_row_displayed.add(line):
                 gpi.write(line+"\n")
                
 #
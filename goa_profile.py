@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_profile times the stages of a conversion run (dependency setup,
+# map loading, header handling, the conversion loop, the MGI GPI rows,
+# the tallies and the output files) and keeps run counters (rows read
+# and written, duplicate filter and ECO code cache hits).
+#
+# goa_parser reports its stages to the module run (goa_profile.run):
+#   run.start(name) / run.stop(name,rows) -> seconds, calls and rows of a stage
+#   run.count(name,value) / run.setCounter(name,value) -> counters
+# The converters write the stage table to their log and, with
+# --run-report=file.json, the run report: rows/sec per stage, counters
+# and peak memory (ru_maxrss of the process and its worker processes).
+#
+# The hot stages (the conversion and join loops) can be profiled
+# (--profile=file): cprofile dumps a pstats file, sample dumps the
+# stack samples taken every config.PROFILE_SAMPLE_INTERVAL seconds of
+# CPU time (SIGPROF). Worker processes (--workers) are not profiled.
+#
+'''
+
+import os,time,json
+import signal,resource
+import cProfile,pstats
+import config
+
+#
+# Profiler of the hot stages
+#
+class HotProfiler:
+    def __init__(self,profile_file,mode=None,interval=None):
+        if mode is None: mode=config.PROFILE_MODE
+        if interval is None: interval=config.PROFILE_SAMPLE_INTERVAL
+        self.profile_file=profile_file
+        self.mode=mode
+        self.interval=interval
+        self.profiler=None
+        self.samples=0
+        self.self_counts={}
+        self.total_counts={}
+        if mode == "cprofile": self.profiler=cProfile.Profile()
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+            return
+        signal.signal(signal.SIGPROF,self.sample)
+        #restart the system calls interrupted by a sample
+        signal.siginterrupt(signal.SIGPROF,False)
+        signal.setitimer(signal.ITIMER_PROF,self.interval,self.interval)
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            return
+        signal.setitimer(signal.ITIMER_PROF,0,0)
+        signal.signal(signal.SIGPROF,signal.SIG_DFL)
+
+    #SIGPROF handler: counts the running function (self) and every function of the stack (total)
+    def sample(self,signum,frame):
+        self.samples+=1
+        seen=set()
+        key=functionKey(frame.f_code)
+        self.self_counts[key]=self.self_counts.get(key,0)+1
+        while frame is not None:
+            key=functionKey(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[key]=self.total_counts.get(key,0)+1
+            frame=frame.f_back
+
+    #
+    # Returns the sampled functions: (self samples,total samples,function) by self samples
+    #
+    def sampled(self):
+        functions=[(self.self_counts.get(key,0),self.total_counts[key],key) for key in self.total_counts]
+        functions.sort(key=lambda function:(-function[0],-function[1],function[2]))
+        return functions
+
+    #
+    # Writes the profile file
+    #
+    def save(self):
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile_file)
+            return
+        pfh=open(self.profile_file,"w")
+        pfh.write("#samples: %d every %.4f s of CPU time\n"%(self.samples,self.interval))
+        pfh.write("#self\ttotal\tfunction\n")
+        for self_count,total_count,key in self.sampled():
+            pfh.write("%d\t%d\t%s\n"%(self_count,total_count,key))
+        pfh.close()
+
+    #
+    # Writes the top functions to the log
+    #
+    def report(self,log,top=None):
+        if top is None: top=config.PROFILE_TOP
+        log.write("\n***************\nProfile (%s): %s\n***************\n"%(self.mode,self.profile_file))
+        if self.profiler is not None:
+            stats=pstats.Stats(self.profiler,stream=log)
+            stats.sort_stats("cumulative").print_stats(top)
+            return
+        if not self.samples:
+            log.write("No samples\n")
+            return
+        log.write("samples\tself %\ttotal %\tfunction\n")
+        for self_count,total_count,key in self.sampled()[:top]:
+            log.write("%d\t%.1f\t%.1f\t%s\n"%(self_count,100.0*self_count/self.samples,
+                                              100.0*total_count/self.samples,key))
+
+def functionKey(code):
+    return "%s (%s:%d)"%(code.co_name,os.path.basename(code.co_filename),code.co_firstlineno)
+
+#
+# Returns the peak resident memory (KB) of the process and its worker processes
+#
+def peakRss():
+    #ru_maxrss is in KB on Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+#
+# Stage timers and counters of a run
+#
+class RunReport:
+    def __init__(self,name=""):
+        self.name=name
+        self.started=time.time()
+        self.stages=[]     #stage names in the order they started
+        self.timers={}     #stage name -> [seconds,calls,rows]
+        self.running={}    #stage name -> start time
+        self.counters={}
+        self.profiler=None
+
+    #
+    # Profiles the hot stages to profile_file (see HotProfiler)
+    #
+    def setProfiler(self,profile_file,mode=None):
+        self.profiler=HotProfiler(profile_file,mode)
+
+    def start(self,name,hot=False):
+        if name not in self.timers:
+            self.stages.append(name)
+            self.timers[name]=[0.0,0,None]
+        self.running[name]=time.time()
+        if hot and self.profiler is not None: self.profiler.start()
+
+    #rows: rows processed by the stage (added to the stage rows)
+    def stop(self,name,rows=None,hot=False):
+        if hot and self.profiler is not None: self.profiler.stop()
+        started=self.running.pop(name,None)
+        if started is None: return
+        timer=self.timers[name]
+        timer[0]+=time.time()-started
+        timer[1]+=1
+        if rows is not None: timer[2]=(timer[2] or 0)+rows
+
+    def count(self,name,value=1):
+        self.counters[name]=self.counters.get(name,0)+value
+
+    def setCounter(self,name,value):
+        self.counters[name]=value
+
+    #
+    # Returns the run report (plain containers)
+    #
+    def result(self):
+        stages=[]
+        for name in self.stages:
+            seconds,calls,rows=self.timers[name]
+            stage={"name":name,"seconds":round(seconds,4),"calls":calls}
+            if rows is not None:
+                stage["rows"]=rows
+                stage["rows_per_sec"]=round(rows/seconds,1) if seconds > 0 else None
+            stages.append(stage)
+        return {"run":self.name,"started":time.strftime("%Y-%m-%dT%H:%M:%S",time.localtime(self.started)),
+                "seconds":round(time.time()-self.started,4),"peak_rss_kb":peakRss(),
+                "stages":stages,"counters":self.counters}
+
+    #
+    # Writes the stage table and the counters to the log
+    #
+    def report(self,log):
+        result=self.result()
+        log.write("\n***************\nRun stages: %.2f s, peak RSS %.1f MB\n***************\n"
+                  %(result["seconds"],result["peak_rss_kb"]/1024.0))
+        log.write("stage\tseconds\tcalls\trows\trows/sec\n")
+        for stage in result["stages"]:
+            rows=rows_per_sec=""
+            if "rows" in stage:
+                rows="%d"%(stage["rows"])
+                if stage["rows_per_sec"] is not None: rows_per_sec="%.1f"%(stage["rows_per_sec"])
+            log.write("%s\t%.3f\t%d\t%s\t%s\n"%(stage["name"],stage["seconds"],stage["calls"],rows,rows_per_sec))
+        for name in sorted(self.counters):
+            log.write("%s\t%d\n"%(name,self.counters[name]))
+        if self.profiler is not None: self.profiler.report(log)
+
+    #
+    # Saves the run report (JSON) and the profile file
+    #
+    def save(self,report_file=None):
+        if self.profiler is not None: self.profiler.save()
+        if not report_file: return
+        rfh=open(report_file,"w")
+        json.dump(self.result(),rfh,indent=1,sort_keys=True)
+        rfh.write("\n")
+        rfh.close()
+
+#current run
+run=RunReport()
+
+#
+# Starts a new run (the stages and counters of the previous run are dropped)
+#
+def newRun(name="",profile_file=None,profile_mode=None):
+    global run
+    run=RunReport(name)
+    if profile_file: run.setProfiler(profile_file,profile_mode)
+    return run
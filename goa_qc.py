@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_qc logs the rows rejected by the converters.
+#
+# Every reject has a category (fieldCountMis, badDB, ...) and is counted.
+# The reject line is only built when it is written:
+#   - to the converter log, depending on the QC level (config.QC_LEVEL or --qc-level):
+#       counts  -> no reject lines, only the counts
+#       samples -> the first config.QC_SAMPLE_CAP rejects of each category
+#       full    -> every reject
+#   - to the reject file (--qc-rejects) when set: every reject as
+#     category<TAB>reject line, through a large write buffer
+#
+# The QC summary (the counters of the run and the count of each reject
+# category) replaces the free text tallies in the log, and can be saved
+# as JSON or TSV (--qc-summary=file.json|file.tsv).
+#
+# Rejects found by worker processes or by the sorted join are written to
+# a tagged log (one category<TAB>escaped line per reject) and replayed
+# in file order with replay(), so the samples are the same as a single
+# pass run.
+#
+'''
+
+import json
+import goa_sort,config
+
+QC_LEVELS=config.QC_LEVELS
+
+#
+# Reject categories and counters descriptions
+#
+QC_DESCRIPTIONS={
+    "row_count":"Rows read",
+    "fieldCountMis":"Rows with a field count mismatch",
+    "missFields":"Rows with missing required fields",
+    "badDB":"Rows with an invalid DB",
+    "badEvCode":"Rows with an invalid Evidence Code",
+    "badAspect":"Rows with an invalid Aspect",
+    "badIsoform":"Rows with an invalid Gene form ID",
+    "totalEmptyProt":"Rows with an empty Protein field",
+    "protein_ids":"Protein IDs",
+    "object_missing":"Object IDs in GPAD but not in GPI",
+    "mult_parents":"Annotated DB:Object_Form_ID with multiple gene parents",
+    "eco_w_mult_ev":"Rows with an ECO code mapping to multiple base Evidence codes",
+    "go_missing":"GPAD rows with a GO_ID not in the MGI GO_terms report",
+    "gpi_fieldCountMis":"GPI rows with a field count mismatch",
+    "gpi_missFields":"GPI rows with missing required fields",
+    "mrk_fieldCountMis":"MGI Marker report rows with a field count mismatch",
+    "mrk_notInMgi":"Protein IDs of a marker not in the MGI Marker report"}
+
+#
+# Reject categories of each converter (listed in the summary even when 0)
+#
+GAF_CATEGORIES=["fieldCountMis","missFields","badDB","badEvCode","badAspect","badIsoform"]
+GPAD_CATEGORIES=["gpi_fieldCountMis","gpi_missFields","fieldCountMis","missFields","badDB",
+                 "object_missing","eco_w_mult_ev","go_missing"]
+MRK_CATEGORIES=["mrk_fieldCountMis","mrk_notInMgi"]
+
+class QcLog:
+    def __init__(self,log,level=None,sample_cap=None,reject_file=None,summary_file=None,tagged=False):
+        if level is None: level=config.QC_LEVEL
+        if sample_cap is None: sample_cap=config.QC_SAMPLE_CAP
+        if level not in QC_LEVELS:
+            raise ValueError("Unknown QC level: %s (expected one of %s)"%(level,"|".join(QC_LEVELS)))
+        self.log=log
+        self.level=level
+        self.sample_cap=sample_cap
+        self.tagged=tagged
+        self.categories=[]
+        self.counts={}
+        self.samples={}
+        self.reject_file=reject_file
+        self.summary_file=summary_file
+        self.reject_fh=None
+        self.counters=[]    #counters of the last report
+        if reject_file: self.reject_fh=open(reject_file,"w",config.QC_REJECT_BUFFER)
+
+    #lists categories in the summary even when no row is rejected
+    def declare(self,categories):
+        for category in categories:
+            if category not in self.counts:
+                self.categories.append(category)
+                self.counts[category]=0
+
+    def _count(self,category,count=1):
+        if category not in self.counts:
+            self.categories.append(category)
+            self.counts[category]=0
+        self.counts[category]+=count
+
+    #True if the next reject of the category is written somewhere
+    def wanted(self,category):
+        if self.reject_fh is not None or self.level == "full": return True
+        return self.level == "samples" and len(self.samples.get(category,())) < self.sample_cap
+
+    #level of the tagged QcLog of a worker: every reject is needed for the reject file
+    def innerLevel(self):
+        if self.reject_fh is not None: return "full"
+        return self.level
+
+    #
+    # Counts a rejected row - the reject line is sep.join(fields)+suffix
+    #
+    def reject(self,category,fields,suffix="",sep="\t"):
+        self._count(category)
+        if not self.wanted(category): return
+        self._write(category,sep.join(fields)+suffix+"\n")
+
+    def _write(self,category,line):
+        if self.reject_fh is not None: self.reject_fh.write(category+"\t"+line)
+        if self.level == "counts": return
+        samples=self.samples.setdefault(category,[])
+        if len(samples) < self.sample_cap: samples.append(line[:-1])
+        elif self.level != "full": return
+        if self.tagged: self.log.write(category+"\t"+goa_sort.escapeRecord(line[:-1])+"\n")
+        else: self.log.write(line)
+
+    #
+    # Replays the rejects of a tagged log (lines) in order
+    # The rejects are counted with addCounts()
+    #
+    def replay(self,lines):
+        for record in lines:
+            category,text=record[:-1].split("\t",1)
+            self._write(category,goa_sort.unescapeRecord(text)+"\n")
+
+    #adds the counts of a worker/inner QcLog
+    def addCounts(self,counts,categories=None):
+        if categories is None: categories=sorted(counts)
+        for category in categories: self._count(category,counts[category])
+
+    #adds the samples of another QcLog up to the sample cap (not written to the log)
+    def addSamples(self,samples):
+        if self.level == "counts": return
+        for category in sorted(samples):
+            kept=self.samples.setdefault(category,[])
+            kept.extend(samples[category][:max(0,self.sample_cap-len(kept))])
+
+    def count(self,category):
+        return self.counts.get(category,0)
+
+    #
+    # Returns the summary rows (name,count,description): the given
+    # counters [(name,count)] then the reject categories
+    #
+    def summaryRows(self,counters=[]):
+        rows=[]
+        for name,count in counters: rows.append((name,count,QC_DESCRIPTIONS.get(name,"")))
+        for category in self.categories:
+            rows.append((category,self.counts[category],QC_DESCRIPTIONS.get(category,"")))
+        return rows
+
+    #
+    # Writes the QC summary table to the log (and to the summary file if set)
+    #
+    def report(self,log,title,counters=[]):
+        self.counters=list(counters)
+        if self.summary_file: self.writeSummary(self.summary_file,title,counters)
+        lines=["\n***************\nQC summary: %s (QC level: %s)\n***************\n"%(title,self.level),
+               "name\tcount\tdescription\n"]
+        for name,count,description in self.summaryRows(counters):
+            lines.append("%s\t%d\t%s\n"%(name,count,description))
+        if self.reject_file: lines.append("Rejected rows file: %s\n"%(self.reject_file))
+        log.write("".join(lines))
+
+    #
+    # Saves the QC summary as JSON (.json) or TSV (any other name)
+    #
+    def writeSummary(self,summary_file,title,counters=[]):
+        rows=self.summaryRows(counters)
+        sfh=open(summary_file,"w")
+        if summary_file.endswith(".json"):
+            summary={"title":title,"qc_level":self.level,"sample_cap":self.sample_cap,
+                     "reject_file":self.reject_file or "","counters":{},"rejects":{}}
+            for name,count,description in rows:
+                if name in self.categories:
+                    summary["rejects"][name]={"count":count,"description":description,
+                                              "samples":self.samples.get(name,[])}
+                else:
+                    summary["counters"][name]={"count":count,"description":description}
+            json.dump(summary,sfh,indent=1,sort_keys=True)
+            sfh.write("\n")
+        else:
+            sfh.write("name\tcount\ttype\tdescription\n")
+            for name,count,description in rows:
+                if name in self.categories: kind="reject"
+                else: kind="counter"
+                sfh.write("%s\t%d\t%s\t%s\n"%(name,count,kind,description))
+        sfh.close()
+
+    def close(self):
+        if self.reject_fh is not None:
+            self.reject_fh.close()
+            self.reject_fh=None
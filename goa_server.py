@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_server runs the converters as a local service.
+#
+# The converter is initiated once and the GO_REF/ECO maps stay loaded.
+# Every conversion job runs in a process forked from the server, so it
+# starts with the maps already loaded and never changes the server maps.
+# At most --jobs conversions run at the same time, the others wait.
+#
+# The map source files under data/ are checked every --watch seconds
+# (size and mtime). When one changes (goa_depends.py refreshed it), the
+# maps are rebuilt in a separate process (which saves the maps snapshot),
+# then loaded from the snapshot and swapped under the fork lock: a job
+# uses either the old or the new maps, never a mix of both. Jobs already
+# running keep the maps they started with. The MGI marker store used by
+# "mgi" jobs (goa_markers.py) is loaded in the server the same way, so
+# the jobs do not read the marker report again.
+#
+# HTTP requests (localhost --port or Unix socket --socket=path):
+#   GET  /status    -> JSON: maps generation and source files, jobs
+#   POST /reload    -> reloads the maps now - JSON status
+#   POST /gaf2gpad  -> JSON body: {"gaf":file,"gpad":file,"gpi":file,"mgi":false,"workers":1,
+#                        "dedup":mode,"dedup_budget":MB,"compress":codec,"level":N,"decompress":mode,
+#                        "qc_level":level,"qc_samples":N,"qc_rejects":file,"qc_summary":file,
+#                        "run_report":file}
+#   POST /gpad2gaf  -> JSON body: {"gpad":file,"gpi":file,"gaf":file,"version":"2.0","stream":false,
+#                        "tmpdir":dir,"compress":codec,"level":N,"decompress":mode,
+#                        "qc_level":level,"qc_samples":N,"qc_rejects":file,"qc_summary":file,
+#                        "run_report":file}
+# Only gaf/gpad/gpi are required - the other fields default to the
+# gaf2gpad.py/gpad2gaf.py defaults. Files are paths on the server host.
+# A conversion response streams the progress messages and the job log
+# (including the QC summary and the goa_profile stage table) as text
+# lines, then a last line:
+#   STATUS ok | STATUS failed: message
+# The job log is also written to log/ as with gaf2gpad.py/gpad2gaf.py.
+#
+# Usage: goa_server.py [--port=N] [--socket=path] [--jobs=N] [--watch=seconds]
+#        [--maps-log=level] [--offline]
+#
+'''
+
+import getopt,sys,os
+import BaseHTTPServer,SocketServer
+import threading,multiprocessing
+import json,time,traceback
+from datetime import datetime
+import goa_parser
+import goa_io,goa_qc,goa_snapshot,goa_markers,goa_profile
+import config
+
+#
+# Map source files and MGI marker report watched for refreshes
+#
+WATCHED_FILES=goa_parser.MAPS_SOURCE_FILES+[goa_parser.LOCAL_MRK_REPORT_FILE]
+
+FIELD_TYPES={str:"string",int:"number",bool:"boolean"}
+
+#
+# Job fields: name -> (type,default)
+# A None default is a required field
+#
+QC_FIELDS={"qc_level":(str,config.QC_LEVEL),"qc_samples":(int,config.QC_SAMPLE_CAP),
+           "qc_rejects":(str,""),"qc_summary":(str,""),"run_report":(str,"")}
+IO_FIELDS={"compress":(str,config.OUTPUT_CODEC),"level":(int,config.OUTPUT_LEVEL),
+           "decompress":(str,config.DECOMPRESS_MODE)}
+JOB_FIELDS={"gaf2gpad":{"gaf":(str,None),"gpad":(str,""),"gpi":(str,""),"mgi":(bool,False),
+                        "workers":(int,1),"dedup":(str,config.DEDUP_MODE),
+                        "dedup_budget":(int,config.DEDUP_MEMORY_BUDGET)},
+            "gpad2gaf":{"gpad":(str,None),"gpi":(str,None),"gaf":(str,""),"version":(str,"2.0"),
+                        "stream":(bool,False),"tmpdir":(str,"")}}
+for job_fields in JOB_FIELDS.values():
+    job_fields.update(QC_FIELDS)
+    job_fields.update(IO_FIELDS)
+
+#
+# Returns the job of a request: the fields of JOB_FIELDS[job_type]
+# with the defaults set, and the job log file
+# Raises ValueError on a bad request
+#
+def newJob(job_type,params):
+    if not isinstance(params,dict): raise ValueError("the request body must be a JSON object")
+    fields=JOB_FIELDS[job_type]
+    job={"type":job_type}
+    for name in params:
+        if name not in fields: raise ValueError("unknown field: "+name)
+    for name in fields:
+        kind,default=fields[name]
+        value=params.get(name)
+        if value is None:
+            if default is None: raise ValueError("missing field: "+name)
+            value=default
+        elif kind == str and isinstance(value,basestring): value=str(value)
+        elif kind == int and isinstance(value,(int,long)) and not isinstance(value,bool): pass
+        elif kind == bool and isinstance(value,bool): pass
+        else: raise ValueError("%s must be a %s"%(name,FIELD_TYPES[kind]))
+        if kind == str and value == "-": raise ValueError("%s: stdin/stdout (-) is not supported"%(name))
+        job[name]=value
+    if job["compress"] and job["compress"] not in goa_io.CODECS:
+        raise ValueError("compress must be one of: "+", ".join(goa_io.CODECS))
+    if job["decompress"] not in goa_io.DECOMPRESS_MODES:
+        raise ValueError("decompress must be one of: "+", ".join(goa_io.DECOMPRESS_MODES))
+    if job["qc_level"] not in goa_qc.QC_LEVELS:
+        raise ValueError("qc_level must be one of: "+", ".join(goa_qc.QC_LEVELS))
+    log_dir=goa_parser.GAF_CONVERTER_LOG_BASE
+    if job_type == "gaf2gpad":
+        if not os.path.exists(job["gaf"]): raise ValueError("The gaf file: "+job["gaf"]+" does not exist")
+        if job["workers"] < 1: raise ValueError("workers must be a positive number")
+        if job["dedup"] not in goa_parser.goa_dedup.DEDUP_MODES:
+            raise ValueError("dedup must be one of: "+", ".join(goa_parser.goa_dedup.DEDUP_MODES))
+        if not job["gpad"]: job["gpad"]=goa_io.outputName(job["gaf"],".gpad",job["compress"])
+        if not job["gpi"]: job["gpi"]=goa_io.outputName(job["gaf"],".gpi",job["compress"])
+        if job["mgi"]:
+            #keep the compression extension last (x.gpi.mgi.gz)
+            gpi_name=goa_io.stripCodecExtension(job["gpi"])
+            job["gpi"]=gpi_name+".mgi"+job["gpi"][len(gpi_name):]
+        job["log_file"]=log_dir+"/"+os.path.basename(job["gaf"])+".log"
+    else:
+        for name in ("gpad","gpi"):
+            if not os.path.exists(job[name]): raise ValueError("The %s file: %s does not exist"%(name,job[name]))
+        if not job["gaf"]: job["gaf"]=goa_io.outputName(job["gpad"],".gaf",job["compress"])
+        if not job["tmpdir"]: job["tmpdir"]=goa_io.workDir(job["gaf"])
+        job["log_file"]=log_dir+"/"+os.path.basename(job["gpad"])+".log"
+    return job
+
+#
+# Job log: writes to the log file and to the response stream
+#
+class JobLog:
+    def __init__(self,log,stream):
+        self.log=log
+        self.stream=stream
+
+    def write(self,text):
+        self.log.write(text)
+        self.stream.write(text)
+
+    def flush(self):
+        self.log.flush()
+        self.stream.flush()
+
+    def close(self):
+        self.log.close()
+
+#
+# Runs a conversion job in the forked job process
+# Everything the converter writes (log, progress messages) goes to
+# the pipe stream_fd read by the server
+#
+def jobProcess(job,stream_fd):
+    stream=os.fdopen(stream_fd,"w",1)
+    sys.stdout=sys.stderr=stream
+    log=JobLog(open(job["log_file"],"w"),stream)
+    #eco cache statistics of the job go to the job log
+    goa_parser.map_log=log
+    goa_parser.map_log_thread=None
+    log.write("\nProgram Starts: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    status="ok"
+    goa_profile.newRun(job["type"])
+    try:
+        qc=goa_qc.QcLog(log,job["qc_level"],job["qc_samples"],job["qc_rejects"],job["qc_summary"])
+        if job["type"] == "gaf2gpad":
+            log.write("\nProcessing GAF file :"+job["gaf"])
+            goa_parser.generateGpiGpad(job["gaf"],job["gpad"],job["gpi"],log,job["mgi"],job["workers"],
+                                       job["dedup"],job["dedup_budget"],job["compress"],job["level"],
+                                       job["decompress"],qc)
+        else:
+            log.write("\nProcessing GPAD file :"+job["gpad"]+" and GPI file :"+job["gpi"]+"\n")
+            goa_parser.generateGaf(job["gaf"],job["gpad"],job["gpi"],log,job["version"],job["stream"],
+                                   job["tmpdir"],job["compress"],job["level"],job["decompress"],qc)
+        qc.close()
+        goa_profile.run.report(log)
+        goa_profile.run.save(job["run_report"])
+    except Exception, e:
+        log.write("\n**********\n\nError: conversion failed\n"+traceback.format_exc())
+        status="failed: "+traceback.format_exc().strip().split("\n")[-1]
+    log.write("\nProgram Ends: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    log.close()
+    stream.write("STATUS %s\n"%(status))
+    stream.close()
+
+#
+# Rebuilds the maps snapshot from the source files (maps reload process)
+#
+def buildSnapshot():
+    goa_parser.loadMaps()
+
+#
+# The loaded maps, the source files they were loaded from and the fork
+# lock: the maps are only swapped and the job processes only forked
+# while holding the lock
+#
+class ConverterMaps:
+    def __init__(self,log):
+        self.log=log
+        self.lock=threading.Lock()
+        self.reload_lock=threading.Lock()
+        self.generation=1
+        self.loaded_at=time.time()
+        self.stamps=self.sourceStamps()
+
+    #size and mtime of the watched files
+    def sourceStamps(self):
+        stamps={}
+        for source_file in WATCHED_FILES:
+            try:
+                stat=os.stat(source_file)
+                stamps[source_file]=(stat.st_size,stat.st_mtime)
+            except OSError:
+                stamps[source_file]=None
+        return stamps
+
+    def changed(self):
+        return self.sourceStamps() != self.stamps
+
+    #
+    # Starts a process running target(*args) - returns the process
+    #
+    def fork(self,target,args=()):
+        self.lock.acquire()
+        try:
+            process=multiprocessing.Process(target=target,args=args)
+            process.start()
+        finally:
+            self.lock.release()
+        return process
+
+    #
+    # Reloads the maps if a source file changed (or force)
+    # Returns a message
+    #
+    def reload(self,force=False):
+        self.reload_lock.acquire()
+        try:
+            stamps=self.sourceStamps()
+            if not force and stamps == self.stamps: return "Maps up to date"
+            #the background dump reads the maps
+            goa_parser.waitMaps_log()
+            maps=goa_snapshot.loadSnapshot(goa_parser.LOCAL_MAPS_SNAPSHOT_FILE,goa_parser.MAPS_SOURCE_FILES)
+            if maps is None:
+                builder=self.fork(buildSnapshot)
+                builder.join()
+                maps=goa_snapshot.loadSnapshot(goa_parser.LOCAL_MAPS_SNAPSHOT_FILE,goa_parser.MAPS_SOURCE_FILES)
+            if maps is None:
+                message="Maps reload failed: the maps snapshot could not be rebuilt - keeping generation %d"%(
+                        self.generation)
+                self.log(message)
+                return message
+            self.lock.acquire()
+            try:
+                goa_parser.goref.importMaps(maps["goref"])
+                goa_parser.eco.importMaps(maps["eco"])
+                self.loadMarkers()
+                self.generation+=1
+                self.loaded_at=time.time()
+                self.stamps=stamps
+            finally:
+                self.lock.release()
+            message="Maps reloaded: generation %d"%(self.generation)
+            self.log(message)
+            return message
+        finally:
+            self.reload_lock.release()
+
+    #
+    # Loads the MGI marker store in the server (kept by goa_markers)
+    #
+    def loadMarkers(self):
+        if not os.path.isfile(goa_parser.LOCAL_MRK_REPORT_FILE): return
+        try:
+            store=goa_markers.loadStore(goa_parser.LOCAL_MRK_REPORT_FILE)
+            self.log("Marker store: %s - %d markers"%(store.source,len(store.markers)))
+        except (IOError,OSError), e:
+            self.log("Marker store not loaded: "+str(e))
+
+    #checks the source files every interval seconds (watch thread)
+    def watch(self,interval):
+        while True:
+            time.sleep(interval)
+            try:
+                if self.changed(): self.reload()
+            except Exception, e:
+                self.log("Maps reload failed: "+str(e))
+
+    def status(self):
+        sources={}
+        for source_file in self.stamps:
+            stamp=self.stamps[source_file]
+            if stamp is None: sources[source_file]=None
+            else: sources[source_file]={"size":stamp[0],"mtime":stamp[1]}
+        return {"generation":self.generation,"loaded_at":self.loaded_at,"sources":sources}
+
+#
+# Request handler: status, reload and conversion jobs
+#
+class ConversionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version="goa_server/1.0"
+
+    def address_string(self):
+        if isinstance(self.client_address,tuple): return self.client_address[0]
+        return "local"
+
+    def log_message(self,format,*args):
+        self.server.log("%s %s"%(self.address_string(),format%args))
+
+    def sendJson(self,code,data):
+        body=json.dumps(data,indent=1,sort_keys=True)+"\n"
+        self.send_response(code)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status": self.sendJson(200,self.server.status())
+        else: self.sendJson(404,{"error":"unknown path: "+self.path})
+
+    def do_POST(self):
+        length=int(self.headers.getheader("Content-Length") or 0)
+        body=self.rfile.read(length)
+        if self.path == "/reload":
+            message=self.server.maps.reload(True)
+            status=self.server.status()
+            status["message"]=message
+            self.sendJson(200,status)
+            return
+        job_type=self.path.strip("/")
+        if job_type not in JOB_FIELDS:
+            self.sendJson(404,{"error":"unknown path: "+self.path})
+            return
+        try:
+            job=newJob(job_type,json.loads(body or "{}"))
+        except ValueError, e:
+            self.sendJson(400,{"error":str(e)})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type","text/plain")
+        self.end_headers()
+        self.server.runJob(job,self.wfile)
+
+#
+# Shared state of the HTTP and Unix socket servers
+#
+class ConverterServer_state:
+    daemon_threads=True
+    allow_reuse_address=True
+
+    def setup(self,log,jobs):
+        self.server_log=log
+        self.log_lock=threading.Lock()
+        self.maps=ConverterMaps(self.log)
+        self.job_slots=threading.BoundedSemaphore(jobs)
+        self.counts_lock=threading.Lock()
+        self.jobs_running=0
+        self.jobs_waiting=0
+        self.jobs_done=0
+        self.jobs_failed=0
+
+    def log(self,message):
+        self.log_lock.acquire()
+        try:
+            self.server_log.write("%s %s\n"%(datetime.now().strftime('%Y/%m/%d %I:%M:%S %P'),message))
+            self.server_log.flush()
+        finally:
+            self.log_lock.release()
+
+    def count(self,name,value):
+        self.counts_lock.acquire()
+        setattr(self,name,getattr(self,name)+value)
+        self.counts_lock.release()
+
+    def status(self):
+        status=self.maps.status()
+        status["jobs"]={"running":self.jobs_running,"waiting":self.jobs_waiting,
+                        "done":self.jobs_done,"failed":self.jobs_failed}
+        return status
+
+    #
+    # Runs a job in a forked process and streams its output to out
+    #
+    def runJob(self,job,out):
+        if not self.job_slots.acquire(False):
+            out.write("Waiting for a job slot\n")
+            out.flush()
+            self.count("jobs_waiting",1)
+            self.job_slots.acquire()
+            self.count("jobs_waiting",-1)
+        self.count("jobs_running",1)
+        status=""
+        try:
+            self.log("Job started: %s %s"%(job["type"],job.get("gaf") if job["type"] == "gaf2gpad" else job["gpad"]))
+            (stream_r,stream_w)=os.pipe()
+            try:
+                process=self.maps.fork(jobProcess,(job,stream_w))
+            finally:
+                os.close(stream_w)
+            stream=os.fdopen(stream_r,"r")
+            client=True
+            for line in iter(stream.readline,""):
+                if line.startswith("STATUS "): status=line[7:].strip()
+                if not client: continue
+                try:
+                    out.write(line)
+                    out.flush()
+                except IOError:
+                    client=False  #the job goes on - the client left
+            stream.close()
+            process.join()
+            if not status:
+                status="failed: job process exit code %s"%(process.exitcode)
+                if client: out.write("STATUS %s\n"%(status))
+        finally:
+            self.count("jobs_running",-1)
+            self.job_slots.release()
+        if status != "ok": self.count("jobs_failed",1)
+        self.count("jobs_done",1)
+        self.log("Job ended: %s %s"%(job["type"],status))
+
+class ConverterHTTPServer(ConverterServer_state,SocketServer.ThreadingMixIn,BaseHTTPServer.HTTPServer):
+    pass
+
+class ConverterUnixServer(ConverterServer_state,SocketServer.ThreadingMixIn,SocketServer.UnixStreamServer):
+    pass
+
+#
+#goa_server usage
+#
+def server_usage():
+    print """\
+    \n********************************\ngoa_server runs the GAF/GPAD converters as a local service
+    \nUsage: goa_server.py [--port=N] [--socket=path] [--jobs=N] [--watch=seconds] [--maps-log=level] [--offline]
+    Where:
+       --port   => <optional> localhost HTTP port (default %d)
+       --socket => <optional> Unix socket path used instead of the HTTP port
+       --jobs   => <optional> number of conversions run at the same time (default %d)
+       --watch  => <optional> seconds between two checks of the map source files (default %d, 0: never)
+       --maps-log => <optional> content of log/maps.log: off, summary or full (default %s)
+       --offline  => <optional> use the local copies of the dependencies (only missing files are downloaded)
+    \nRequests: GET /status, POST /reload, POST /gaf2gpad and POST /gpad2gaf (JSON body), e.g.:
+       curl -N -d '{"gaf":"/data/gene_association.mgi"}' http://127.0.0.1:%d/gaf2gpad
+       curl -N --unix-socket /tmp/goa.sock -d '{"gpad":"x.gpad","gpi":"x.gpi"}' http://localhost/gpad2gaf
+    \n********************************
+    """%(config.SERVER_PORT,config.SERVER_JOBS,config.SERVER_WATCH_INTERVAL,config.MAPS_LOG_LEVEL,
+         config.SERVER_PORT)
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:s:j:w:l:o", ["help","port=","socket=","jobs=","watch=",
+                                   "maps-log=","offline"])
+    except getopt.GetoptError, err:
+        print "ERROR:\n"+str(err)
+        server_usage()
+        sys.exit(2)
+    port=config.SERVER_PORT
+    socket_file=""
+    jobs=config.SERVER_JOBS
+    watch=config.SERVER_WATCH_INTERVAL
+    maps_log_level=config.MAPS_LOG_LEVEL
+    offline=config.DEPENDS_OFFLINE
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            server_usage()
+            sys.exit()
+        elif o in ("-s", "--socket"):socket_file = a
+        elif o in ("-l", "--maps-log"):
+            if a not in goa_parser.MAPS_LOG_LEVELS:
+                print "**********\n\nError: --maps-log must be one of: "+", ".join(goa_parser.MAPS_LOG_LEVELS)
+                server_usage()
+                sys.exit(2)
+            maps_log_level = a
+        elif o in ("-o", "--offline"):offline = True
+        elif o in ("-p", "--port","-j","--jobs","-w","--watch"):
+            if not a.isdigit() or (int(a) < 1 and o not in ("-w","--watch")):
+                print "**********\n\nError: %s must be a positive number - See program usage"%(o)
+                server_usage()
+                sys.exit(2)
+            if o in ("-p","--port"): port=int(a)
+            elif o in ("-j","--jobs"): jobs=int(a)
+            else: watch=int(a)
+        else:
+            assert False, "unhandled option"
+    log_dir=goa_parser.GAF_CONVERTER_LOG_BASE
+    if not os.path.isdir(log_dir): os.makedirs(log_dir)
+    if not os.path.isdir(goa_parser.GAF_CONVERTER_DATA_BASE): os.makedirs(goa_parser.GAF_CONVERTER_DATA_BASE)
+    log=open(log_dir+"/"+os.path.basename(sys.argv[0])+".log","a")
+    log.write("Program Starts: "+datetime.now().strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
+    log.write("\nInitiating the converter\n")
+    goa_parser.converter_init(log,maps_log_level,offline)
+    if goa_parser.empty_goref_containers()>0 or goa_parser.empty_eco_containers()>0:
+        log.write("**********\n\nSome GO Ontology/ECO Evidence dependencies were not downloaded properly. "+
+                  "Check the local files under "+goa_parser.GAF_CONVERTER_DATA_BASE+"\n")
+        sys.exit(1)
+    log.flush()
+    if socket_file:
+        if os.path.exists(socket_file): os.remove(socket_file)
+        server=ConverterUnixServer(socket_file,ConversionHandler)
+        address=socket_file
+    else:
+        server=ConverterHTTPServer((config.SERVER_HOST,port),ConversionHandler)
+        address="http://%s:%d"%(config.SERVER_HOST,port)
+    server.setup(log,jobs)
+    server.maps.loadMarkers()
+    if watch:
+        watcher=threading.Thread(target=server.maps.watch,args=(watch,))
+        watcher.daemon=True
+        watcher.start()
+    server.log("Serving on %s (%d jobs, watch %ds)"%(address,jobs,watch))
+    print >>sys.stderr, "Serving on "+address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    if socket_file and os.path.exists(socket_file): os.remove(socket_file)
+    server.log("Program Ends")
+    log.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_snapshot stores the GO_REF/ECO maps built by Goref._init and
+# Eco._init in a compiled snapshot file under data/ so that the next
+# runs do not have to parse the source files again.
+#
+# Snapshot file layout:
+#   header line: GOA-MAPS-SNAPSHOT <snapshot version> <python version>
+#   marshal record 1: list of source signatures (path,size,mtime,md5)
+#   marshal record 2: the maps (dict of plain dicts/lists)
+#
+# The snapshot is valid as long as every source file has the same size
+# and mtime, or the same md5 when only its mtime changed (setup_depends
+# re-downloaded an unchanged file). Any other change (or a new
+# SNAPSHOT_VERSION) makes the converter rebuild the maps from the sources.
+#
+'''
+
+import os,sys,marshal
+import tempfile
+import hashlib
+
+#
+#Bump when the content of the maps built by Goref/Eco changes
+#
+SNAPSHOT_VERSION=1
+SNAPSHOT_MAGIC="GOA-MAPS-SNAPSHOT"
+
+def snapshotHeader():
+    return "%s %d %d.%d\n"%(SNAPSHOT_MAGIC,SNAPSHOT_VERSION,sys.version_info[0],sys.version_info[1])
+
+#
+# Returns the md5 of a file
+#
+def fileDigest(source_file):
+    digest=hashlib.md5()
+    sfh=open(source_file,"rb")
+    while True:
+        block=sfh.read(1024*1024)
+        if not block: break
+        digest.update(block)
+    sfh.close()
+    return digest.hexdigest()
+
+#
+# Returns the signature (path,size,mtime,md5) of a source file
+# a missing file has size -1
+#
+def sourceSignature(source_file):
+    if not os.path.isfile(source_file): return (source_file,-1,0.0,"")
+    stat=os.stat(source_file)
+    return (source_file,stat.st_size,stat.st_mtime,fileDigest(source_file))
+
+def sourceSignatures(sources):
+    return [sourceSignature(source_file) for source_file in sources]
+
+#
+# Compares the snapshot signatures with the current source files
+# Returns (valid,signatures) - signatures are refreshed when only mtimes changed
+#
+def checkSignatures(signatures,sources):
+    if [signature[0] for signature in signatures] != list(sources): return (False,signatures)
+    checked=[]
+    for (source_file,size,mtime,digest) in signatures:
+        if not os.path.isfile(source_file):
+            if size != -1: return (False,signatures)
+            checked.append((source_file,size,mtime,digest))
+            continue
+        stat=os.stat(source_file)
+        if stat.st_size != size: return (False,signatures)
+        if stat.st_mtime != mtime:
+            if fileDigest(source_file) != digest: return (False,signatures)
+            mtime=stat.st_mtime
+        checked.append((source_file,size,mtime,digest))
+    return (True,checked)
+
+#
+# Writes the snapshot - the file is replaced atomically
+# Returns False if the snapshot could not be written
+#
+def saveSnapshot(snapshot_file,signatures,maps):
+    snapshot_dir=os.path.dirname(os.path.abspath(snapshot_file))
+    try:
+        (fd,tmp_file)=tempfile.mkstemp(prefix=".maps.",dir=snapshot_dir)
+        sfh=os.fdopen(fd,"wb")
+        sfh.write(snapshotHeader())
+        marshal.dump(signatures,sfh)
+        marshal.dump(maps,sfh)
+        sfh.close()
+        os.rename(tmp_file,snapshot_file)
+    except (IOError,OSError,ValueError):
+        if "tmp_file" in locals() and os.path.isfile(tmp_file): os.remove(tmp_file)
+        return False
+    return True
+
+#
+# Returns the maps stored in the snapshot or None when the snapshot
+# is missing, corrupted or out of date with the source files
+#
+def loadSnapshot(snapshot_file,sources):
+    if not os.path.isfile(snapshot_file): return None
+    try:
+        sfh=open(snapshot_file,"rb")
+        if sfh.readline() != snapshotHeader():
+            sfh.close()
+            return None
+        signatures=marshal.load(sfh)
+        (valid,checked)=checkSignatures(signatures,sources)
+        if not valid:
+            sfh.close()
+            return None
+        maps=marshal.load(sfh)
+        sfh.close()
+    except (IOError,OSError,EOFError,ValueError,TypeError):
+        return None
+    #only mtimes changed - store the new mtimes to skip the md5 next time
+    if checked != signatures: saveSnapshot(snapshot_file,checked,maps)
+    return maps
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+'''
+#
+# goa_sort provides a bounded-memory external sort used by the
+# converters when the input files are too big to be indexed in memory.
+#
+# Records are plain strings (one record per line, no newline) and are
+# sorted as strings. Records are buffered in memory up to a fixed
+# number of rows, then each sorted buffer is spilled to a run file
+# under a temporary directory. The runs are finally merged with a
+# k-way merge (heapq.merge) - peak memory depends only on the buffer
+# size and the number of runs merged at once.
+#
+'''
+
+import os,heapq
+import tempfile,shutil
+
+#
+#Default number of records kept in memory before spilling a run
+#
+SORT_BUFFER_ROWS=500000
+#
+#Maximum number of run files merged at once
+#
+SORT_MAX_RUNS=64
+
+#
+# Escapes/unescapes free text (log lines, rows) so that it can be
+# stored as a single sort record
+#
+def escapeRecord(text):
+    return text.replace("\\","\\\\").replace("\n","\\n")
+
+def unescapeRecord(text):
+    if "\\" not in text: return text
+    chars=[]
+    i=0
+    end=len(text)
+    while i < end:
+        c=text[i]
+        if c=="\\" and i+1 < end:
+            i+=1
+            if text[i]=="n":chars.append("\n")
+            else:chars.append(text[i])
+        else: chars.append(c)
+        i+=1
+    return "".join(chars)
+
+#
+# Sorts string records using bounded-memory spill files
+# Usage:
+#   sorter=ExternalSort(tmp_dir)
+#   sorter.add(record) ...
+#   for record in sorter.sorted(): ...
+#   sorter.close()
+#
+class ExternalSort:
+
+    def __init__(self,tmp_dir=None,buffer_rows=None,max_runs=None):
+        self.work_dir=tempfile.mkdtemp(prefix="goa_sort.",dir=tmp_dir)
+        self.buffer_rows=buffer_rows or SORT_BUFFER_ROWS
+        self.max_runs=max_runs or SORT_MAX_RUNS
+        self.buffer=[]
+        self.runs=[]
+        self.count=0
+        self.sorted_file=""
+
+    #
+    # Adds a record - the record must not contain a newline
+    #
+    def add(self,record):
+        self.buffer.append(record+"\n")
+        self.count+=1
+        if len(self.buffer)>=self.buffer_rows: self._spill()
+
+    #
+    #Writes the current buffer as a sorted run file
+    #
+    def _spill(self):
+        if not self.buffer: return
+        self.buffer.sort()
+        run_file=os.path.join(self.work_dir,"run.%d"%(len(self.runs)))
+        rfh=open(run_file,"w")
+        rfh.writelines(self.buffer)
+        rfh.close()
+        self.runs.append(run_file)
+        self.buffer=[]
+
+    #
+    #Merges the given run files into a new run file
+    #
+    def _merge(self,runs,merged_file):
+        handles=[open(run) for run in runs]
+        mfh=open(merged_file,"w")
+        mfh.writelines(heapq.merge(*handles))
+        mfh.close()
+        for i in range(len(runs)):
+            handles[i].close()
+            os.remove(runs[i])
+
+    #
+    # Returns the path of a file holding all the records in sorted order
+    # The file can be read as many times as needed with readRecords()
+    #
+    def sortedFile(self):
+        if self.sorted_file: return self.sorted_file
+        self._spill()
+        level=0
+        while len(self.runs)>self.max_runs:
+            merged=[]
+            for i in range(0,len(self.runs),self.max_runs):
+                merged_file=os.path.join(self.work_dir,"merge.%d.%d"%(level,i))
+                self._merge(self.runs[i:i+self.max_runs],merged_file)
+                merged.append(merged_file)
+            self.runs=merged
+            level+=1
+        self.sorted_file=os.path.join(self.work_dir,"sorted")
+        if self.runs:
+            self._merge(self.runs,self.sorted_file)
+        else:
+            open(self.sorted_file,"w").close()
+        self.runs=[]
+        return self.sorted_file
+
+    #
+    # Iterates over the records in sorted order
+    #
+    def sorted(self):
+        return readRecords(self.sortedFile())
+
+    #
+    #Removes the spill files
+    #
+    def close(self):
+        self.buffer=[]
+        if os.path.isdir(self.work_dir):
+            shutil.rmtree(self.work_dir,True)
+
+#
+# Iterates over the records of a sorted file (newline removed)
+#
+def readRecords(sorted_file):
+    rfh=open(sorted_file)
+    for line in rfh:
+        yield line[:-1]
+    rfh.close()
+
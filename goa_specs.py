@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 import getopt, sys
 import os,csv
-import re
+import re,itertools
 
 #
 # Create data containers for fields mapping in the GAF, GPAD,GPI, and MRK report
@@ -337,6 +337,8 @@ evidence_codes=[
   "ND",
   #Automatically-Assigned evidence code
   "IEA"]
+#evidence_codes before the eco_map codes are added (Eco._init starts from it)
+default_evidence_codes=list(evidence_codes)
 
 #global variables
 gpad_db_index=GPAD_FIELDS.index("DB")
@@ -364,12 +366,129 @@ mrk_object_name_index=MRK_FIELDS.index("DB_Object_Name")
 mrk_object_syn_index=MRK_FIELDS.index("DB_Object_Synonym")
 mrk_object_id_index=MRK_FIELDS.index("DB_Object_ID")
 
+#
+#Required fields indexes - used to check missing fields without list lookups
+#
+required_gpad_indexes=[i for i in range(len(GPAD_FIELDS)) if GPAD_FIELDS[i] in REQUIRED_GPAD_FIELDS]
+required_gpi_indexes=[i for i in range(len(GPI_FIELDS)) if GPI_FIELDS[i] in REQUIRED_GPI_FIELDS]
+
+#
+# Row projection plans
+# A plan lists, for each target column, how the value is computed:
+#  (PLAN_FIELD,source_index) -> copy the source row field
+#  (PLAN_TAXON,-1)           -> taxon computed from the gaf taxon field
+#  (PLAN_EVIDENCE,-1)        -> gaf evidence code (gpad Annotation_Properties)
+#  (PLAN_PARENT,-1)          -> gpi Parent_Object_ID
+#  (PLAN_BLANK,-1)           -> not a gaf field
+# The gaf plan lists the (gaf_index,PLAN_GPAD|PLAN_GPI,source_index) of the gaf
+# columns filled from the gpad or gpi row when still empty
+# Plans are computed once per gaf version (fields list)
+#
+PLAN_FIELD=0
+PLAN_TAXON=1
+PLAN_EVIDENCE=2
+PLAN_PARENT=3
+PLAN_BLANK=4
+PLAN_GPAD=5
+PLAN_GPI=6
+PROJECTION_PLANS={}
+
+def getProjection_plans(gaf_fields):
+    key=tuple(gaf_fields)
+    if key in PROJECTION_PLANS: return PROJECTION_PLANS[key]
+    gaf_index={}
+    for i in range(len(gaf_fields)): gaf_index[gaf_fields[i]]=i
+    taxon_index=gaf_index["Taxon"]
+    plans={}
+    #gaf -> gpad/gpi columns
+    for g_type,g_fields in (("gpad",GPAD_FIELDS),("gpi",GPI_FIELDS)):
+        plan=[]
+        for i in range(len(g_fields)):
+            if g_fields[i] in gaf_index:
+                if gaf_index[g_fields[i]]==taxon_index: plan.append((PLAN_TAXON,-1))
+                else: plan.append((PLAN_FIELD,gaf_index[g_fields[i]]))
+            elif g_type=="gpad" and i==gpad_annot_properties_index: plan.append((PLAN_EVIDENCE,-1))
+            elif g_type=="gpi" and i==gpi_parent_index: plan.append((PLAN_PARENT,-1))
+            else: plan.append((PLAN_BLANK,-1))
+        plans[g_type]=plan
+    #gpad/gpi -> gaf columns not set by the gpad2gaf converter itself
+    computed=[]
+    for field in ("DB","DB_Object_ID","Taxon","Evidence_Code","Aspect","Qualifier",
+                  "Gene_Product_Form_ID","Annotation_Extension"):
+        if field in gaf_index: computed.append(gaf_index[field])
+    plan=[]
+    for i in range(len(gaf_fields)):
+        if i in computed: continue
+        if gaf_fields[i] in GPAD_FIELDS: plan.append((i,PLAN_GPAD,GPAD_FIELDS.index(gaf_fields[i])))
+        elif gaf_fields[i] in GPI_FIELDS: plan.append((i,PLAN_GPI,GPI_FIELDS.index(gaf_fields[i])))
+    plans["gaf"]=plan
+    plans["required"]=[i for i in range(len(gaf_fields)) if gaf_fields[i] in REQUIRED_GAF_FIELDS]
+    PROJECTION_PLANS[key]=plans
+    return plans
+
 #############################################################
 #
 # Classes Definition
 #
 #
 ##############################################################
+#
+# Writes a map section of maps.log with a single write
+# keys: display order (default map order)
+#
+def writeMap_section(log,title,map,keys=None):
+    if keys is None: keys=map.keys()
+    log.write("".join(["\n====================\n",title,"\n"]+[key+"\t"+map[key]+"\n" for key in keys]))
+
+#
+# Bounded least-recently-used cache
+# Entries are kept in two generations (plain dictionaries): lookups
+# promote entries to the current generation, and when the current
+# generation is full the older one is dropped. At most maxsize entries
+# are kept and the entries used the least recently are dropped first.
+#
+class LRUCache:
+    def __init__(self,maxsize):
+        self.maxsize=maxsize
+        self.recent={}
+        self.older={}
+        self.hits=0
+        self.misses=0
+        self.clears=0
+
+    def get(self,key,default=None):
+        if key in self.recent:
+            self.hits+=1
+            return self.recent[key]
+        if key in self.older:
+            self.hits+=1
+            value=self.older[key]
+            self.set(key,value)
+            return value
+        self.misses+=1
+        return default
+
+    def set(self,key,value):
+        if len(self.recent)>=self.maxsize/2:
+            self.older=self.recent
+            self.recent={}
+        self.recent[key]=value
+
+    def clear(self):
+        self.recent={}
+        self.older={}
+        self.clears+=1
+
+    def __len__(self):
+        return len(self.recent)+len(self.older)
+
+#
+#Resolved ECO/evidence codes by (DB_Reference,Evidence_Code,map) - see Eco.getECO_code
+#The cache is cleared every time Goref._init or Eco._init reloads the maps
+#
+ECO_CACHE_SIZE=200000
+eco_code_cache=LRUCache(ECO_CACHE_SIZE)
+
 # goref class maps: 
 # A) GO Reference Collection - external ID mapping
 #    1) External ids such as J#, MGI ids, pubmed ids to GO_Ref
@@ -393,6 +512,12 @@ class Goref:
     # class constructor    ###
     ##########################
     def _init(self,local_goref_file,local_go_file,local_goxref_file,log):
+       #resolved ECO codes depend on COLLECTION
+       eco_code_cache.clear()
+       #the maps are rebuilt from the files only (a process forked from a
+       #converter with loaded maps must not keep the entries of the old files)
+       for name in ["ALT_ID_MAP","COLLECTION","GO_ONTOLOGY_MAP","GO_DATABASES"]:
+           getattr(Goref,name).clear()
        #
        # Index GO_ID TO ontology
        if os.path.isfile('%s' % (local_go_file)):
@@ -406,10 +531,6 @@ class Goref:
                  go_id=fields[1].strip()
                  Goref.GO_ONTOLOGY_MAP[go_id]=ontology2aspect[ontology]
 
-          log.write("\n====================\nGO_ID - GAF.Aspect mapping\n")
-          for go_id in Goref.GO_ONTOLOGY_MAP:
-              log.write(go_id+"\t"+Goref.GO_ONTOLOGY_MAP[go_id]+"\n")
-
        if os.path.isfile('%s' % (local_goref_file)):
           efile=open(local_goref_file)
           #remove header
@@ -454,16 +575,110 @@ class Goref:
                    db_name=""
                else: continue
           #remove header
-       #Now display map content
-       log.write("\n====================\nGO_REF External Accession IDs mapping\n")
-       for extaccid in Goref.COLLECTION:
-           log.write(extaccid+"\t"+Goref.COLLECTION[extaccid]+"\n")
-       log.write("\n====================\nGO_REF Alternate IDs \n")
-       for altid in Goref.ALT_ID_MAP:
-           log.write(altid+"\t"+Goref.ALT_ID_MAP[altid]+"\n") 
-       log.write("\n====================\nGO database cross-reference \n")
-       for db_abbrev in Goref.GO_DATABASES:
-           log.write(db_abbrev+"\t"+Goref.GO_DATABASES[db_abbrev]+"\n")
+       #Now display map content (no log: see report/summary)
+       if log is not None: self.report(log)
+
+    #
+    # Writes the content of the maps to the log - one write per map
+    #
+    def report(self,log):
+       if Goref.GO_ONTOLOGY_MAP:
+          writeMap_section(log,"GO_ID - GAF.Aspect mapping",Goref.GO_ONTOLOGY_MAP)
+       writeMap_section(log,"GO_REF External Accession IDs mapping",Goref.COLLECTION)
+       writeMap_section(log,"GO_REF Alternate IDs ",Goref.ALT_ID_MAP)
+       writeMap_section(log,"GO database cross-reference ",Goref.GO_DATABASES)
+
+    #
+    # Writes the size of the maps to the log
+    #
+    def summary(self,log):
+       log.write("\n====================\nGO_REF maps summary\n")
+       log.write("GO_ID - GAF.Aspect mapping: %d\nGO_REF External Accession IDs: %d\n"
+                 %(len(Goref.GO_ONTOLOGY_MAP),len(Goref.COLLECTION)))
+       log.write("GO_REF Alternate IDs: %d\nGO database cross-reference: %d\n"
+                 %(len(Goref.ALT_ID_MAP),len(Goref.GO_DATABASES)))
+
+    #
+    # Returns the maps as plain containers (see goa_snapshot)
+    #
+    def exportMaps(self):
+       return {"ALT_ID_MAP":Goref.ALT_ID_MAP,"COLLECTION":Goref.COLLECTION,
+               "GO_ONTOLOGY_MAP":Goref.GO_ONTOLOGY_MAP,"GO_DATABASES":Goref.GO_DATABASES}
+
+    #
+    # Reloads the maps from exportMaps() content
+    # The maps are updated in place - the converters keep references to them
+    #
+    def importMaps(self,maps):
+       eco_code_cache.clear()
+       for name in ["ALT_ID_MAP","COLLECTION","GO_ONTOLOGY_MAP","GO_DATABASES"]:
+           goref_map=getattr(Goref,name)
+           goref_map.clear()
+           goref_map.update(maps[name])
+
+###################################################################
+# MGI GO_eco_association table
+#
+# The report is ingested once (when it is fetched - see goa_depends) into
+# a table of the distinct (evidence code, MGI reference, ECO code)
+# triples in report order, one tab delimited triple per line after the
+# MGI_ECO_TABLE_HEADER line. Eco._init loads the table with a split per
+# line. A file without the header (full report or an older
+# evidenceCode/mgiRef/ecoCode cut) is ingested the same way while it is read.
+##################################################################
+MGI_ECO_TABLE_HEADER="#GOA-MGI-ECO-TABLE 1\n"
+#evidenceCode, mgiRef and ecoCode fields of the full report
+MGI_ECO_REPORT_FIELDS=[5,7,11]
+MGI_ECO_TABLE_CHUNK=10000
+
+#
+# Returns the distinct (evidence code,reference,ECO code) triples of
+# report lines in report order
+#
+def mgiEco_triples(lines):
+    eco_p=re.compile('ECO:\d+')
+    seen=set()
+    triples=[]
+    for line in lines:
+        fields=line.rstrip("\r\n").split("\t")
+        if len(fields) > MGI_ECO_REPORT_FIELDS[-1]:
+            fields=[fields[i] for i in MGI_ECO_REPORT_FIELDS]
+        elif len(fields) != 3: continue
+        evidencecode=fields[0].strip()
+        goref=fields[1].strip()
+        for ecocode in eco_p.findall(fields[2]):
+            triple=(evidencecode,goref,ecocode)
+            if triple in seen: continue
+            seen.add(triple)
+            triples.append(triple)
+    return triples
+
+#
+# Returns the table (blocks of text) of the report lines
+# Raises ValueError if the lines have no triple (error page, truncated
+# report or changed columns) - the local table is then kept
+#
+def mgiEco_table(lines):
+    triples=mgiEco_triples(lines)
+    if not triples: raise ValueError("no evidence code/reference/ECO code triples in the MGI ECO report")
+    yield MGI_ECO_TABLE_HEADER
+    for i in range(0,len(triples),MGI_ECO_TABLE_CHUNK):
+        yield "".join(["\t".join(triple)+"\n" for triple in triples[i:i+MGI_ECO_TABLE_CHUNK]])
+
+#
+# Returns the triples of a local MGI GO_eco_association file
+# (the table, or the report ingested on the fly)
+#
+def loadMgiEco_triples(local_mgi_eco_file):
+    mfh=open(local_mgi_eco_file)
+    try:
+        first_line=mfh.readline()
+        if first_line != MGI_ECO_TABLE_HEADER:
+            return mgiEco_triples(itertools.chain([first_line],mfh))
+        rows=[line.rstrip("\r\n").split("\t") for line in mfh]
+        return [tuple(fields) for fields in rows if len(fields) == 3]
+    finally:
+        mfh.close()
 
 ###################################################################
 # eco class maps:
@@ -486,7 +701,12 @@ class Eco:
     ##########################
     # class constructor    ### 
     def _init(self,local_eco_file,local_mgi_eco_file,log):
-    
+        #resolved ECO codes depend on the ECO maps
+        eco_code_cache.clear()
+        #the maps are rebuilt from the files only (see Goref._init)
+        for name in ["GAF_ECO_MAP","ECO_EVIDENCE_MAP","MGI_ECO_MAP","ECO_GOREF2EVIDENCE_MAP"]:
+            getattr(Eco,name).clear()
+        evidence_codes[:]=default_evidence_codes
         #
         #Index gaf-eco mapping from genontology public file 
         #
@@ -515,30 +735,18 @@ class Eco:
         #Index ECO code using mgi-eco mapping file
         #
         
+        mgi_eco_map={}
+        eco_evidence_map={} #test the assumption that 1 eco code is assigned to only 1 evidence code
         if os.path.isfile('%s' % (local_mgi_eco_file)):
-            reader=open(local_mgi_eco_file)
-            mgi_eco_map={}
-            eco_evidence_map={} #test the assumption that 1 eco code is assigned to only 1 evidence code
-            eco_p= re.compile('ECO:\d+')
-            for line in reader:
-                fields=line.split("\t")
-                if len(fields) == 3 :
-                    evidencecode=fields[0].strip()
-                    goref=fields[1].strip()
-                    temp_line=line
-                    #filter ecocode ()
-                    ecolist=eco_p.findall(temp_line)
-                    ecokey=evidencecode+"-"+goref
-                    for ecocode in ecolist:
-                        if not ecokey in mgi_eco_map:
-                            mgi_eco_map[ecokey]={}
-                            mgi_eco_map[ecokey][ecocode]=1
-                        else: mgi_eco_map[ecokey][ecocode]=1
-                        eco_key=ecocode+"-"+goref
-                        if eco_key not in ecoref_ev_map: ecoref_ev_map[eco_key]={}
-                        ecoref_ev_map[eco_key][evidencecode]=1
-                        if ecocode not in eco_evidence_map:eco_evidence_map[ecocode]={}
-                        eco_evidence_map[ecocode][evidencecode]=1
+            for evidencecode,goref,ecocode in loadMgiEco_triples(local_mgi_eco_file):
+                ecokey=evidencecode+"-"+goref
+                if not ecokey in mgi_eco_map: mgi_eco_map[ecokey]={}
+                mgi_eco_map[ecokey][ecocode]=1
+                eco_key=ecocode+"-"+goref
+                if eco_key not in ecoref_ev_map: ecoref_ev_map[eco_key]={}
+                ecoref_ev_map[eco_key][evidencecode]=1
+                if ecocode not in eco_evidence_map:eco_evidence_map[ecocode]={}
+                eco_evidence_map[ecocode][evidencecode]=1
         # now generate Eco.MGI_ECO_MAP from mgi_eco_map
         for ecokey in mgi_eco_map:
             Eco.MGI_ECO_MAP[ecokey]="|".join(mgi_eco_map[ecokey].keys())
@@ -546,25 +754,52 @@ class Eco:
             Eco.ECO_EVIDENCE_MAP[ecocode]="|".join(eco_evidence_map[ecocode].keys()) 
         for ecocode in ecoref_ev_map:
             Eco.ECO_GOREF2EVIDENCE_MAP[ecocode]="|".join(ecoref_ev_map[ecocode].keys())
-        log.write("\n====================\nEco code - evidence code mapping\n")
-        for ecocode in Eco.ECO_EVIDENCE_MAP:
-            log.write(ecocode+"\t"+Eco.ECO_EVIDENCE_MAP[ecocode]+"\n")
-        log.write("\n====================\nEco code - Goref to evidence code mapping\n")
-        for ecocode_key in Eco.ECO_GOREF2EVIDENCE_MAP:
-            log.write(ecocode_key+"\t"+Eco.ECO_GOREF2EVIDENCE_MAP[ecocode_key]+"\n")
+        if log is not None: self.report(log)
 
+    #
+    # Writes the content of the maps to the log - one write per map
+    #
+    def report(self,log):
+        writeMap_section(log,"Eco code - evidence code mapping",Eco.ECO_EVIDENCE_MAP)
+        writeMap_section(log,"Eco code - Goref to evidence code mapping",Eco.ECO_GOREF2EVIDENCE_MAP)
         #print evidence code + GOF_REF => ECO code
-        log.write("\n====================\n")
-        log.write("Gaf Evidence code - GOF_REF => ECO code mapping\n")
-        for key in sorted(Eco.GAF_ECO_MAP.iterkeys()):
-            log.write(key+"\t"+Eco.GAF_ECO_MAP[key]+"\n")
-        log.write("\n====================\n")
-        log.write("Gaf Evidence code - MGI_REF => ECO code mapping\n")
-        for key in sorted(Eco.MGI_ECO_MAP.iterkeys()):
-            log.write(key+"\t"+Eco.MGI_ECO_MAP[key]+"\n") 
-        log.write("\n====================\n")
-        log.write("Current Gaf Evidence codes List\n")
-        for evidencecode in evidence_codes: log.write(evidencecode+"\n")
+        writeMap_section(log,"Gaf Evidence code - GOF_REF => ECO code mapping",Eco.GAF_ECO_MAP,
+                         sorted(Eco.GAF_ECO_MAP.iterkeys()))
+        writeMap_section(log,"Gaf Evidence code - MGI_REF => ECO code mapping",Eco.MGI_ECO_MAP,
+                         sorted(Eco.MGI_ECO_MAP.iterkeys()))
+        log.write("\n====================\nCurrent Gaf Evidence codes List\n"
+                  +"".join([evidencecode+"\n" for evidencecode in evidence_codes]))
+
+    #
+    # Writes the size of the maps to the log
+    #
+    def summary(self,log):
+        log.write("\n====================\nECO maps summary\n")
+        log.write("Eco code - evidence code mapping: %d\nEco code - Goref to evidence code mapping: %d\n"
+                  %(len(Eco.ECO_EVIDENCE_MAP),len(Eco.ECO_GOREF2EVIDENCE_MAP)))
+        log.write("Gaf Evidence code - GOF_REF => ECO code mapping: %d\n"%(len(Eco.GAF_ECO_MAP)))
+        log.write("Gaf Evidence code - MGI_REF => ECO code mapping: %d\n"%(len(Eco.MGI_ECO_MAP)))
+        log.write("Current Gaf Evidence codes: %d\n"%(len(evidence_codes)))
+
+    #
+    # Returns the maps and the evidence codes list as plain containers (see goa_snapshot)
+    #
+    def exportMaps(self):
+        return {"GAF_ECO_MAP":Eco.GAF_ECO_MAP,"ECO_EVIDENCE_MAP":Eco.ECO_EVIDENCE_MAP,
+                "MGI_ECO_MAP":Eco.MGI_ECO_MAP,"ECO_GOREF2EVIDENCE_MAP":Eco.ECO_GOREF2EVIDENCE_MAP,
+                "evidence_codes":evidence_codes}
+
+    #
+    # Reloads the maps from exportMaps() content
+    # The maps are updated in place - the converters keep references to them
+    #
+    def importMaps(self,maps):
+        eco_code_cache.clear()
+        for name in ["GAF_ECO_MAP","ECO_EVIDENCE_MAP","MGI_ECO_MAP","ECO_GOREF2EVIDENCE_MAP"]:
+            eco_map=getattr(Eco,name)
+            eco_map.clear()
+            eco_map.update(maps[name])
+        evidence_codes[:]=maps["evidence_codes"]
           
 
     #
@@ -582,8 +817,20 @@ class Eco:
     # Returns the Eco code in the gaf row given the evidence code and a GO_Ref
     # using the GAF_ECO_MAP: eco code=GAF_ECO_MAP[evidence_code+"-"+goref]
     # using the GAF_ECO_MAP: eco code=GAF_ECO_MAP[evidence_code+"-"+goref]
+    # Resolved codes are cached by the raw inputs and maps used
     #
     def getECO_code(self,goref,evidence_code,goref_collection={},evidence_map={}):
+        cache_key=(goref,evidence_code,id(goref_collection),id(evidence_map))
+        eco_code=eco_code_cache.get(cache_key)
+        if eco_code is None:
+            eco_code=self.resolveECO_code(goref,evidence_code,goref_collection,evidence_map)
+            eco_code_cache.set(cache_key,eco_code)
+        return eco_code
+
+    #
+    # Resolves the Eco code of a given evidence code and GO_Ref (uncached)
+    #
+    def resolveECO_code(self,goref,evidence_code,goref_collection={},evidence_map={}):
         evidence_code=evidence_code.strip()
         #check for invalid evidence codes
         ##if evidence_code not in evidence_codes: return ""
@@ -616,11 +863,24 @@ class Eco:
         #if key in Eco.GAF_ECO_MAP: eco_code=Eco.GAF_ECO_MAP[key]
         if key in evidence_map: eco_code=evidence_map[key]
         else:
+            #unknown evidence code: empty (counted as a bad evidence code by the converters)
             key=evidence_code+"-"+"Default"
-            eco_code=evidence_map[key]
+            eco_code=evidence_map.get(key,"")
 
         return eco_code
 
+    #
+    # Displays the ECO code cache statistics
+    #
+    def reportCache(self,log):
+        lookups=eco_code_cache.hits+eco_code_cache.misses
+        ratio=0.0
+        if lookups: ratio=100.0*eco_code_cache.hits/lookups
+        log.write("\n====================\nECO code cache\n")
+        log.write("Entries: %d (max %d)\nLookups: %d\nHits: %d (%.1f%%)\nMisses: %d\nReloads: %d\n"
+                  %(len(eco_code_cache),eco_code_cache.maxsize,lookups,eco_code_cache.hits,
+                    ratio,eco_code_cache.misses,eco_code_cache.clears))
+
   
 #class goref:
 
@@ -648,13 +908,21 @@ class gaf:
  date_index=-1
  assigned_by_index=-1
  annotation_extension_index=-1
+ gpad_plan=[]
+ gpi_plan=[]
+ gaf_plan=[]
+ required_indexes=[]
 
  ##########################
  # class constructor    ###
  # default version: 2.0 ###
  ##########################
  def _init(self,gaf_version="2.0"):
-     
+     #reset the fields setup of a previous version
+     del self.fields[:]
+     self.fields_index.clear()
+     self.product_form_id_index=-1
+     self.annotation_extension_index=-1
      if "1." in gaf_version:
         for i in range(len(GAF1_FIELDS)):
            self.fields_index[GAF1_FIELDS[i]]=i
@@ -683,6 +951,11 @@ class gaf:
      self.assigned_by_index=self.fields.index('Assigned_By')
      if 'Annotation_Extension' in self.fields:
          self.annotation_extension_index=self.fields.index('Annotation_Extension')
+     plans=getProjection_plans(self.fields)
+     gaf.gpad_plan=plans["gpad"]
+     gaf.gpi_plan=plans["gpi"]
+     gaf.gaf_plan=plans["gaf"]
+     gaf.required_indexes=plans["required"]
 
  #############################################################
  ##
@@ -691,7 +964,7 @@ class gaf:
  #############################################################
  def is_gene_variant(self,gaf_row):
     is_g_variant=0
-    if self.product_form_id_index in range(len(gaf_row)):
+    if 0 <= self.product_form_id_index < len(gaf_row):
        if ":" in gaf_row[self.product_form_id_index]:
            is_g_variant=1
     return is_g_variant
@@ -703,12 +976,10 @@ class gaf:
  #
  def has_missing_fields(self,gaf_row):
     missing= 0
-    for i in range(len(gaf_row)):
-        field=self.fields[i]
-        if field in REQUIRED_GAF_FIELDS:
-           if not gaf_row[i]:
-              missing=i+1
-              break
+    for i in self.required_indexes:
+        if not gaf_row[i]:
+           missing=i+1
+           break
 
     return missing
  #
@@ -718,12 +989,10 @@ class gaf:
  #
  def gpi_has_missing_fields(self,gpi_row):
     missing= 0
-    for i in range(len(gpi_row)):
-        field=GPI_FIELDS[i]
-        if field in REQUIRED_GPI_FIELDS:
-           if not gpi_row[i]:
-              missing=i+1
-              break
+    for i in required_gpi_indexes:
+        if not gpi_row[i]:
+           missing=i+1
+           break
 
     return missing
  #
@@ -733,12 +1002,10 @@ class gaf:
  #
  def gpad_has_missing_fields(self,gpad_row):
     missing= 0
-    for i in range(len(gpad_row)):
-        field=GPAD_FIELDS[i]
-        if field in REQUIRED_GPAD_FIELDS:
-           if not gpad_row[i]:
-              missing=i+1
-              break
+    for i in required_gpad_indexes:
+        if not gpad_row[i]:
+           missing=i+1
+           break
 
     return missing
  #
@@ -775,7 +1042,7 @@ class gaf:
  #   
  def setProtein(self,protein_map,gaf_row):
      total=0;
-     if self.product_form_id_index not in range(len(gaf_row)):
+     if not 0 <= self.product_form_id_index < len(gaf_row):
         return total
      protein=gaf_row[self.product_form_id_index] #GAF - field 17
      if not protein:
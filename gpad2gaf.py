@@ -33,7 +33,7 @@
 '''
  
 import getopt, sys 
-import config,goa_parser 
+import config,goa_parser,goa_io,goa_qc,goa_export,goa_profile
 import os
 from datetime import datetime
 
@@ -43,7 +43,7 @@ from datetime import datetime
 #gpad2gaf usage
 #
 def gpad2gaf_usage():
-    print """\
+    print >>sys.stderr, """\
     \n********************************\ngpad2gaf converts a GPAD and the associated GPI file into a GAF file
     \nAssumptions: ftp://ftp.ebi.ac.uk/pub/databases/GO/goa for specs
         1. The order of the first 17/15 fields of a GAF2.0/GAF1.0 file follows goa specs
@@ -52,17 +52,54 @@ def gpad2gaf_usage():
     \nUsage: 
     Example1: gpad2gaf.py --help  => to display this help page
     Example2: gpad2gaf.py   --gpad=gpad_file --gpi=gpi_file [--gaf=gaf_file] [--version=gaf_version]
+                           [--stream] [--tmpdir=dir] [--maps-log=level] [--offline]
+                           [--compress=codec] [--level=N] [--decompress=mode]
+                           [--qc-level=level] [--qc-samples=N] [--qc-rejects=file] [--qc-summary=file]
+                           [--export=parquet|arrow] [--export-only]
+                           [--profile=file] [--profile-mode=cprofile|sample] [--run-report=file.json]
     Example: gpad2gaf.py   --gpad=path2/gene_association.mgi.gpad 
              --gpi=path2/gene_association.mgi.gpi --gaf=path2/gene_association.mgi.gaf --version=2.0
     Where:
        --gaf      => <optional> specifies the name of the resulting gaf file (default gpad_file.gaf)
+            gaf_file can be - (stdout), a fifo or a file descriptor (/dev/fd/N)
        --version  => <optional> specifies the version of the resulting gaf file (default 2.0)
        --gpad     => <required> specifies the path/name of the input gpad_file
        --gpi      => <required> specifies the path/name of the input gpi_file
+            gzip, bgzip and zstd compressed gpad/gpi files are detected automatically
+            gpad_file or gpi_file can be - (stdin) or a fifo: each file is read once
+       --stream   => <optional> if set, the gpad and gpi files are sorted on disk and merge-joined
+            instead of loading the gpi file in memory (use for very large gpi files)
+       --tmpdir   => <optional> directory for the --stream sort files (default gaf_file directory)
+       --maps-log => <optional> content of log/maps.log: off, summary or full (default %s)
+            summary lists the size of each map, full writes every map entry
+       --offline  => <optional> use the local copies of the dependencies (only missing files are downloaded)
+       --compress => <optional> codec of the gaf file: none, gzip, bgzip or zstd
+            (default: from the gaf file extension .gz/.bgz/.zst)
+       --level    => <optional> compression level of the gaf file (default %d)
+       --decompress => <optional> how compressed gpad/gpi files are decompressed: inline, thread or process
+            thread and process overlap the decompression with the conversion (default %s)
+       --qc-level => <optional> rejected rows written to the log: counts, samples or full (default %s)
+            counts writes none, samples the first --qc-samples rows of each reject category
+       --qc-samples => <optional> number of rejected rows logged per category with --qc-level=samples (default %d)
+       --qc-rejects => <optional> file to write every rejected row to (category<TAB>row)
+       --qc-summary => <optional> file to save the QC summary to: JSON (*.json) or TSV
+       --export => <optional> also write the gaf rows to gaf_file.parquet (parquet) or gaf_file.arrow
+            (arrow IPC) - needs the pyarrow module
+            the rows are sorted on GO_ID, DB_Object_ID and Evidence_Code, the header is kept as metadata
+       --export-only => <optional> with --export, do not write the gaf (TSV) file
+       --profile => <optional> profile the gpad/gpi join loop and save the profile to the given file
+            (the top functions are also listed in log/gpad2gaf.py.log)
+       --profile-mode => <optional> cprofile (pstats file) or sample (stack samples) (default %s)
+       --run-report => <optional> file to save the run report to (JSON): seconds, rows and rows/sec
+            of each stage, counters and peak memory - the stage table is always in log/gpad2gaf.py.log
     \nNote: If you do not provide the name of the gaf file to generate, the program will create 
        a gaf file in the same directory the input gpad file resides with the extension *.gaf
+       (+ the --compress codec extension) - or on stdout when the gpad file is read from stdin
+       Progress messages are written to stderr, e.g.:
+           zcat x.gpad.gz | gpad2gaf.py --gpad=- --gpi=x.gpi.gz | gzip > x.gaf.gz
     \n********************************
-    """ 
+    """%(config.MAPS_LOG_LEVEL,config.OUTPUT_LEVEL,config.DECOMPRESS_MODE,config.QC_LEVEL,config.QC_SAMPLE_CAP,
+         config.PROFILE_MODE)
 #
 # Main
 #
@@ -76,11 +113,14 @@ def main():
     log.write("Program Starts: "+i.strftime('%Y/%m/%d %I:%M:%S %P'))
     log.write("\n")
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hg:p:i:v:", ["help", "gaf=","gpad=","gpi=","version="])
+        opts, args = getopt.getopt(sys.argv[1:], "hg:p:i:v:st:l:oz:", ["help", "gaf=","gpad=","gpi=","version=",
+                                   "stream","tmpdir=","maps-log=","offline","compress=","level=","decompress=",
+                                   "qc-level=","qc-samples=","qc-rejects=","qc-summary=","export=","export-only",
+                                   "profile=","profile-mode=","run-report="])
     except getopt.GetoptError, err:
         # print help information and exit:
         log.write(str(err)) # will print something like "option -a not recognized"
-        print "ERROR:\n"+str(err) 
+        print >>sys.stderr, "ERROR:\n"+str(err) 
         gpad2gaf_usage()
         sys.exit(2)
     #set program arguments
@@ -88,6 +128,22 @@ def main():
     gpad_file=""
     gpi_file=""
     gaf_version="2.0"
+    streaming=False
+    tmp_dir=""
+    maps_log_level=config.MAPS_LOG_LEVEL
+    offline=config.DEPENDS_OFFLINE
+    output_codec=config.OUTPUT_CODEC
+    output_level=config.OUTPUT_LEVEL
+    decompress=config.DECOMPRESS_MODE
+    qc_level=config.QC_LEVEL
+    qc_sample_cap=config.QC_SAMPLE_CAP
+    qc_rejects=""
+    qc_summary=""
+    export_format=""
+    export_only=False
+    profile_file=""
+    profile_mode=config.PROFILE_MODE
+    run_report=""
     for o, a in opts:
         if o in ("-h", "--help"):
             gpad2gaf_usage()
@@ -96,33 +152,107 @@ def main():
         elif o in ("-p", "--gpad"):gpad_file = a
         elif o in ("-i", "--gpi"):gpi_file = a
         elif o in ("-v", "--version"):gaf_version = a
+        elif o in ("-s", "--stream"):streaming = True
+        elif o in ("-t", "--tmpdir"):tmp_dir = a
+        elif o in ("-l", "--maps-log"):
+            if a not in config.MAPS_LOG_LEVELS:
+                print >>sys.stderr, "**********\n\nError: --maps-log must be one of: "+", ".join(config.MAPS_LOG_LEVELS)
+                gpad2gaf_usage()
+                sys.exit(2)
+            maps_log_level = a
+        elif o in ("-o", "--offline"):offline = True
+        elif o in ("-z", "--compress"):
+            if a not in goa_io.CODECS:
+                print >>sys.stderr, "**********\n\nError: --compress must be one of: "+", ".join(goa_io.CODECS)
+                gpad2gaf_usage()
+                sys.exit(2)
+            output_codec = a
+        elif o == "--level":
+            if not a.isdigit():
+                print >>sys.stderr, "**********\n\nError: --level must be a number - See program usage"
+                gpad2gaf_usage()
+                sys.exit(2)
+            output_level = int(a)
+        elif o == "--decompress":
+            if a not in goa_io.DECOMPRESS_MODES:
+                print >>sys.stderr, "**********\n\nError: --decompress must be one of: "+", ".join(goa_io.DECOMPRESS_MODES)
+                gpad2gaf_usage()
+                sys.exit(2)
+            decompress = a
+        elif o == "--qc-level":
+            if a not in goa_qc.QC_LEVELS:
+                print >>sys.stderr, "**********\n\nError: --qc-level must be one of: "+", ".join(goa_qc.QC_LEVELS)
+                gpad2gaf_usage()
+                sys.exit(2)
+            qc_level = a
+        elif o == "--qc-samples":
+            if not a.isdigit():
+                print >>sys.stderr, "**********\n\nError: --qc-samples must be a number - See program usage"
+                gpad2gaf_usage()
+                sys.exit(2)
+            qc_sample_cap = int(a)
+        elif o == "--qc-rejects":qc_rejects = a
+        elif o == "--qc-summary":qc_summary = a
+        elif o == "--export":
+            if a not in goa_export.EXPORT_FORMATS:
+                print >>sys.stderr, "**********\n\nError: --export must be one of: "+", ".join(goa_export.EXPORT_FORMATS)
+                gpad2gaf_usage()
+                sys.exit(2)
+            export_format = a
+        elif o == "--export-only":export_only = True
+        elif o == "--profile":profile_file = a
+        elif o == "--profile-mode":
+            if a not in config.PROFILE_MODES:
+                print >>sys.stderr, "**********\n\nError: --profile-mode must be one of: "+", ".join(config.PROFILE_MODES)
+                gpad2gaf_usage()
+                sys.exit(2)
+            profile_mode = a
+        elif o == "--run-report":run_report = a
         else:
             assert False, "unhandled option"
-    #Check if the gpad file exists
-    if not os.path.isfile(gpad_file):
+    #Check if the gpad file exists (- is stdin)
+    if gpad_file == "-" and gpi_file == "-":
+        print >>sys.stderr, "**********\n\nError: --gpad and --gpi cannot both be read from stdin - See program usage"
+        gpad2gaf_usage()
+        sys.exit(2)
+    if gpad_file != "-" and not os.path.exists(gpad_file):
         log.write("**********\n\nError: The gpad file: "+gpad_file+\
             "  does not exist\nRun gpad2gaf.py --help to  See program usage")
-        print "**********\n\nError: The gpad file: "+gpad_file+\
+        print >>sys.stderr, "**********\n\nError: The gpad file: "+gpad_file+\
             " does not exist\nRun gpad2gaf.py --help to  See program usage"
         gpad2gaf_usage()
         sys.exit() 
-    if not os.path.isfile(gpi_file):
+    if gpi_file != "-" and not os.path.exists(gpi_file):
         log.write("**********\n\nError: The gpi file: "+gpi_file+\
             " does not exist\nRun gpad2gaf.py --help to See program usage")
-        print "**********\n\nError: The gpi file: "+gpi_file+\
+        print >>sys.stderr, "**********\n\nError: The gpi file: "+gpi_file+\
             " does not exist\nRun gpad2gaf.py --help to See program usage"
         gpad2gaf_usage()
         sys.exit()
-    if gaf_file == "":gaf_file=gpad_file+".gaf"
+    if gaf_file == "" and gpad_file == "-":gaf_file="-"
+    if gaf_file == "":gaf_file=goa_io.outputName(gpad_file,".gaf",output_codec)
+    if tmp_dir == "":tmp_dir=goa_io.workDir(gaf_file)
+    if export_format and gaf_file == "-":
+        print >>sys.stderr, "**********\n\nError: --export needs a gaf file (not stdout) - See program usage"
+        gpad2gaf_usage()
+        sys.exit(2)
+    if export_format and goa_export.pyarrow is None:
+        print >>sys.stderr, "**********\n\nError: --export needs the pyarrow module"
+        sys.exit(2)
+    if export_only and not export_format:
+        print >>sys.stderr, "**********\n\nError: --export-only needs --export - See program usage"
+        gpad2gaf_usage()
+        sys.exit(2)
     #Process the gpad
+    goa_profile.newRun("gpad2gaf",profile_file,profile_mode)
     log.write("\nProcessing GPAD file :"+gpad_file+" and GPI file :"+gpi_file);
     log.write("\nInitiating the converter\n")
-    print "\nInitiating the converter\n"
+    print >>sys.stderr, "\nInitiating the converter\n"
     #
     # Create the expected directory structure and
     # downloads dependencies (gaf-eco-map, mrk_list2.rpt) if needed
     #
-    goa_parser.converter_init(log)
+    goa_parser.converter_init(log,maps_log_level,offline)
     #
     #Check if the containers were initiated properly
     #
@@ -135,12 +265,18 @@ def main():
         log.write(message+LOCAL_MGI_GO_ECO_REPORT_FILE+" and "+LOCAL_MAP_FILE+" local files\n")
         sys.exit()
 
-    log_file=log_dir+"/"+os.path.basename(gpad_file)+".log"
+    if gpad_file == "-": log_file=log_dir+"/stdin.log"
+    else: log_file=log_dir+"/"+os.path.basename(gpad_file)+".log"
     gpad_log=open(log_file,"w")
     i = datetime.now()
     log.write("\nProgram Starts: "+i.strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
     gpad_log.write("\nProgram Starts: "+i.strftime('%Y/%m/%d %I:%M:%S %P')+"\n")
-    goa_parser.generateGaf(gaf_file,gpad_file,gpi_file,gpad_log,gaf_version)
+    qc=goa_qc.QcLog(gpad_log,qc_level,qc_sample_cap,qc_rejects,qc_summary)
+    goa_parser.generateGaf(gaf_file,gpad_file,gpi_file,gpad_log,gaf_version,streaming,tmp_dir,
+                           output_codec,output_level,decompress,qc,export_format,export_only)
+    qc.close()
+    goa_profile.run.report(log)
+    goa_profile.run.save(run_report)
     log.close()
     gpad_log.close()
 